@@ -0,0 +1,208 @@
+# 准入控制：异步任务层位于界面处理函数和模型之间，限制并发、按请求类别排优先级、超时取消、繁忙时直接拒绝
+import asyncio
+import itertools
+import os
+import threading
+import time
+
+from batching import BATCH_MAX_SIZE
+from metrics import registry, STAGE_SECONDS
+from streaming import CancelToken
+from worker_pool import WORKER_PROCESSES
+
+# 同时生成的最大请求数，以及其中长请求最多占用的名额
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get(
+    "ADMISSION_MAX_IN_FLIGHT", str(BATCH_MAX_SIZE * 2 * max(1, WORKER_PROCESSES))))
+ADMISSION_MAX_LONG_IN_FLIGHT = int(os.environ.get(
+    "ADMISSION_MAX_LONG_IN_FLIGHT", str(max(1, ADMISSION_MAX_IN_FLIGHT // 2))))
+# 等待队列长度上限和最长排队时间（秒），超出时返回“服务器繁忙”
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "30"))
+# 单个请求从开始生成起的最长时间（秒），超时后停止解码并返回已生成的部分
+REQUEST_TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", "120"))
+# 生成长度超过该值的请求视为长请求
+LONG_REQUEST_TOKENS = int(os.environ.get("LONG_REQUEST_TOKENS", "300"))
+
+# 优先级（数值越小越先执行）：短诗歌 > 短故事 > 长请求
+_PRIORITIES = {"poem": 0, "story": 1}
+_LONG_PRIORITY = 2
+
+ADMISSION_EVENTS = registry.counter(
+    "admission_events_total", "准入控制事件数（admitted / rejected / deadline / disconnected）",
+    ("kind", "event"))
+
+_DONE = object()
+
+
+class ServerBusyError(Exception):
+    """等待队列已满或排队超时"""
+
+
+def request_class(kind, max_length):
+    """返回 (优先级, 是否长请求)"""
+    long = int(max_length) > LONG_REQUEST_TOKENS
+    return (_LONG_PRIORITY if long else _PRIORITIES.get(kind, 1)), long
+
+
+class _Waiter:
+    def __init__(self, priority, seq, long, loop):
+        self.priority = priority
+        self.seq = seq
+        self.long = long
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+
+
+class AdmissionController:
+    """按优先级分配生成名额；队列满或排队超时抛出 ServerBusyError"""
+
+    def __init__(self, max_in_flight=ADMISSION_MAX_IN_FLIGHT, max_long_in_flight=ADMISSION_MAX_LONG_IN_FLIGHT,
+                 max_queue=ADMISSION_MAX_QUEUE, queue_timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_long_in_flight = max(1, min(max_long_in_flight, self.max_in_flight))
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._waiters = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.long_in_flight = 0
+
+    def _can_run(self, long):
+        if self.in_flight >= self.max_in_flight:
+            return False
+        return not long or self.long_in_flight < self.max_long_in_flight
+
+    def _grant(self, long):
+        self.in_flight += 1
+        if long:
+            self.long_in_flight += 1
+
+    def _dispatch(self):
+        # 按优先级唤醒等待者；长请求名额用完时跳过长请求，让后面的短请求先执行
+        for waiter in list(self._waiters):
+            if self.in_flight >= self.max_in_flight:
+                break
+            if self._can_run(waiter.long):
+                self._waiters.remove(waiter)
+                self._grant(waiter.long)
+                waiter.granted = True
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+
+    async def acquire(self, priority, long=False):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            waiter = _Waiter(priority, next(self._seq), long, loop)
+            self._waiters.append(waiter)
+            self._waiters.sort(key=lambda w: (w.priority, w.seq))
+            self._dispatch()
+            if waiter.granted:
+                return
+            if len(self._waiters) > self.max_queue:
+                self._waiters.remove(waiter)
+                raise ServerBusyError("服务器繁忙，请稍后再试")
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if waiter.granted:
+                    # 超时的同时刚好分到了名额：超时则照常执行，被取消则归还名额
+                    if isinstance(e, asyncio.CancelledError):
+                        self._release_locked(long)
+                        raise
+                    return
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise ServerBusyError(f"服务器繁忙，排队超过 {self.queue_timeout:.0f} 秒，请稍后再试")
+
+    def _release_locked(self, long):
+        self.in_flight -= 1
+        if long:
+            self.long_in_flight -= 1
+        self._dispatch()
+
+    def release(self, long=False):
+        with self._lock:
+            self._release_locked(long)
+
+    def queued(self):
+        return len(self._waiters)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+async def admitted_stream(kind, max_length, stream_fn, *args):
+    """经过准入控制后在后台线程中运行同步的流式生成函数，逐步返回文本
+
+    stream_fn 需要接受 cancel 参数；超时或客户端断开时通过它停止解码。
+    队列已满或排队超时抛出 ServerBusyError。
+    """
+    controller = get_admission_controller()
+    priority, long = request_class(kind, max_length)
+    wait_start = time.perf_counter()
+    try:
+        await controller.acquire(priority, long)
+    except ServerBusyError:
+        ADMISSION_EVENTS.inc(kind, "rejected")
+        raise
+    ADMISSION_EVENTS.inc(kind, "admitted")
+    STAGE_SECONDS.observe(time.perf_counter() - wait_start, kind, "admission_wait")
+
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+    cancel = CancelToken()
+
+    def produce():
+        try:
+            for item in stream_fn(*args, cancel=cancel):
+                loop.call_soon_threadsafe(items.put_nowait, item)
+        finally:
+            loop.call_soon_threadsafe(items.put_nowait, _DONE)
+
+    threading.Thread(target=produce, name=f"{kind}-stream", daemon=True).start()
+    deadline = loop.time() + REQUEST_TIMEOUT
+    text = ""
+    finished = timed_out = False
+    try:
+        while True:
+            if timed_out:
+                item = await items.get()
+            else:
+                try:
+                    item = await asyncio.wait_for(items.get(), max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    # 超时：通知批处理调度器停止解码，生成函数随后会返回已生成的部分
+                    timed_out = True
+                    cancel.cancel()
+                    ADMISSION_EVENTS.inc(kind, "deadline")
+                    continue
+            if item is _DONE:
+                break
+            text = item
+            yield text
+        finished = True
+        if timed_out:
+            yield f"{text}\n\n（生成超时，已在 {REQUEST_TIMEOUT:.0f} 秒后停止）"
+    finally:
+        if not finished:
+            ADMISSION_EVENTS.inc(kind, "disconnected")
+        # 客户端断开连接时同样停止解码，并立即归还名额
+        cancel.cancel()
+        controller.release(long)
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller():
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController()
+        return _controller
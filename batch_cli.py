@@ -0,0 +1,194 @@
+# 命令行批量生成：从CSV或JSONL读取关键词，离线生成故事/诗歌并逐条写入输出JSONL，支持断点续跑
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from batching import BATCH_MAX_SIZE
+from model_manager import model_manager
+from semantic_cache import is_work
+from worker_pool import WORKER_PROCESSES
+
+# 每隔多少秒输出一次进度
+PROGRESS_INTERVAL = 5.0
+
+STORY_TYPES = ("故事", "story")
+POEM_TYPES = ("诗歌", "poem")
+
+
+def read_rows(path):
+    """读取CSV（需表头）或JSONL文件，返回行字典列表；没有 id 列时使用行号作为 id"""
+    rows = []
+    if path.endswith(".csv"):
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            rows = [dict(row) for row in csv.DictReader(f)]
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    rows.append(json.loads(line))
+    for index, row in enumerate(rows, 1):
+        if not row.get("id"):
+            row["id"] = str(index)
+        row["id"] = str(row["id"])
+    return rows
+
+
+def load_done_ids(path):
+    """读取已有输出文件中完成的 id（用于断点续跑），忽略最后一行写到一半的记录和失败的记录"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            # 旧版本把以文本返回的错误（如“模型仍在加载中”）当作结果写入，这些行需要重新生成
+            if "error" not in record and is_work(record.get("content")):
+                done.add(str(record["id"]))
+    return done
+
+
+def ends_mid_line(path):
+    """输出文件的最后一行是否写到一半（没有以换行结尾），续跑时要先补上换行再追加"""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return False
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+def row_kind(row):
+    """判断生成类型：显式的 type 列优先，否则有 style 没有 genre 的行视为诗歌"""
+    kind = (row.get("type") or "").strip().lower()
+    if kind in STORY_TYPES:
+        return "故事"
+    if kind in POEM_TYPES:
+        return "诗歌"
+    if kind:
+        raise ValueError(f"未知的生成类型: {row['type']}")
+    return "诗歌" if row.get("style") and not row.get("genre") else "故事"
+
+
+def count_tokens(tokenizer, text):
+    if tokenizer is None:
+        # 多进程模式下界面进程没有分词器，按非空白字符数估算（中文模型基本按字切分）
+        return sum(1 for c in text if not c.isspace())
+    return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+
+def generate_row(row, generate_story, generate_poem):
+    kind = row_kind(row)
+    keywords = row.get("keywords", "")
+    record = {"id": row["id"], "type": kind, "keywords": keywords}
+    usage = {}
+    start = time.perf_counter()
+    if kind == "故事":
+        record["genre"] = row.get("genre") or "奇幻"
+        record["max_length"] = int(row.get("max_length") or 200)
+        record["temperature"] = float(row.get("temperature") or 0.7)
+        content = generate_story(keywords, record["genre"], record["max_length"], record["temperature"],
+                                 usage=usage)
+    else:
+        record["style"] = row.get("style") or "现代诗"
+        record["lines"] = int(row.get("lines") or 12)
+        record["temperature"] = float(row.get("temperature") or 0.8)
+        content = generate_poem(keywords, record["style"], record["lines"], record["temperature"], usage=usage)
+    # 生成函数以文本形式返回错误（生成出错、模型未就绪、关键词不支持），按失败处理
+    if not is_work(content):
+        raise RuntimeError(content or "生成结果为空")
+    record["content"] = content
+    # 生成时统计的token数；命中结果缓存时没有统计，之后按文本重新计算
+    if usage:
+        record["prompt_tokens"] = usage["prompt_tokens"]
+        record["tokens"] = usage["generated_tokens"]
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def run(input_path, output_path, generate_story, generate_poem, concurrency, resume=True):
+    """批量生成主流程，返回 (完成行数, 失败行数)"""
+    rows = read_rows(input_path)
+    done = load_done_ids(output_path) if resume else set()
+    pending = [row for row in rows if row["id"] not in done]
+    print(f"共 {len(rows)} 行，已完成 {len(rows) - len(pending)} 行，本次生成 {len(pending)} 行")
+    if not pending:
+        return 0, 0
+
+    generator = model_manager.get_generator()
+    tokenizer = getattr(generator, "tokenizer", None)
+
+    finished = failed = tokens = 0
+    start = last_report = time.perf_counter()
+
+    def report():
+        elapsed = time.perf_counter() - start
+        print(f"进度 {finished + failed}/{len(pending)}（失败 {failed}），"
+              f"{finished / elapsed:.2f} 行/秒，{tokens / elapsed:.1f} tokens/秒")
+
+    # 同时保持 concurrency 个请求在运行，让批处理调度器把它们合并计算
+    mode = 'a' if resume else 'w'
+    broken_tail = resume and ends_mid_line(output_path)
+    with open(output_path, mode, encoding='utf-8') as out, \
+            ThreadPoolExecutor(max_workers=concurrency) as executor:
+        if broken_tail:
+            # 上次中断时最后一行写到一半，另起一行，避免新记录接在残缺的行后面
+            out.write("\n")
+        rows_iter = iter(pending)
+        running = {}
+        while True:
+            while len(running) < concurrency:
+                row = next(rows_iter, None)
+                if row is None:
+                    break
+                future = executor.submit(generate_row, row, generate_story, generate_poem)
+                running[future] = row
+            if not running:
+                break
+            completed, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in completed:
+                row = running.pop(future)
+                try:
+                    record = future.result()
+                    if "tokens" not in record:
+                        record["tokens"] = count_tokens(tokenizer, record["content"])
+                    tokens += record["tokens"]
+                    finished += 1
+                except Exception as e:
+                    record = {"id": row["id"], "error": str(e)}
+                    failed += 1
+                # 每完成一行立即写入并刷新，中断后可以从输出文件续跑
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+            if time.perf_counter() - last_report >= PROGRESS_INTERVAL:
+                report()
+                last_report = time.perf_counter()
+    report()
+    return finished, failed
+
+
+def main(argv=None, generate_story=None, generate_poem=None):
+    parser = argparse.ArgumentParser(description="批量生成故事/诗歌（不启动界面）")
+    parser.add_argument("--input", required=True, help="关键词文件（.csv 或 .jsonl），列：id,type,keywords,genre,style,max_length,lines,temperature")
+    parser.add_argument("--output", required=True, help="输出的JSONL文件")
+    parser.add_argument("--concurrency", type=int, default=BATCH_MAX_SIZE * max(1, WORKER_PROCESSES),
+                        help="同时进行的生成请求数")
+    parser.add_argument("--no-resume", action="store_true", help="忽略已有输出，从头生成")
+    args = parser.parse_args(argv)
+
+    if generate_story is None or generate_poem is None:
+        from story_generator import generate_story, generate_poem
+    finished, failed = run(args.input, args.output, generate_story, generate_poem,
+                           max(1, args.concurrency), resume=not args.no_resume)
+    print(f"批量生成结束：成功 {finished} 行，失败 {failed} 行，结果保存在 {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,561 @@
+# 动态微批处理：把短时间窗口内到达的生成请求合并成一次批量前向计算
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from postprocess import detokenize
+from prefix_cache import PREFIX_CACHE_ENABLED, PrefixCache, cache_to_layers, layers_to_cache, merge_layers
+from quality_guard import QUALITY_GUARD_ENABLED, QualityMonitor
+from speculative import load_speculative_decoder
+from streaming import TokenStreamer
+
+# 单个批次的最大请求数和收集请求的等待窗口（毫秒）
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "8"))
+BATCH_WAIT_MS = float(os.environ.get("BATCH_WAIT_MS", "20"))
+
+
+class GenerationRequest:
+    """一个待生成的请求，带有独立的采样参数"""
+
+    def __init__(self, prompt, max_new_tokens=100, temperature=1.0, top_p=1.0,
+                 repetition_penalty=1.0, no_repeat_ngram_size=0, do_sample=True, streamer=None,
+                 prefix=None, cancel=None, stop_chars="", max_lines=0, stop_after_tokens=0, score=False,
+                 guard=QUALITY_GUARD_ENABLED):
+        self.prompt = prompt
+        # prompt 开头的固定模板部分，可以复用前缀KV缓存
+        self.prefix = prefix
+        self.max_new_tokens = int(max_new_tokens)
+        self.temperature = float(temperature)
+        self.top_p = float(top_p)
+        self.repetition_penalty = float(repetition_penalty)
+        self.no_repeat_ngram_size = int(no_repeat_ngram_size or 0)
+        self.do_sample = do_sample
+        self.streamer = streamer
+        # CancelToken，被取消的请求在下一步解码前移出批次
+        self.cancel = cancel
+        # 提前结束条件：stop_chars 中的字符视为行尾/句末；生成满 max_lines 行，
+        # 或生成 stop_after_tokens 个token之后遇到句末时结束
+        self.stop_chars = stop_chars
+        self.max_lines = int(max_lines or 0)
+        self.stop_after_tokens = int(stop_after_tokens or 0)
+        self.stop_ids = frozenset()
+        self.lines_done = 0
+        self._at_line_end = True
+        # 退化检测：guard 为 True 时在编码prompt后创建 QualityMonitor
+        self.guard = bool(guard)
+        self.monitor = None
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+        self.first_token_at = None
+        # 由批处理过程填充
+        self.prompt_ids = []
+        self.output_ids = []
+        # 各阶段耗时（秒）：queue_wait / tokenize / prefill / decode
+        self.timings = {}
+        # score 为 True 时累计模型对已生成token的对数概率（用于多候选重排序）；
+        # 推测解码不记录概率，这类请求始终使用普通解码
+        self.score = bool(score)
+        self.logprob = 0.0
+        # 推测解码接受率过低回退后不再使用
+        self.speculation_disabled = self.score
+
+    def cancelled(self):
+        return self.cancel is not None and self.cancel.cancelled
+
+    def reached_stop(self, token):
+        """在追加 token 之后调用，判断是否满足提前结束条件（连续的行尾标点只算一行）"""
+        if token not in self.stop_ids:
+            self._at_line_end = False
+            return False
+        if not self._at_line_end:
+            self.lines_done += 1
+        self._at_line_end = True
+        if self.max_lines and self.lines_done >= self.max_lines:
+            return True
+        return bool(self.stop_after_tokens) and len(self.output_ids) >= self.stop_after_tokens
+
+    def degenerated(self, token):
+        """在追加 token 之后调用，退化检测判断应提前结束时返回 True（纠偏时继续生成）"""
+        return self.monitor is not None and self.monitor.observe(token) == "abort"
+
+
+def _eos_token_id(tokenizer):
+    # 中文GPT2使用BERT分词器，没有eos，使用[SEP]作为结束符
+    if tokenizer.eos_token_id is not None:
+        return tokenizer.eos_token_id
+    return tokenizer.sep_token_id
+
+
+def _pad_token_id(tokenizer):
+    if tokenizer.pad_token_id is not None:
+        return tokenizer.pad_token_id
+    eos_id = _eos_token_id(tokenizer)
+    return eos_id if eos_id is not None else 0
+
+
+def _max_positions(model):
+    config = model.config
+    return getattr(config, "n_positions", None) or getattr(config, "max_position_embeddings", 1024)
+
+
+def _banned_ngram_tokens(tokens, ngram_size):
+    """返回会造成重复n-gram的候选token（与transformers的no_repeat_ngram_size一致）"""
+    if ngram_size <= 0 or len(tokens) + 1 < ngram_size:
+        return []
+    prefix = tuple(tokens[len(tokens) - ngram_size + 1:])
+    banned = []
+    for start in range(len(tokens) - ngram_size + 1):
+        if tuple(tokens[start:start + ngram_size - 1]) == prefix:
+            banned.append(tokens[start + ngram_size - 1])
+    return banned
+
+
+def _select_rows(past, index):
+    """从KV缓存中只保留仍在生成的行"""
+    if hasattr(past, "batch_select_indices"):
+        past.batch_select_indices(index)
+        return past
+    return tuple(tuple(t.index_select(0, index) for t in layer) for layer in past)
+
+
+def penalize_logits(logits, requests, seq_ids, seq_mask, histories=None):
+    """按每个请求的参数施加重复惩罚并禁止重复的n-gram
+
+    histories 为每行已有的token列表，默认使用请求的 prompt_ids + output_ids。
+    """
+    import torch
+
+    device = logits.device
+    penalty = torch.tensor([[r.repetition_penalty] for r in requests], device=device)
+
+    # 重复惩罚：填充位置用最后一个真实token代替，避免惩罚填充符
+    ids = torch.where(seq_mask.bool(), seq_ids, seq_ids[:, -1:])
+    score = torch.gather(logits, 1, ids)
+    score = torch.where(score < 0, score * penalty, score / penalty)
+    logits = logits.scatter(1, ids, score)
+
+    # 禁止重复的n-gram
+    for row, request in enumerate(requests):
+        history = histories[row] if histories is not None else request.prompt_ids + request.output_ids
+        banned = _banned_ngram_tokens(history, request.no_repeat_ngram_size)
+        if banned:
+            logits[row, banned] = -float("inf")
+        # 退化检测纠偏后禁止数字和列表符号
+        if request.monitor is not None and request.monitor.banned_ids:
+            logits[row, list(request.monitor.banned_ids)] = -float("inf")
+    return logits
+
+
+def warp_logits(logits, requests):
+    """温度缩放和top-p（nucleus）过滤，返回可直接softmax采样的logits"""
+    import torch
+
+    device = logits.device
+    temperature = torch.tensor([[max(r.temperature, 1e-5)] for r in requests], device=device)
+    top_p = torch.tensor([[r.top_p] for r in requests], device=device)
+    logits = logits / temperature
+    sorted_logits, sorted_index = torch.sort(logits, descending=False)
+    cumulative = sorted_logits.softmax(dim=-1).cumsum(dim=-1)
+    sorted_remove = cumulative <= (1 - top_p)
+    sorted_remove[:, -1] = False
+    remove = sorted_remove.scatter(1, sorted_index, sorted_remove)
+    return logits.masked_fill(remove, -float("inf"))
+
+
+def sample_next_tokens(logits, requests, seq_ids, seq_mask):
+    """按每个请求自己的参数处理logits并采样下一个token"""
+    import torch
+
+    device = logits.device
+    logits = penalize_logits(logits, requests, seq_ids, seq_mask)
+    greedy = logits.argmax(dim=-1)
+    sampled = torch.multinomial(warp_logits(logits, requests).softmax(dim=-1), num_samples=1).squeeze(1)
+
+    do_sample = torch.tensor([r.do_sample for r in requests], device=device)
+    return torch.where(do_sample, sampled, greedy)
+
+
+def append_token(request, token):
+    """记录一个新生成的token并推送给流式输出"""
+    if request.first_token_at is None:
+        request.first_token_at = time.perf_counter()
+    request.output_ids.append(token)
+    if request.streamer is not None:
+        request.streamer.put(token)
+
+
+_stop_ids_cache = {}
+
+
+def _stop_token_ids(tokenizer, chars):
+    """把行尾字符转换为token id（只处理词表中作为单独token存在的字符）"""
+    key = (id(tokenizer), chars)
+    ids = _stop_ids_cache.get(key)
+    if ids is None:
+        ids = set()
+        for char in chars:
+            token_id = tokenizer.convert_tokens_to_ids(char)
+            if token_id is not None and token_id != tokenizer.unk_token_id:
+                ids.add(token_id)
+        ids = _stop_ids_cache[key] = frozenset(ids)
+    return ids
+
+
+def _left_pad(rows, pad_id, device):
+    """左侧填充token序列，使所有请求的最后一个token对齐，返回 (input_ids, attention_mask)"""
+    import torch
+
+    max_len = max(len(ids) for ids in rows)
+    input_ids = torch.full((len(rows), max_len), pad_id, dtype=torch.long, device=device)
+    attention_mask = torch.zeros((len(rows), max_len), dtype=torch.long, device=device)
+    for row, ids in enumerate(rows):
+        input_ids[row, max_len - len(ids):] = torch.tensor(ids, dtype=torch.long, device=device)
+        attention_mask[row, max_len - len(ids):] = 1
+    return input_ids, attention_mask
+
+
+def _encode(tokenizer, request, max_positions, prefix_cache):
+    """编码prompt，超出上下文长度时保留末尾部分；命中前缀缓存时返回 (前缀KV层, 前缀长度)"""
+    request.max_new_tokens = max(1, min(request.max_new_tokens, max_positions - 1))
+    request.output_ids = []
+    if request.stop_chars:
+        request.stop_ids = _stop_token_ids(tokenizer, request.stop_chars)
+    budget = max_positions - request.max_new_tokens
+    if prefix_cache is not None and request.prefix and request.prompt.startswith(request.prefix):
+        prefix_ids, layers = prefix_cache.get(request.prefix)
+        suffix = request.prompt[len(request.prefix):]
+        suffix_ids = tokenizer(suffix, add_special_tokens=False)["input_ids"]
+        if suffix_ids and len(prefix_ids) + len(suffix_ids) <= budget:
+            request.prompt_ids = prefix_ids + suffix_ids
+            return layers, len(prefix_ids)
+    ids = tokenizer(request.prompt, add_special_tokens=False)["input_ids"]
+    request.prompt_ids = ids[-budget:]
+    return None, 0
+
+
+def _prefill(model, requests, encoded, pad_id):
+    """预填充：相同前缀的请求一起计算，命中前缀缓存时只编码前缀之后的部分，相同的prompt只计算一次
+
+    返回重新排序后的 (请求列表, 最后位置logits, KV缓存, attention_mask, position_ids)。
+    """
+    import torch
+
+    device = model.device
+    groups = OrderedDict()
+    for request, (layers, prefix_len) in zip(requests, encoded):
+        key = request.prefix if layers is not None else None
+        groups.setdefault(key, []).append((request, layers, prefix_len))
+
+    ordered, logits, parts, positions = [], [], [], []
+    for members in groups.values():
+        group = [request for request, _, _ in members]
+        _, layers, prefix_len = members[0]
+        # prompt完全相同的请求（如多候选的 n 个样本）只预填充一行，之后再展开成各自的行
+        rows, unique = [], {}
+        for request in group:
+            rows.append(unique.setdefault(tuple(request.prompt_ids), len(unique)))
+        input_ids, suffix_mask = _left_pad([list(ids[prefix_len:]) for ids in unique], pad_id, device)
+        position_ids = prefix_len + (suffix_mask.cumsum(-1) - 1).clamp(min=0)
+        if layers is None:
+            past, attention_mask = None, suffix_mask
+        else:
+            # 同一前缀的KV缓存在批次维度上共享（expand 不复制数据）
+            size = len(unique)
+            past = layers_to_cache([(k.expand(size, -1, -1, -1), v.expand(size, -1, -1, -1)) for k, v in layers])
+            prefix_mask = torch.ones((size, prefix_len), dtype=torch.long, device=device)
+            attention_mask = torch.cat([prefix_mask, suffix_mask], dim=1)
+        outputs = model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=past,
+            use_cache=True
+        )
+        past, last_logits = outputs.past_key_values, outputs.logits[:, -1, :]
+        if len(unique) < len(group):
+            index = torch.tensor(rows, device=device)
+            past = _select_rows(past, index)
+            last_logits = last_logits.index_select(0, index)
+            attention_mask = attention_mask.index_select(0, index)
+            position_ids = position_ids.index_select(0, index)
+        ordered += group
+        logits.append(last_logits)
+        parts.append((past, attention_mask))
+        positions.append(position_ids[:, -1:])
+
+    if len(parts) == 1:
+        past, attention_mask = parts[0]
+    else:
+        # 不同前缀的分组左侧补零对齐后合并为一个批次
+        merged, attention_mask = merge_layers([(cache_to_layers(p), mask) for p, mask in parts])
+        past = layers_to_cache(merged)
+    return ordered, torch.cat(logits), past, attention_mask, torch.cat(positions)
+
+
+def run_batch(model, tokenizer, requests, on_finish=None, prefix_cache=None, speculative=None):
+    """对一批请求执行一次批量生成，结果写入每个请求的 output_ids
+
+    每个请求生成结束时立即调用 on_finish(request)，不必等待整个批次完成。
+    批次中只剩一个长请求时，如果提供了 speculative（SpeculativeDecoder）则改用推测解码。
+    """
+    import torch
+
+    device = model.device
+    eos_id = _eos_token_id(tokenizer)
+    pad_id = _pad_token_id(tokenizer)
+    max_positions = _max_positions(model)
+
+    batch_start = time.perf_counter()
+    encoded = []
+    for request in requests:
+        request.timings["queue_wait"] = batch_start - request.enqueued_at
+        start = time.perf_counter()
+        encoded.append(_encode(tokenizer, request, max_positions, prefix_cache))
+        request.monitor = QualityMonitor(tokenizer, request.prompt_ids) if request.guard else None
+        request.timings["tokenize"] = time.perf_counter() - start
+    with torch.inference_mode():
+        prefill_start = time.perf_counter()
+        active, logits, past, attention_mask, position_ids = _prefill(model, requests, encoded, pad_id)
+        prefill_end = time.perf_counter()
+        for request in active:
+            request.timings["prefill"] = prefill_end - prefill_start
+        seq_ids, seq_mask = _left_pad([r.prompt_ids for r in active], pad_id, device)
+        while True:
+            if speculative is not None and len(active) == 1 and speculative.eligible(active[0]):
+                request = active[0]
+                state = speculative.decode(model, request, past, attention_mask, position_ids, logits, eos_id)
+                if state is None:
+                    request.timings["decode"] = time.perf_counter() - prefill_end
+                    if on_finish is not None:
+                        on_finish(request)
+                    break
+                # 接受率过低，回退到普通解码继续生成
+                past, attention_mask, position_ids, logits = state
+                seq_ids, seq_mask = _left_pad([request.prompt_ids + request.output_ids], pad_id, device)
+            next_tokens = sample_next_tokens(logits.float(), active, seq_ids, seq_mask)
+            logprobs = None
+            if any(request.score for request in active):
+                logprobs = logits.float().log_softmax(dim=-1).gather(1, next_tokens.unsqueeze(1)).squeeze(1)
+
+            keep = []
+            for row, request in enumerate(active):
+                token = int(next_tokens[row])
+                # 已取消的请求（超时或客户端断开）不再继续解码
+                if token != eos_id and not request.cancelled():
+                    if request.score:
+                        request.logprob += float(logprobs[row])
+                    append_token(request, token)
+                    if (len(request.output_ids) < request.max_new_tokens and not request.reached_stop(token)
+                            and not request.degenerated(token)):
+                        keep.append(row)
+                        continue
+                request.timings["decode"] = time.perf_counter() - prefill_end
+                if on_finish is not None:
+                    on_finish(request)
+            if not keep:
+                break
+
+            # 已完成的请求移出批次，后续步骤只计算仍在生成的行
+            if len(keep) < len(active):
+                index = torch.tensor(keep, device=device)
+                past = _select_rows(past, index)
+                next_tokens = next_tokens.index_select(0, index)
+                attention_mask = attention_mask.index_select(0, index)
+                position_ids = position_ids.index_select(0, index)
+                seq_ids = seq_ids.index_select(0, index)
+                seq_mask = seq_mask.index_select(0, index)
+                active = [active[row] for row in keep]
+
+            input_ids = next_tokens.unsqueeze(1)
+            attention_mask = torch.cat([attention_mask, torch.ones_like(input_ids)], dim=1)
+            position_ids = position_ids + 1
+            seq_ids = torch.cat([seq_ids, input_ids], dim=1)
+            seq_mask = torch.cat([seq_mask, torch.ones_like(input_ids)], dim=1)
+
+            outputs = model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                position_ids=position_ids,
+                past_key_values=past,
+                use_cache=True
+            )
+            past = outputs.past_key_values
+            logits = outputs.logits[:, -1, :]
+
+
+def _generated_text(tokenizer, request):
+    # 只解码新生成的token，不重新解码prompt，也不在全文中查找prompt
+    return detokenize(tokenizer, request.output_ids)
+
+
+class BatchScheduler:
+    """位于 text-generation pipeline 前面的批处理调度器，调用方式与 pipeline 相同"""
+
+    def __init__(self, generator, max_batch_size=BATCH_MAX_SIZE, wait_ms=BATCH_WAIT_MS):
+        self.generator = generator
+        # 使用所选推理后端的模型（int8量化或ONNX Runtime），默认为 pipeline 中的模型
+        self.model = getattr(generator, "inference_model", generator.model)
+        self.tokenizer = generator.tokenizer
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.wait_seconds = max(0.0, wait_ms) / 1000
+        self.prefix_cache = PrefixCache(self.model, self.tokenizer) if PREFIX_CACHE_ENABLED else None
+        self.speculative = load_speculative_decoder(self.model)
+        self._queue = queue.Queue()
+        # 上一个批次放不下、留到下一个批次的一组请求
+        self._pending = None
+        self.stats = {
+            "batches": 0,
+            "requests": 0,
+            "max_batch_size_seen": 0,
+            "ttft_avg_seconds": 0.0,
+            "ttft_max_seconds": 0.0,
+            "cancelled": 0,
+            "early_stops": 0,
+            "tokens_saved": 0,
+            "degenerate_resteers": 0,
+            "degenerate_aborts": 0,
+            "degenerate_tokens_saved": 0,
+        }
+        if self.speculative is not None:
+            # 推测解码的接受率、回退次数和估算加速比
+            self.stats["speculative"] = self.speculative.stats
+        self._ttft_count = 0
+        self._thread = threading.Thread(target=self._worker, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt, **params):
+        """提交一个生成请求，返回 Future，结果为新生成的文本（不含prompt）"""
+        request = GenerationRequest(prompt, **params)
+        self._queue.put([request])
+        return request.future
+
+    def submit_many(self, prompt, n, streamers=None, **params):
+        """同一prompt的 n 个请求作为一组提交，返回 n 个 Future
+
+        一组请求总是放进同一个批次（n 超过批次上限时单独组成一个批次），prompt只预填充一次。
+        """
+        streamers = streamers or [None] * n
+        requests = [GenerationRequest(prompt, streamer=streamer, **params) for streamer in streamers]
+        self._queue.put(requests)
+        return [request.future for request in requests]
+
+    def stream(self, prompt, **params):
+        """提交一个流式生成请求，返回可迭代增量文本的 TokenStreamer"""
+        streamer = TokenStreamer(self.tokenizer)
+        self.submit(prompt, streamer=streamer, **params)
+        return streamer
+
+    def stream_many(self, prompt, n, **params):
+        """同一prompt的 n 个流式请求，在同一个批次中共用一次预填充并行生成"""
+        streamers = [TokenStreamer(self.tokenizer) for _ in range(n)]
+        self.submit_many(prompt, n, streamers=streamers, **params)
+        return streamers
+
+    def __call__(self, prompt, max_new_tokens=100, temperature=1.0, top_p=1.0,
+                 repetition_penalty=1.0, no_repeat_ngram_size=0, do_sample=True,
+                 num_return_sequences=1, return_full_text=True, **ignored):
+        """兼容 pipeline 的调用方式，返回 [{"generated_text": ...}]
+
+        与 pipeline 相同，return_full_text 为 True 时在新生成的文本前拼接原始prompt。
+        """
+        futures = self.submit_many(
+            prompt,
+            num_return_sequences,
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            repetition_penalty=repetition_penalty,
+            no_repeat_ngram_size=no_repeat_ngram_size,
+            do_sample=do_sample
+        )
+        prefix = prompt if return_full_text else ""
+        return [{"generated_text": prefix + future.result()} for future in futures]
+
+    def _collect(self):
+        # 阻塞等待第一组请求，然后在等待窗口内尽量凑满一个批次；队列中的每一项是一组请求，
+        # 放不下的一组留到下一个批次，不拆开
+        batch = self._pending or self._queue.get()
+        self._pending = None
+        deadline = time.perf_counter() + self.wait_seconds
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                group = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if len(batch) + len(group) > self.max_batch_size:
+                self._pending = group
+                break
+            batch = batch + group
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._collect()
+            # 排队期间已被取消的请求直接结束，不参与计算
+            for request in batch:
+                if request.cancelled():
+                    self.stats["cancelled"] += 1
+                    self._finish(request)
+            batch = [request for request in batch if not request.future.done()]
+            if not batch:
+                continue
+            self.stats["batches"] += 1
+            self.stats["requests"] += len(batch)
+            self.stats["max_batch_size_seen"] = max(self.stats["max_batch_size_seen"], len(batch))
+            try:
+                run_batch(self.model, self.tokenizer, batch, on_finish=self._finish,
+                          prefix_cache=self.prefix_cache, speculative=self.speculative)
+            except Exception as e:
+                for request in batch:
+                    if request.future.done():
+                        continue
+                    request.future.set_exception(e)
+                    if request.streamer is not None:
+                        request.streamer.fail(e)
+
+    def _finish(self, request):
+        # 按行数/句末提前结束时，统计节省的解码步数
+        saved = request.max_new_tokens - len(request.output_ids)
+        monitor = request.monitor
+        if monitor is not None and monitor.resteered:
+            self.stats["degenerate_resteers"] += 1
+        if monitor is not None and monitor.aborted:
+            # 退化生成提前结束
+            self.stats["degenerate_aborts"] += 1
+            self.stats["degenerate_tokens_saved"] += saved
+        elif saved > 0 and request.output_ids and request.output_ids[-1] in request.stop_ids:
+            self.stats["early_stops"] += 1
+            self.stats["tokens_saved"] += saved
+        # 记录首个token耗时（排队等待 + 预填充）
+        if request.first_token_at is not None:
+            ttft = request.first_token_at - request.enqueued_at
+            self._ttft_count += 1
+            self.stats["ttft_avg_seconds"] += (ttft - self.stats["ttft_avg_seconds"]) / self._ttft_count
+            self.stats["ttft_max_seconds"] = max(self.stats["ttft_max_seconds"], ttft)
+        if request.streamer is not None:
+            request.streamer.timings = request.timings
+            request.streamer.prompt_tokens = len(request.prompt_ids)
+            request.streamer.logprob = request.logprob
+            request.streamer.quality = monitor.summary(saved) if monitor is not None else None
+            request.streamer.end()
+        request.future.set_result(_generated_text(self.tokenizer, request))
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(generator):
+    """返回与生成器绑定的全局批处理调度器"""
+    with _schedulers_lock:
+        scheduler = _schedulers.get(id(generator))
+        if scheduler is None:
+            scheduler = BatchScheduler(generator)
+            _schedulers[id(generator)] = scheduler
+        return scheduler
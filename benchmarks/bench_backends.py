@@ -0,0 +1,83 @@
+# 推理后端对比：贪心解码下生成token的一致性检查，以及延迟和内存对比
+import argparse
+import copy
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batching import GenerationRequest, run_batch
+from inference_backends import BACKENDS, prepare_backend
+from model_manager import MODEL_DIR, load_generator, process_rss_mb
+
+PROMPTS = [
+    "请根据以下关键词生成一个奇幻风格的完整故事：公主,城堡,龙\n故事内容：",
+    "请根据以下关键词创作一首优美的现代诗：春天,花朵,希望\n诗歌内容：",
+    "请根据以下关键词创作一首古体诗：月光,思念\n诗歌内容：",
+]
+# 与 PyTorch 数值等价、贪心解码结果必须完全一致的后端；int8 量化只报告一致率
+EXACT_BACKENDS = ("torch", "onnx")
+
+
+def greedy_decode(model, tokenizer, max_new_tokens):
+    """逐个prompt贪心解码，返回 (token列表, 平均每token耗时)"""
+    outputs, elapsed, tokens = [], 0.0, 0
+    for prompt in PROMPTS:
+        request = GenerationRequest(prompt, max_new_tokens=max_new_tokens, do_sample=False)
+        start = time.perf_counter()
+        run_batch(model, tokenizer, [request])
+        elapsed += time.perf_counter() - start
+        tokens += len(request.output_ids)
+        outputs.append(request.output_ids)
+    return outputs, elapsed / max(tokens, 1)
+
+
+def agreement(reference, candidate):
+    """两组token序列中从开头起一致的token比例"""
+    same = total = 0
+    for ref_ids, ids in zip(reference, candidate):
+        total += len(ref_ids)
+        for a, b in zip(ref_ids, ids):
+            if a != b:
+                break
+            same += 1
+    return same / max(total, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推理后端一致性与性能对比")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    args = parser.parse_args()
+
+    generator = load_generator(backend="torch")
+    base_model, tokenizer = generator.model.to("cpu"), generator.tokenizer
+    reference = None
+    failed = []
+    print(f"{'后端':<8}{'每token(ms)':>12}{'内存增量(MB)':>14}{'一致率':>10}  结果")
+    for backend in args.backends.split(","):
+        before = process_rss_mb()
+        with tempfile.TemporaryDirectory() as tmp:
+            model, actual = prepare_backend(copy.deepcopy(base_model), backend, tmp if backend == "onnx" else MODEL_DIR)
+            after = process_rss_mb()
+            ids, per_token = greedy_decode(model, tokenizer, args.max_new_tokens)
+        if actual != backend:
+            print(f"{backend:<8}  初始化失败，已跳过")
+            continue
+        if reference is None:
+            reference = ids
+        rate = agreement(reference, ids)
+        verdict = "PASS" if rate == 1.0 else ("FAIL" if backend in EXACT_BACKENDS else "-")
+        if verdict == "FAIL":
+            failed.append(backend)
+        memory = f"{after - before:.1f}" if before is not None and after is not None else "n/a"
+        print(f"{backend:<8}{per_token * 1000:>12.2f}{memory:>14}{rate:>10.1%}  {verdict}")
+    if failed:
+        print(f"失败: {', '.join(failed)} 的贪心解码结果与 PyTorch 不一致")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+# 基准测试：逐个调用 pipeline 与批处理调度器的吞吐量对比
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batching import BatchScheduler
+from model_manager import load_generator
+
+PROMPTS = [
+    "请根据以下关键词生成一个奇幻风格的完整故事：公主,城堡,龙\n故事内容：",
+    "请根据以下关键词创作一首优美的现代诗：春天,花朵,希望\n诗歌内容：",
+    "请根据以下关键词创作一首古体诗：月光,思念\n诗歌内容：",
+    "请根据以下关键词创作一首简单易懂的儿歌：星辰,梦想\n诗歌内容：",
+]
+
+
+def run_clients(call, num_requests, concurrency):
+    """模拟多个用户同时提交请求，返回总耗时"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda i: call(PROMPTS[i % len(PROMPTS)]), range(num_requests)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批处理调度器吞吐量基准测试")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--wait-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    generator = load_generator()
+    params = dict(
+        max_new_tokens=args.max_new_tokens,
+        temperature=0.8,
+        top_p=0.9,
+        repetition_penalty=1.1,
+        no_repeat_ngram_size=2,
+        do_sample=True
+    )
+
+    # 当前方式：每个请求单独调用 pipeline，模型同一时间只处理一个请求
+    lock = threading.Lock()
+
+    def sequential(prompt):
+        with lock:
+            return generator(prompt, pad_token_id=generator.tokenizer.pad_token_id, **params)
+
+    scheduler = BatchScheduler(generator, max_batch_size=args.batch_size, wait_ms=args.wait_ms)
+
+    def batched(prompt):
+        return scheduler(prompt, **params)
+
+    # 预热
+    sequential(PROMPTS[0])
+    batched(PROMPTS[0])
+
+    results = {}
+    for name, call in [("逐个调用", sequential), ("批处理", batched)]:
+        elapsed = run_clients(call, args.requests, args.concurrency)
+        results[name] = elapsed
+        print(f"{name}: {args.requests} 个请求耗时 {elapsed:.2f} 秒，"
+              f"吞吐量 {args.requests / elapsed:.2f} 请求/秒，"
+              f"约 {args.requests * args.max_new_tokens / elapsed:.1f} tokens/秒")
+    print(f"加速比: {results['逐个调用'] / results['批处理']:.2f}x，"
+          f"批次数 {scheduler.stats['batches'] - 1}，最大批次 {scheduler.stats['max_batch_size_seen']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# 基准测试：原有的JSON整体重写方式与 FavoritesStore（SQLite，按id增删）在大量收藏时的
+# 添加、移除、分页读取耗时，以及多线程同时添加时是否丢失收藏
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from favorites_store import FavoritesStore
+
+CHARS = "春风吹过山岗月光洒在湖面上思念像一条河流向远方的故乡城堡里住着勇敢的公主"
+
+
+def make_item(rng, i):
+    return {"title": f"收藏_{i}", "content": "".join(rng.choice(CHARS) for _ in range(300)),
+            "type": rng.choice(["故事", "诗歌"]), "timestamp": float(i)}
+
+
+class LegacyFavorites:
+    """原实现：所有收藏保存在一个JSON列表中，每次修改都重写整个文件，按列表位置删除"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return []
+
+    def save(self, favorites):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(favorites, f, ensure_ascii=False, indent=2)
+
+    def add(self, item):
+        favorites = self.load()
+        favorites.append(item)
+        self.save(favorites)
+
+    def remove(self, index):
+        favorites = self.load()
+        del favorites[index]
+        self.save(favorites)
+
+    def page(self, page, page_size=10):
+        favorites = self.load()
+        return favorites[::-1][(page - 1) * page_size:page * page_size]
+
+
+def median_ms(fn, args_list):
+    timings = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="收藏存储基准测试")
+    parser.add_argument("--entries", type=int, default=10000, help="预先存入的收藏数")
+    parser.add_argument("--ops", type=int, default=100, help="每种操作的测量次数")
+    parser.add_argument("--threads", type=int, default=8, help="并发添加测试的线程数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    items = [make_item(rng, i) for i in range(args.entries)]
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = LegacyFavorites(os.path.join(tmp, "favorites.json"))
+        legacy.save(items)
+        store = FavoritesStore(path=os.path.join(tmp, "favorites.db"), legacy_files=())
+        ids = [store.add(item) for item in items]
+        print(f"预先存入 {args.entries} 条收藏（JSON文件 {os.path.getsize(legacy.path) / 1024 / 1024:.1f} MB）")
+
+        new_items = [(make_item(rng, args.entries + i),) for i in range(args.ops)]
+        results = {
+            "添加": (median_ms(legacy.add, new_items), median_ms(store.add, new_items)),
+            "移除": (median_ms(legacy.remove, [(rng.randrange(args.entries),) for _ in range(args.ops)]),
+                     median_ms(store.remove, [(item_id,) for item_id in rng.sample(ids, args.ops)])),
+            "分页读取": (median_ms(legacy.page, [(rng.randint(1, 100),) for _ in range(args.ops)]),
+                         median_ms(store.page, [("default", rng.randint(1, 100)) for _ in range(args.ops)])),
+        }
+        for name, (legacy_ms, store_ms) in results.items():
+            print(f"{name}: 原实现 {legacy_ms:.2f} 毫秒，FavoritesStore {store_ms:.3f} 毫秒，"
+                  f"加速 {legacy_ms / store_ms:.0f}x")
+
+        # 并发添加：原实现各线程读取、追加、整体重写，后写入的会覆盖先写入的，
+        # 还可能读到另一个线程写了一半的文件
+        per_thread = max(1, args.ops // args.threads)
+        for name, target, count in (
+                ("原实现", legacy.add, lambda: len(legacy.load())),
+                ("FavoritesStore", lambda item: store.add(item, "concurrent"), lambda: store.count("concurrent"))):
+            before = count()
+            errors = []
+
+            def worker():
+                for _ in range(per_thread):
+                    try:
+                        target(make_item(random.Random(), 0))
+                    except Exception as e:
+                        errors.append(e)
+
+            threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            try:
+                added = count() - before
+            except Exception as e:
+                print(f"并发添加（{args.threads} 个线程各 {per_thread} 条）{name}: 文件已损坏，收藏全部丢失（{e}）")
+                continue
+            print(f"并发添加（{args.threads} 个线程各 {per_thread} 条）{name}: 实际增加 {added} 条，"
+                  f"丢失 {per_thread * args.threads - added} 条，读取到损坏文件 {len(errors)} 次")
+
+if __name__ == "__main__":
+    main()
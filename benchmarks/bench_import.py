@@ -0,0 +1,91 @@
+# 基准测试：在全新的进程中导入 story_generator，测量导入耗时并检查导入是否有副作用
+# （导入重量级依赖、修改环境变量、在当前目录创建文件），超出时间预算或有副作用时返回非零退出码
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 导入核心模块时不应加载的模块
+HEAVY_MODULES = ("torch", "transformers", "gradio", "huggingface_hub", "numpy", "generation", "web_ui")
+# 导入耗时预算（毫秒）
+IMPORT_BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", "100"))
+
+_PROBE = """
+import json, os, sys, time
+sys.path.insert(0, {root!r})
+env = dict(os.environ)
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": seconds,
+    "heavy": [name for name in {heavy!r} if name in sys.modules],
+    "env": sorted(k for k in set(env) | set(os.environ) if env.get(k) != os.environ.get(k)),
+}}))
+"""
+
+
+def probe(module, cwd):
+    code = _PROBE.format(root=ROOT, module=module, heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, "-c", code], cwd=cwd, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(module, cwd, top):
+    """用 -X importtime 找出耗时最多的模块（累计耗时，微秒）"""
+    code = f"import sys; sys.path.insert(0, {ROOT!r}); import {module}"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=cwd,
+                            capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # 格式：import time: 自身耗时 | 累计耗时 | 模块名
+        self_us, cumulative_us, name = [part.strip() for part in line.split(":", 1)[1].split("|")]
+        rows.append((int(cumulative_us), int(self_us), name))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导入耗时与副作用检查")
+    parser.add_argument("--module", default="story_generator")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=8, help="列出耗时最多的模块数")
+    args = parser.parse_args()
+
+    # 在空的临时目录中导入，检查是否在当前目录创建了文件
+    with tempfile.TemporaryDirectory() as cwd:
+        runs = [probe(args.module, cwd) for _ in range(args.repeat)]
+        created = sorted(os.listdir(cwd))
+        slowest = slowest_imports(args.module, cwd, args.top)
+
+    median_ms = statistics.median(r["seconds"] for r in runs) * 1000
+    print(f"导入 {args.module}: 中位数 {median_ms:.1f} 毫秒（{args.repeat} 次，预算 {args.budget_ms:.0f} 毫秒）")
+    print("累计耗时最多的模块:")
+    for cumulative_us, self_us, name in slowest:
+        print(f"  {name:<30} {cumulative_us / 1000:8.1f} 毫秒（自身 {self_us / 1000:.1f} 毫秒）")
+
+    problems = []
+    if median_ms > args.budget_ms:
+        problems.append(f"导入耗时 {median_ms:.1f} 毫秒超出预算 {args.budget_ms:.0f} 毫秒")
+    if runs[0]["heavy"]:
+        problems.append(f"导入了重量级模块: {', '.join(runs[0]['heavy'])}")
+    if runs[0]["env"]:
+        problems.append(f"修改了环境变量: {', '.join(runs[0]['env'])}")
+    if created:
+        problems.append(f"在当前目录创建了文件: {', '.join(created)}")
+    for problem in problems:
+        print(f"失败: {problem}")
+    if not problems:
+        print("通过：没有导入重量级模块，没有修改环境变量，也没有创建文件")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
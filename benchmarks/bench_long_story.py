@@ -0,0 +1,82 @@
+# 基准测试：长篇故事分段生成。对比一次生成（受1024个token的上下文限制，prompt被截断、长度被截短）
+# 和分段生成时实际生成的token数、总耗时、最长上下文，以及故事不同位置上每个token的耗时
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batching import BatchScheduler
+from long_story import LONG_STORY_SEGMENT_TOKENS, ChunkedStoryStream, StoryOutline
+from model_manager import load_generator
+from prompts import STORY_SENTENCE_END_CHARS, STORY_SOFT_LIMIT, build_story_prompt, story_prompt_prefix
+
+KEYWORDS, GENRE, STYLE, CHARACTER = "公主,城堡,龙", "奇幻", "文艺", "勇敢的骑士"
+
+
+def consume(stream):
+    """迭代流式结果，返回每个增量到达的时间间隔（秒）"""
+    gaps = []
+    last = time.perf_counter()
+    for _ in stream:
+        now = time.perf_counter()
+        gaps.append(now - last)
+        last = now
+    return gaps
+
+
+def by_position(gaps, bucket):
+    """按增量在故事中的位置分桶，返回每桶每个增量的平均耗时（毫秒）"""
+    return [statistics.mean(gaps[i:i + bucket]) * 1000 for i in range(0, len(gaps), bucket)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="长篇故事分段生成基准测试")
+    parser.add_argument("--max-length", type=int, default=2000, help="请求的故事长度（token数）")
+    parser.add_argument("--segment-tokens", type=int, default=LONG_STORY_SEGMENT_TOKENS)
+    parser.add_argument("--bucket", type=int, default=256, help="统计每个token耗时的位置区间")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import torch
+
+    torch.manual_seed(args.seed)
+
+    generator = load_generator()
+    scheduler = BatchScheduler(generator)
+    prefix = story_prompt_prefix(GENRE)
+    params = dict(temperature=0.7, top_p=0.9, repetition_penalty=1.1, do_sample=True, no_repeat_ngram_size=2,
+                  stop_chars=STORY_SENTENCE_END_CHARS, stop_after_tokens=int(args.max_length * STORY_SOFT_LIMIT))
+    # 预热：建立前缀KV缓存，避免首次调用的开销计入结果
+    "".join(scheduler.stream(build_story_prompt(KEYWORDS, GENRE), prefix=prefix, max_new_tokens=8))
+
+    # 一次生成使用与第一段相同的prompt（包含写作风格和主要角色）
+    outline = StoryOutline(KEYWORDS, GENRE, STYLE, CHARACTER)
+    single = scheduler.stream(outline.prompt(), prefix=prefix, max_new_tokens=args.max_length, **params)
+    chunked = ChunkedStoryStream(scheduler, outline, prefix=prefix,
+                                 max_new_tokens=args.max_length, segment_tokens=args.segment_tokens, **params)
+    rows = []
+    for name, stream in (("一次生成", single), ("分段生成", chunked)):
+        start = time.perf_counter()
+        gaps = consume(stream)
+        elapsed = time.perf_counter() - start
+        context = getattr(stream, "max_context", stream.prompt_tokens + stream.num_tokens)
+        segments = getattr(stream, "segments", 1)
+        print(f"{name}: 请求 {args.max_length} 个token，实际生成 {stream.num_tokens} 个，{segments} 段，"
+              f"最长上下文 {context} 个token，总耗时 {elapsed:.2f} 秒，"
+              f"平均每个token {elapsed / max(1, stream.num_tokens) * 1000:.2f} 毫秒")
+        if stream.quality and stream.quality["aborted"]:
+            print(f"  退化检测提前结束：{stream.quality['reason']}")
+        rows.append((name, by_position(gaps, args.bucket)))
+    if single.num_tokens < args.max_length:
+        print(f"一次生成受上下文长度限制：prompt只保留了最后 {single.prompt_tokens} 个token，长度被截短")
+
+    print(f"不同位置每个token的耗时（毫秒，每 {args.bucket} 个增量一组）：")
+    for name, buckets in rows:
+        print(f"  {name}: " + " ".join(f"{ms:.2f}" for ms in buckets))
+
+
+if __name__ == "__main__":
+    main()
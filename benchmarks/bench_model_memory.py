@@ -0,0 +1,76 @@
+# 基准测试：多个进程加载同一个本地模型时，内存映射（safetensors）与完整复制的加载耗时和内存占用对比
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_manager import MODEL_DIR, has_safetensors, load_local_model
+
+
+def read_memory():
+    """读取当前进程的 Rss / Pss / 私有内存（MB），Pss 按共享进程数分摊共享页面"""
+    fields = {"Rss": 0, "Pss": 0, "Private_Clean": 0, "Private_Dirty": 0}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            name, value = line.split()[:2]
+            name = name.rstrip(":")
+            if name in fields:
+                fields[name] = int(value) / 1024
+    return {"rss": fields["Rss"], "pss": fields["Pss"],
+            "private": fields["Private_Clean"] + fields["Private_Dirty"]}
+
+
+def child(model_dir, mmap, results, done):
+    import torch
+
+    torch.set_num_threads(1)
+    baseline = read_memory()
+    start = time.perf_counter()
+    model = load_local_model(model_dir, mmap=mmap)
+    load_seconds = time.perf_counter() - start
+    with torch.inference_mode():
+        model(input_ids=torch.tensor([[1, 2, 3, 4]]))
+    memory = read_memory()
+    results.put((os.getpid(), load_seconds, {k: memory[k] - baseline[k] for k in memory}))
+    # 等所有进程都加载完成后再退出，保证测量时权重同时被多个进程映射
+    done.wait()
+
+
+def run(model_dir, mmap, processes):
+    context = multiprocessing.get_context("spawn")
+    results, done = context.Queue(), context.Event()
+    workers = []
+    reports = []
+    # 依次启动进程，每个进程加载完成后再启动下一个，观察新增进程的开销
+    for _ in range(processes):
+        worker = context.Process(target=child, args=(model_dir, mmap, results, done))
+        worker.start()
+        workers.append(worker)
+        reports.append(results.get())
+    done.set()
+    for worker in workers:
+        worker.join()
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模型内存映射加载基准测试（仅支持Linux）")
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--processes", type=int, default=3)
+    args = parser.parse_args()
+
+    if not has_safetensors(args.model_dir):
+        print(f"{args.model_dir} 中没有 safetensors 文件，请先运行一次 story_generator.py 完成转换")
+        return
+    for mmap, label in ((False, "完整复制"), (True, "内存映射")):
+        print(f"{label}:")
+        for index, (pid, load_seconds, memory) in enumerate(run(args.model_dir, mmap, args.processes), 1):
+            print(f"  进程{index}: 加载 {load_seconds:.2f} 秒，新增 RSS {memory['rss']:.0f} MB，"
+                  f"私有内存 {memory['private']:.0f} MB，PSS {memory['pss']:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# 基准测试：原有的多遍正则后处理与 postprocess 模块（预编译、单遍、增量）的耗时对比
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from postprocess import PoemStreamFormatter, StoryStreamFormatter, clean_poem, clean_story
+
+CHARS = "春风吹过山岗月光洒在湖面上思念像一条河流向远方的故乡城堡里住着勇敢的公主"
+PUNCS = "，。！？；"
+
+
+def legacy_remove_numbered_list(text):
+    import re
+    text = re.sub(r'^\s*\d+\.\s*', '', text, flags=re.MULTILINE)
+    text = re.sub(r'\n+', '\n', text)
+    return text
+
+
+def legacy_clean_story(story):
+    story = legacy_remove_numbered_list(story.strip())
+    if story and not any(story.endswith(punc) for punc in ['.', '。', '!', '！', '?', '？', '…', '…']):
+        story += '。'
+    return story
+
+
+def legacy_clean_poem(poem, style):
+    import re
+    poem = legacy_remove_numbered_list(poem.strip())
+    poem = re.sub(r'^\s*[\d一二三四五六七八九十]+\s*[、.]\s*', '', poem, flags=re.MULTILINE)
+    poem = re.sub(r'\n+', '\n', poem)
+    lines = [line.strip() for line in poem.split('\n') if line.strip()]
+    poem = '\n'.join(lines)
+    if style == "现代诗" and len(lines) < 2:
+        line = lines[0]
+        split_chars = ['，', '。', '！', '？', '；', '：']
+        new_lines = []
+        current_line = ''
+        for char in line:
+            current_line += char
+            if char in split_chars:
+                new_lines.append(current_line.strip())
+                current_line = ''
+        if current_line:
+            new_lines.append(current_line.strip())
+        if len(new_lines) > 1:
+            poem = '\n'.join(new_lines)
+    return poem
+
+
+def make_tokens(num_tokens, rng, numbered, spaced):
+    """模拟生成的文本片段：偶尔出现编号和换行，spaced 时字与字之间带分词器解码留下的空格"""
+    tokens = []
+    for i in range(num_tokens):
+        if numbered and i % 40 == 0:
+            tokens.append(f"\n{i // 40 + 1}. ")
+        token = rng.choice(PUNCS) if rng.random() < 0.12 else rng.choice(CHARS)
+        tokens.append(token + " " if spaced else token)
+    return tokens
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="后处理基准测试")
+    parser.add_argument("--tokens", type=int, default=400, help="每段文本的token数")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cases = []
+    # 原实现不处理字间空格，带空格时新实现多做了空格合并
+    for spaced, label in ((False, "无空格"), (True, "带空格")):
+        cases.append((f"故事/{label}", make_tokens(args.tokens, rng, True, spaced),
+                      legacy_clean_story, clean_story, StoryStreamFormatter))
+        cases.append((f"现代诗/{label}", make_tokens(args.tokens // 4, rng, False, spaced),
+                      lambda text: legacy_clean_poem(text, "现代诗"), lambda text: clean_poem(text, "现代诗"),
+                      lambda: PoemStreamFormatter("现代诗")))
+    for name, tokens, legacy, new, formatter_cls in cases:
+        text = "".join(tokens)
+        legacy_seconds, _ = timed(lambda: legacy(text), args.repeat)
+        new_seconds, cleaned = timed(lambda: new(text), args.repeat)
+        print(f"{name}（{len(tokens)} 个token）完整文本: 原实现 {legacy_seconds * 1e6:.1f} 微秒，"
+              f"新实现 {new_seconds * 1e6:.1f} 微秒，加速 {legacy_seconds / new_seconds:.1f}x")
+
+        # 流式输出：原实现每个token都要对全文重新后处理一遍
+        def legacy_stream():
+            accumulated = ""
+            for token in tokens:
+                accumulated += token
+                legacy(accumulated)
+
+        def new_stream():
+            formatter = formatter_cls()
+            for token in tokens:
+                formatter.feed(token)
+            return formatter.finish()
+
+        stream_repeat = max(1, args.repeat // 20)
+        legacy_seconds, _ = timed(legacy_stream, stream_repeat)
+        new_seconds, streamed = timed(new_stream, stream_repeat)
+        print(f"{name} 流式逐token处理: 原实现 {legacy_seconds * 1e3:.2f} 毫秒，"
+              f"新实现 {new_seconds * 1e3:.2f} 毫秒，加速 {legacy_seconds / new_seconds:.1f}x，"
+              f"流式与一次性结果一致: {streamed == cleaned}")
+        print(f"  清理后示例: {cleaned[:40]!r}")
+
+
+if __name__ == "__main__":
+    main()
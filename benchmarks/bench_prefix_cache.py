@@ -0,0 +1,62 @@
+# 基准测试：每个prompt模板在使用前缀KV缓存前后的预填充耗时
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_manager import load_generator
+from prefix_cache import PrefixCache, layers_to_cache
+from story_generator import STORY_GENRES, POEM_TYPES, build_story_prompt, build_poem_prompt, \
+    story_prompt_prefix, poem_prompt_prefix
+
+
+def prefill_seconds(model, input_ids, repeat, layers=None, prefix_len=0):
+    """重复执行预填充，返回耗时中位数（秒）"""
+    import torch
+
+    timings = []
+    for _ in range(repeat):
+        past = layers_to_cache(list(layers)) if layers is not None else None
+        attention_mask = torch.ones((1, prefix_len + input_ids.shape[1]), dtype=torch.long)
+        position_ids = torch.arange(prefix_len, prefix_len + input_ids.shape[1]).unsqueeze(0)
+        start = time.perf_counter()
+        with torch.inference_mode():
+            model(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids,
+                  past_key_values=past, use_cache=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="前缀KV缓存预填充耗时基准测试")
+    parser.add_argument("--keywords", default="公主,城堡,龙")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    import torch
+
+    generator = load_generator()
+    model, tokenizer = generator.model, generator.tokenizer
+    cache = PrefixCache(model, tokenizer)
+
+    cases = [(f"故事/{genre}", build_story_prompt(args.keywords, genre), story_prompt_prefix(genre))
+             for genre in STORY_GENRES]
+    cases += [(f"诗歌/{style}", build_poem_prompt(args.keywords, style), poem_prompt_prefix(style))
+              for style in POEM_TYPES]
+
+    print(f"{'模板':<10}{'前缀token':>10}{'完整预填充(ms)':>16}{'复用前缀(ms)':>14}{'节省':>8}")
+    for name, prompt, prefix in cases:
+        full_ids = tokenizer(prompt, add_special_tokens=False)["input_ids"]
+        prefix_ids, layers = cache.get(prefix)
+        suffix_ids = tokenizer(prompt[len(prefix):], add_special_tokens=False)["input_ids"]
+        full = prefill_seconds(model, torch.tensor([full_ids]), args.repeat)
+        cached = prefill_seconds(model, torch.tensor([suffix_ids]), args.repeat, layers, len(prefix_ids))
+        print(f"{name:<10}{len(prefix_ids):>10}{full * 1000:>16.2f}{cached * 1000:>14.2f}"
+              f"{(1 - cached / full) * 100:>7.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# 基准测试：退化生成检测。固定的退化/正常文本逐token回放检验检测结果，测量每个token的检测开销，
+# 再对比开启和关闭检测时实际生成的token数、耗时、提前结束比例和节省的token数
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batching import BatchScheduler
+from model_manager import load_generator
+from prompts import STORY_GENRES, build_story_prompt
+from quality_guard import QualityMonitor
+
+PROMPT = build_story_prompt("故宫,博物院", "历史")
+# (名称, 文本, 是否应被检测为退化)
+CASES = [
+    ("跑题成编号列表", "故宫博物院藏书《清宫词》(图)2.《明清两代词典》（图）3.明朝万历年间词汇《春秋》4.清朝皇帝词"
+                 "5.中国古代汉语词组（1）__a【趣味测试】这是马云在一次面试中出的题目", True),
+    ("重复同一个字", "哈" * 48, True),
+    ("循环重复短句", "我爱你，你爱我，" * 6, True),
+    ("照抄prompt", "请根据以下关键词生成一个历史风格的完整故事，要求以连续的文本段落形式呈现，不要使用数字编号列表", True),
+    ("正常故事", "从前，在一座古老的城堡里住着一位美丽的公主。她每天都站在高高的窗前，望着远方的森林，期待着有一天"
+             "能够走出城堡，去看看外面的世界。有一天，一条巨大的龙飞过城堡的上空，它的翅膀遮住了太阳。", False),
+    ("正常诗歌", "春风吹过山岗，月光洒在湖面上。思念像一条河流，流向远方的故乡。夜色温柔，星辰低语，"
+             "我在梦里听见你的歌声。", False),
+    ("儿歌中的重复", "小星星，亮晶晶，一闪一闪亮晶晶。小星星，亮晶晶，挂在天上放光明。小星星，亮晶晶，好像许多小眼睛。",
+     False),
+    ("含有年份的故事", "公元1644年，李自成攻入北京。1645年，清军南下，扬州城破。那一年他二十岁，第一次离开家乡。"
+                 "书名叫《红楼梦》，他读了三遍。", False),
+]
+
+
+def replay(tokenizer, text):
+    """逐token回放文本，返回 (检测结果, 触发位置, token数)"""
+    ids = tokenizer(text, add_special_tokens=False)["input_ids"]
+    monitor = QualityMonitor(tokenizer, tokenizer(PROMPT, add_special_tokens=False)["input_ids"])
+    result = "正常"
+    for position, token in enumerate(ids):
+        action = monitor.observe(token)
+        if action == "resteer":
+            result = f"纠偏（第 {position + 1} 个token）"
+        elif action == "abort":
+            return f"提前结束：{monitor.reason}（第 {position + 1} 个token）", True, len(ids)
+    return result, monitor.resteered, len(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="退化生成检测基准测试")
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--max-new-tokens", type=int, default=200)
+    parser.add_argument("--greedy", action="store_true", help="使用贪心解码、不加重复惩罚（更容易出现重复）")
+    args = parser.parse_args()
+
+    generator = load_generator()
+    tokenizer = generator.tokenizer
+    print("检测结果：")
+    for name, text, degenerate in CASES:
+        result, detected, _ = replay(tokenizer, text)
+        mark = "✓" if detected == degenerate else "✗"
+        print(f"  {mark} {name}: {result}")
+
+    # 每个token的检测开销
+    text = "".join(text for _, text, degenerate in CASES if not degenerate) * 20
+    ids = tokenizer(text, add_special_tokens=False)["input_ids"]
+    monitor = QualityMonitor(tokenizer, tokenizer(PROMPT, add_special_tokens=False)["input_ids"])
+    start = time.perf_counter()
+    for token in ids:
+        monitor.observe(token)
+    print(f"检测开销：每个token {(time.perf_counter() - start) / len(ids) * 1e6:.2f} 微秒")
+
+    scheduler = BatchScheduler(generator)
+    params = dict(max_new_tokens=args.max_new_tokens, temperature=0.7, top_p=0.9)
+    if args.greedy:
+        params.update(do_sample=False)
+    else:
+        params.update(repetition_penalty=1.1, no_repeat_ngram_size=2)
+    prompts = [build_story_prompt(keywords, STORY_GENRES[i % len(STORY_GENRES)])
+               for i, keywords in enumerate(["公主,城堡,龙", "飞船,星球,机器人", "古宅,侦探,钥匙", "雨夜,车站,重逢"]
+                                            * (args.requests // 4 + 1))][:args.requests]
+    for guard in (False, True):
+        start = time.perf_counter()
+        streams = [scheduler.stream(prompt, guard=guard, **params) for prompt in prompts]
+        for stream in streams:
+            "".join(stream)
+        elapsed = time.perf_counter() - start
+        tokens = sum(stream.num_tokens for stream in streams)
+        aborted = [stream.quality for stream in streams if stream.quality and stream.quality["aborted"]]
+        resteered = sum(1 for stream in streams if stream.quality and stream.quality["resteered"])
+        saved = sum(quality["tokens_saved"] for quality in aborted)
+        print(f"{'开启' if guard else '关闭'}检测: 生成 {tokens} 个token，耗时 {elapsed:.2f} 秒，"
+              f"提前结束 {len(aborted)}/{len(streams)}，纠偏 {resteered}，节省 {saved} 个token")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# 基准测试：大量作品时全文索引搜索与逐条 LIKE 匹配的耗时对比，以及写入记录时更新索引的开销
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_store import HistoryStore
+
+CHARS = "春风吹过山岗月光洒在湖面上思念像一条河流向远方的故乡城堡里住着勇敢的公主森林深处有一位年迈的巫师守护着宝藏"
+KEYWORDS = ["公主", "城堡", "龙", "魔法", "冒险", "森林", "巫师", "宝藏", "春天", "花朵", "希望", "月光",
+            "梦想", "河流", "星辰", "思念", "飞船", "机器人", "侦探", "钥匙"]
+GENRES = ["奇幻", "科幻", "悬疑", "爱情", "冒险", "历史", "恐怖", "喜剧"]
+STYLES = ["现代诗", "古体诗", "宋词", "儿歌", "俳句", "自由诗"]
+QUERIES = ["城堡", "巫师 宝藏", "飞船 机器人", "科幻", "宋词", "月光思念", "星辰"]
+
+
+def make_item(rng, i):
+    keywords = rng.sample(KEYWORDS, 3)
+    content = "".join(rng.choice(CHARS) for _ in range(rng.randint(100, 400)))
+    # 把关键词放进正文，模拟真实作品
+    for word in keywords:
+        pos = rng.randint(0, len(content))
+        content = content[:pos] + word + content[pos:]
+    if rng.random() < 0.5:
+        return {"title": f"故事_{i}", "content": content, "type": "故事", "timestamp": i,
+                "keywords": ",".join(keywords), "genre": rng.choice(GENRES)}
+    return {"title": f"诗歌_{i}", "content": content, "type": "诗歌", "timestamp": i,
+            "keywords": ",".join(keywords), "style": rng.choice(STYLES)}
+
+
+def like_search(store, user_id, query, page_size):
+    """不使用索引的对照组：所有关键词都出现在正文、关键词或主题中"""
+    words = query.split()
+    where = " AND ".join(["(content LIKE ? OR keywords LIKE ? OR genre LIKE ? OR style LIKE ?)"] * len(words))
+    params = [user_id]
+    for word in words:
+        params += [f"%{word}%"] * 4
+    conn = store._connect()
+    total = conn.execute(f"SELECT COUNT(*) FROM history WHERE user_id = ? AND {where}", params).fetchone()[0]
+    rows = conn.execute(f"SELECT id FROM history WHERE user_id = ? AND {where} ORDER BY id DESC LIMIT ?",
+                        params + [page_size]).fetchall()
+    return rows, total
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="作品搜索基准测试")
+    parser.add_argument("--works", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HistoryStore(path=os.path.join(tmp, "history.db"), retention=0, legacy_file=None)
+        add_timings = []
+        start = time.perf_counter()
+        for i in range(args.works):
+            item = make_item(rng, i)
+            t = time.perf_counter()
+            store.add(item)
+            add_timings.append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - start
+        add_timings.sort()
+        print(f"写入 {args.works} 条作品（含索引更新）: 共 {elapsed:.1f} 秒，单条 p50 "
+              f"{add_timings[len(add_timings) // 2] * 1000:.2f} 毫秒 / p95 {add_timings[int(len(add_timings) * 0.95)] * 1000:.2f} 毫秒")
+        size = os.path.getsize(os.path.join(tmp, "history.db")) / 1024 / 1024
+        print(f"数据库大小 {size:.0f} MB")
+
+        for query in QUERIES:
+            index_seconds, (hits, total) = timed(lambda: store.search("default", query, page=1), args.repeat)
+            deep_seconds, _ = timed(lambda: store.search("default", query, page=50), args.repeat)
+            like_seconds, (_, like_total) = timed(lambda: like_search(store, "default", query, 10), args.repeat)
+            print(f"“{query}”: 命中 {total} 条（LIKE {like_total} 条），索引第1页 {index_seconds * 1000:.1f} 毫秒，"
+                  f"第50页 {deep_seconds * 1000:.1f} 毫秒，逐条 LIKE {like_seconds * 1000:.1f} 毫秒")
+
+
+if __name__ == "__main__":
+    main()
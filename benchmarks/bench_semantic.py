@@ -0,0 +1,92 @@
+# 基准测试：近似请求检索。大量已有作品时增量写入和查询的耗时，以及关键词顺序不同、近义、多出关键词
+# 等请求在精确缓存键和近似检索下的命中情况
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompts import STORY_GENRES
+from result_cache import make_cache_key
+from semantic_cache import SemanticCache
+
+KEYWORDS = ["公主", "城堡", "龙", "魔法", "冒险", "森林", "巫师", "宝藏", "春天", "花朵", "希望", "月光",
+            "梦想", "河流", "星辰", "思念", "飞船", "机器人", "侦探", "钥匙", "古宅", "雨夜", "车站", "重逢"]
+# 近义的改写：请求中的关键词换成含有相同字的说法
+VARIANTS = {"龙": "巨龙", "城堡": "古城堡", "公主": "小公主", "森林": "大森林", "星辰": "星星", "飞船": "宇宙飞船",
+            "侦探": "大侦探", "河流": "小河"}
+LENGTH = 500
+
+
+def make_work(rng):
+    return "".join(rng.choice("春风吹过山岗月光洒在湖面上思念像一条河流向远方的故乡。") for _ in range(LENGTH))
+
+
+def timed(fn, args_list):
+    timings = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000, timings[int(len(timings) * 0.95)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="近似请求检索基准测试")
+    parser.add_argument("--works", type=int, default=50000, help="索引中的作品数（分布在各主题/诗歌类型中）")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    partitions = [("story", genre) for genre in STORY_GENRES]
+    cache = SemanticCache(max_entries=args.works)
+    story = make_work(rng)
+    works = []
+    for _ in range(args.works):
+        kind, style = rng.choice(partitions)
+        works.append((kind, ",".join(rng.sample(KEYWORDS, 3)), style, story))
+    start = time.perf_counter()
+    for work in works[:-args.queries]:
+        cache.add(*work)
+    build = time.perf_counter() - start
+    add_p50, add_p95 = timed(cache.add, works[-args.queries:])
+    print(f"建立索引：{args.works} 篇作品（{len(partitions)} 个分区）共 {build:.1f} 秒，"
+          f"增量写入单篇 p50 {add_p50:.3f} 毫秒 / p95 {add_p95:.3f} 毫秒")
+
+    # 查询：已有作品的关键词经过不同改写后再次请求
+    def rewrite(keywords, mode):
+        words = keywords.split(",")
+        if mode == "顺序不同":
+            rng.shuffle(words)
+        elif mode == "近义改写":
+            words = [VARIANTS.get(word, word) for word in words]
+            rng.shuffle(words)
+        elif mode == "多一个关键词":
+            words.append(rng.choice([word for word in KEYWORDS if word not in words]))
+        elif mode == "无关关键词":
+            words = ["摩天轮", "咖啡", "地铁"]
+        return ",".join(words)
+
+    known = {make_cache_key(kind, keywords, style, LENGTH, 0.7) for kind, keywords, style, _ in works}
+    for mode in ("顺序不同", "近义改写", "多一个关键词", "无关关键词"):
+        pool = works
+        if mode == "近义改写":
+            pool = [work for work in works if any(word in VARIANTS for word in work[1].split(","))]
+        queries = [(kind, rewrite(keywords, mode), style, LENGTH)
+                   for kind, keywords, style, _ in rng.sample(pool, args.queries)]
+        exact = sum(make_cache_key(kind, keywords, style, LENGTH, 0.7) in known for kind, keywords, style, _ in queries)
+        hits = sum(cache.lookup(*query) is not None for query in queries)
+        p50, p95 = timed(cache.lookup, queries)
+        print(f"{mode}: 精确缓存键命中 {exact / len(queries):.0%}，近似检索命中 {hits / len(queries):.0%}，"
+              f"查询 p50 {p50:.2f} 毫秒 / p95 {p95:.2f} 毫秒")
+    print(f"每个分区约 {args.works // len(partitions)} 篇作品，向量维数 {cache.dim}，"
+          f"查询为单个分区内的暴力矩阵乘法（{statistics.mean(p.size for p in cache._partitions.values()):.0f} × {cache.dim}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# 基准测试：长故事生成时普通解码与推测解码（草稿模型）的耗时、接受率对比
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batching import GenerationRequest, run_batch
+from model_manager import load_generator
+from speculative import SpeculativeDecoder, load_draft_model
+
+PROMPT = "请根据以下关键词生成一个奇幻风格的完整故事：公主,城堡,龙\n故事内容："
+
+
+def generate(model, tokenizer, max_new_tokens, do_sample, temperature, speculative=None):
+    import torch
+
+    request = GenerationRequest(PROMPT, max_new_tokens=max_new_tokens, temperature=temperature, top_p=0.9,
+                                repetition_penalty=1.1, no_repeat_ngram_size=2, do_sample=do_sample)
+    start = time.perf_counter()
+    with torch.inference_mode():
+        run_batch(model, tokenizer, [request], speculative=speculative)
+    return request.output_ids, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推测解码基准测试")
+    parser.add_argument("--max-new-tokens", type=int, default=512)
+    parser.add_argument("--k", type=int, default=4, help="每轮草稿模型提出的token数")
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    generator = load_generator()
+    model = getattr(generator, "inference_model", generator.model)
+    tokenizer = generator.tokenizer
+    draft = load_draft_model()
+    if draft is None:
+        return
+    draft = draft.to(model.device)
+
+    for do_sample in (False, True):
+        mode = f"采样（温度 {args.temperature}）" if do_sample else "贪心"
+        decoder = SpeculativeDecoder(draft, k=args.k)
+        generate(model, tokenizer, 16, do_sample, args.temperature)
+        plain_seconds = spec_seconds = 0.0
+        plain_tokens = spec_tokens = 0
+        same = True
+        for _ in range(args.repeat):
+            plain_ids, seconds = generate(model, tokenizer, args.max_new_tokens, do_sample, args.temperature)
+            plain_seconds += seconds
+            plain_tokens += len(plain_ids)
+            spec_ids, seconds = generate(model, tokenizer, args.max_new_tokens, do_sample, args.temperature,
+                                         speculative=decoder)
+            spec_seconds += seconds
+            spec_tokens += len(spec_ids)
+            same = same and plain_ids == spec_ids
+        stats = decoder.stats
+        print(f"{mode}: 普通解码 {plain_tokens / plain_seconds:.1f} tokens/秒，"
+              f"推测解码 {spec_tokens / spec_seconds:.1f} tokens/秒，"
+              f"加速比 {(spec_tokens / spec_seconds) / (plain_tokens / plain_seconds):.2f}x，"
+              f"接受率 {stats['acceptance_rate']:.1%}，回退 {stats['fallbacks']} 次")
+        if not do_sample:
+            print(f"贪心解码结果与普通解码一致: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+# 基准测试套件：固定的关键词/主题/诗歌类型用例和随机种子，离线运行完整的生成流程
+# （prompt构建、批处理调度、解码、后处理），输出延迟分位数、吞吐量、内存峰值和后处理耗时，
+# 结果保存为JSON，便于在不同提交之间对比
+import argparse
+import hashlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+STORY_KEYWORDS = ["公主,城堡,龙", "飞船,星球,机器人", "古宅,侦探,钥匙", "雨夜,车站,重逢"]
+POEM_KEYWORDS = ["春天,花朵,希望", "月光,思念", "星辰,梦想", "河流,故乡"]
+# 没有本地模型时使用的随机初始化小模型
+TINY_MODEL_DIR = os.path.join(tempfile.gettempdir(), "story_generator_bench_tiny_gpt2")
+
+
+def build_corpus(story_genres, poem_types, story_tokens, poem_lines):
+    """每个故事主题和诗歌类型各一个用例，关键词轮流取用"""
+    cases = []
+    for i, genre in enumerate(story_genres):
+        cases.append({"kind": "story", "keywords": STORY_KEYWORDS[i % len(STORY_KEYWORDS)], "genre": genre,
+                      "max_length": story_tokens, "temperature": 0.7})
+    for i, style in enumerate(poem_types):
+        cases.append({"kind": "poem", "keywords": POEM_KEYWORDS[i % len(POEM_KEYWORDS)], "style": style,
+                      "lines": poem_lines, "temperature": 0.8})
+    return cases
+
+
+def build_tiny_model(model_dir, prompts, seed=0):
+    """用语料中出现的字和常用汉字构造BERT分词器词表，保存一个随机初始化的小型GPT-2"""
+    import torch
+    from transformers import BertTokenizer, GPT2Config, GPT2LMHeadModel
+
+    os.makedirs(model_dir, exist_ok=True)
+    chars = set("".join(prompts)) | set("，。！？；：、“”…")
+    chars |= {chr(code) for code in range(0x4E00, 0x4E00 + 2000)}
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + sorted(c for c in chars if not c.isspace())
+    vocab_file = os.path.join(model_dir, "vocab.txt")
+    with open(vocab_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(vocab) + "\n")
+    tokenizer = BertTokenizer(vocab_file)
+    tokenizer.save_pretrained(model_dir)
+
+    torch.manual_seed(seed)
+    config = GPT2Config(vocab_size=len(vocab), n_positions=1024, n_embd=128, n_layer=2, n_head=4,
+                        bos_token_id=tokenizer.cls_token_id, eos_token_id=tokenizer.sep_token_id,
+                        pad_token_id=tokenizer.pad_token_id)
+    GPT2LMHeadModel(config).save_pretrained(model_dir, safe_serialization=True)
+    print(f"没有本地模型，已创建随机初始化的小型GPT-2: {model_dir}")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = (len(values) - 1) * q
+    low = int(index)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (index - low)
+
+
+def peak_rss_mb():
+    # Linux 上 ru_maxrss 的单位是KB，macOS 上是字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(results):
+    latencies = [r["seconds"] for r in results]
+    total_seconds = sum(latencies)
+    total_tokens = sum(r["tokens"] for r in results)
+    return {
+        "requests": len(results),
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p95": percentile(latencies, 0.95),
+        "tokens": total_tokens,
+        "tokens_per_second": total_tokens / total_seconds if total_seconds else 0.0,
+        "postprocess_seconds": sum(r["postprocess_seconds"] for r in results),
+    }
+
+
+def compare(report, baseline_path):
+    """与之前保存的结果对比，输出各项指标的变化"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"与 {baseline_path}（提交 {baseline.get('commit')}）对比:")
+    for group, summary in report["summary"].items():
+        old = baseline.get("summary", {}).get(group)
+        if not old:
+            continue
+        changes = []
+        for name in ("latency_p50", "latency_p95", "tokens_per_second", "postprocess_seconds"):
+            if old.get(name):
+                changes.append(f"{name} {(summary[name] - old[name]) / old[name]:+.1%}")
+        print(f"  {group}: " + "，".join(changes))
+    if baseline.get("output_digest") != report["output_digest"]:
+        print("  注意：生成结果与基线不同（参数、采样或后处理发生了变化）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成流程基准测试套件（可离线运行）")
+    parser.add_argument("--repeat", type=int, default=2, help="每个用例运行的次数（种子依次递增）")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--story-tokens", type=int, default=120)
+    parser.add_argument("--poem-lines", type=int, default=8)
+    parser.add_argument("--tiny", action="store_true", help="即使有本地模型也使用随机初始化的小模型")
+    parser.add_argument("--output", default="bench_results.json", help="JSON结果文件")
+    parser.add_argument("--compare", help="之前保存的JSON结果，输出指标变化")
+    args = parser.parse_args()
+
+    # 在导入项目模块之前确定模型目录，并固定会改变测量内容的开关，不受当前环境变量影响，保证结果可复现：
+    # 关闭工作池、结果缓存、推测解码、相同请求合并和近似检索，退化检测和长篇分段阈值使用默认值
+    local_dir = os.environ.get("MODEL_DIR", "./local_model")
+    use_tiny = args.tiny or not os.path.exists(os.path.join(local_dir, "config.json"))
+    if use_tiny:
+        os.environ["MODEL_DIR"] = TINY_MODEL_DIR
+    os.environ.update({"WORKER_PROCESSES": "0", "RESULT_CACHE": "0", "SPECULATIVE": "0", "COALESCE": "0",
+                       "SEMANTIC_CACHE": "0", "QUALITY_GUARD": "1", "LONG_STORY_THRESHOLD": "600"})
+
+    import torch
+    from metrics import STAGE_SECONDS
+    from story_generator import (POEM_TYPES, STORY_GENRES, build_poem_prompt, build_story_prompt,
+                                 generate_poem_stream, generate_story_stream)
+
+    cases = build_corpus(STORY_GENRES, POEM_TYPES, args.story_tokens, args.poem_lines)
+    if use_tiny and not os.path.exists(os.path.join(TINY_MODEL_DIR, "config.json")):
+        prompts = [build_story_prompt(c["keywords"], c["genre"]) if c["kind"] == "story"
+                   else build_poem_prompt(c["keywords"], c["style"]) for c in cases]
+        build_tiny_model(TINY_MODEL_DIR, prompts)
+
+    def run_case(case, seed):
+        torch.manual_seed(seed)
+        usage = {}
+        postprocess_before = STAGE_SECONDS.sum(case["kind"], "postprocess")
+        start = time.perf_counter()
+        text = ""
+        if case["kind"] == "story":
+            for text in generate_story_stream(case["keywords"], case["genre"], case["max_length"],
+                                              case["temperature"], usage=usage):
+                pass
+        else:
+            for text in generate_poem_stream(case["keywords"], case["style"], case["lines"],
+                                             case["temperature"], usage=usage):
+                pass
+        return {
+            **case,
+            "seed": seed,
+            "seconds": time.perf_counter() - start,
+            "tokens": usage.get("generated_tokens", 0),
+            "postprocess_seconds": STAGE_SECONDS.sum(case["kind"], "postprocess") - postprocess_before,
+            "digest": hashlib.sha1(text.encode("utf-8")).hexdigest()[:12],
+        }
+
+    # 预热：加载模型、建立批处理调度器，不计入结果
+    run_case(cases[0], args.seed)
+    results = []
+    for repeat in range(args.repeat):
+        for index, case in enumerate(cases):
+            results.append(run_case(case, args.seed + repeat * len(cases) + index))
+
+    report = {
+        "commit": git_commit(),
+        "model": "tiny-random-gpt2" if use_tiny else os.path.abspath(local_dir),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "threads": torch.get_num_threads(),
+        "seed": args.seed,
+        "summary": {
+            "all": summarize(results),
+            "story": summarize([r for r in results if r["kind"] == "story"]),
+            "poem": summarize([r for r in results if r["kind"] == "poem"]),
+        },
+        "peak_rss_mb": peak_rss_mb(),
+        # 固定种子下所有生成结果的摘要，结果变化说明生成参数或后处理发生了变化
+        "output_digest": hashlib.sha1("".join(r["digest"] for r in results).encode()).hexdigest()[:12],
+        "cases": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for group, summary in report["summary"].items():
+        print(f"{group}: {summary['requests']} 个请求，延迟 p50 {summary['latency_p50']:.3f} 秒 / "
+              f"p95 {summary['latency_p95']:.3f} 秒，{summary['tokens_per_second']:.1f} tokens/秒，"
+              f"后处理 {summary['postprocess_seconds'] * 1000:.1f} 毫秒")
+    print(f"内存峰值 {report['peak_rss_mb']:.0f} MB，结果摘要 {report['output_digest']}，已保存到 {args.output}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# 基准测试：多进程工作池从1个进程扩展到N个进程时的吞吐量
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from worker_pool import WorkerPool, split_cores
+
+PROMPTS = [
+    "请根据以下关键词生成一个奇幻风格的完整故事：公主,城堡,龙\n故事内容：",
+    "请根据以下关键词创作一首优美的现代诗：春天,花朵,希望\n诗歌内容：",
+    "请根据以下关键词创作一首古体诗：月光,思念\n诗歌内容：",
+    "请根据以下关键词创作一首简单易懂的儿歌：星辰,梦想\n诗歌内容：",
+]
+
+
+def run_clients(pool, num_requests, concurrency, params):
+    """模拟多个用户同时提交请求，返回总耗时"""
+    def call(i):
+        return "".join(pool.stream(PROMPTS[i % len(PROMPTS)], **params))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, range(num_requests)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程工作池扩展性基准测试")
+    parser.add_argument("--max-workers", type=int, default=len(split_cores(1)[0]))
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    params = dict(
+        max_new_tokens=args.max_new_tokens,
+        temperature=0.8,
+        top_p=0.9,
+        repetition_penalty=1.1,
+        no_repeat_ngram_size=2,
+        do_sample=True
+    )
+    counts = sorted({1, 2, 4, args.max_workers} & set(range(1, args.max_workers + 1)))
+    baseline = None
+    for num_workers in counts:
+        pool = WorkerPool(num_workers).start()
+        pool.wait_ready()
+        # 预热
+        run_clients(pool, num_workers, num_workers, params)
+        elapsed = run_clients(pool, args.requests, args.concurrency, params)
+        pool.shutdown()
+        throughput = args.requests / elapsed
+        baseline = baseline or throughput
+        print(f"{num_workers} 个工作进程: {args.requests} 个请求耗时 {elapsed:.2f} 秒，"
+              f"吞吐量 {throughput:.2f} 请求/秒，约 {throughput * args.max_new_tokens:.1f} tokens/秒，"
+              f"相对单进程 {throughput / baseline:.2f}x，分发 {pool.stats['dispatched']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# 多候选生成的重排序：一次批量生成多首诗歌，按模型概率、关键词覆盖、重复程度、行数和押韵打分，
+# 返回得分最高的一首，其余作为备选保留，切换时无需重新生成
+import math
+import os
+import re
+
+from postprocess import POEM_SPLIT_CHARS
+
+# 界面中“候选数量”的上限
+POEM_MAX_CANDIDATES = int(os.environ.get("POEM_MAX_CANDIDATES", "5"))
+# 各项得分的权重（每项得分都在0到1之间）
+CANDIDATE_WEIGHTS = {"logprob": 1.0, "keywords": 1.0, "repetition": 1.0, "lines": 1.0, "rhyme": 1.0}
+RHYME_MODES = ["不要求", "押韵", "严格押韵", "偶句押韵"]
+
+# 与按行数提前结束的计数方式一致：换行和行尾标点都算一行的结束
+_LINE_SPLIT = re.compile(f'[{POEM_SPLIT_CHARS}\n]+')
+_PUNCTUATION = re.compile(r'[\s，。！？；：、“”‘’…,.!?;:]+')
+
+_pinyin = None
+
+
+def _load_pinyin():
+    """押韵检查需要 pypinyin（可选依赖），未安装时跳过押韵评分"""
+    global _pinyin
+    if _pinyin is None:
+        try:
+            from pypinyin import Style, lazy_pinyin
+            _pinyin = lambda char: lazy_pinyin(char, style=Style.FINALS)[0]
+        except ImportError:
+            print("未安装 pypinyin，多候选重排序时跳过押韵评分（pip install pypinyin）")
+            _pinyin = False
+    return _pinyin
+
+
+def split_lines(text):
+    return [line for line in (part.strip() for part in _LINE_SPLIT.split(text)) if line]
+
+
+def keyword_score(text, keywords):
+    """关键词覆盖率"""
+    words = [w.strip() for w in keywords.replace('，', ',').split(',') if w.strip()]
+    if not words:
+        return 1.0
+    return sum(1 for w in words if w in text) / len(words)
+
+
+def repetition_score(text):
+    """不重复的字二元组占比，越接近1重复越少"""
+    chars = _PUNCTUATION.sub('', text)
+    if len(chars) < 2:
+        return 0.0
+    bigrams = [chars[i:i + 2] for i in range(len(chars) - 1)]
+    return len(set(bigrams)) / len(bigrams)
+
+
+def line_score(lines, target):
+    """行数与要求的接近程度"""
+    if target <= 0:
+        return 1.0
+    return max(0.0, 1.0 - abs(len(lines) - target) / target)
+
+
+def _rhyme_key(final, strict):
+    # 宽松押韵忽略韵头（i/u/ü），如 ang/iang/uang 视为同韵
+    if strict or len(final) < 2:
+        return final
+    return final.lstrip('iuv') or final
+
+
+def rhyme_score(lines, mode):
+    """押韵程度：韵脚与最常见韵母相同的行所占比例；不要求押韵或无法判断时返回 None"""
+    if mode not in RHYME_MODES[1:] or len(lines) < 2:
+        return None
+    pinyin = _load_pinyin()
+    if not pinyin:
+        return None
+    if mode == "偶句押韵":
+        lines = lines[1::2]
+    keys = [_rhyme_key(pinyin(line[-1]), mode == "严格押韵") for line in lines]
+    if not keys:
+        return None
+    return max(keys.count(key) for key in set(keys)) / len(keys)
+
+
+def score_candidate(text, logprob, num_tokens, keywords, target_lines, rhyme="不要求"):
+    """计算单个候选的各项得分，返回 (总分, 各项得分)"""
+    lines = split_lines(text)
+    details = {
+        # 平均每个token的概率（几何平均），与长度无关
+        "logprob": math.exp(logprob / num_tokens) if num_tokens else 0.0,
+        "keywords": keyword_score(text, keywords),
+        "repetition": repetition_score(text),
+        "lines": line_score(lines, target_lines),
+    }
+    rhyme_value = rhyme_score(lines, rhyme)
+    if rhyme_value is not None:
+        details["rhyme"] = rhyme_value
+    total = sum(CANDIDATE_WEIGHTS[name] * value for name, value in details.items())
+    weight = sum(CANDIDATE_WEIGHTS[name] for name in details)
+    return total / weight, details
+
+
+def rank_candidates(candidates, keywords, target_lines, rhyme="不要求"):
+    """candidates 为 (文本, 对数概率, token数) 列表，返回按总分从高到低排序的
+    [{"text", "score", "details"}]，空文本排在最后"""
+    ranked = []
+    for text, logprob, num_tokens in candidates:
+        score, details = score_candidate(text, logprob, num_tokens, keywords, target_lines, rhyme)
+        ranked.append({"text": text, "score": score if text.strip() else -1.0, "details": details})
+    ranked.sort(key=lambda item: item["score"], reverse=True)
+    return ranked
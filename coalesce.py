@@ -0,0 +1,193 @@
+# 相同请求合并（single-flight）：多个用户同时提交相同的关键词/主题/长度时合并模型调用，
+# 后到的请求接入正在进行的生成，从头重放已生成的内容；采样的相同请求接入后得到同一篇作品（可以关闭）
+import os
+import threading
+
+from metrics import registry
+from streaming import CancelToken
+
+# 是否合并相同的进行中请求（默认开启）
+COALESCE_ENABLED = os.environ.get("COALESCE", "1") == "1"
+# 采样的相同请求是否也合并（默认开启）：开启时同时提交相同请求的用户得到同一篇作品；
+# 关闭时采样请求各自生成、每个用户得到不同的作品，只合并贪心解码（结果确定）的请求
+COALESCE_SAMPLED = os.environ.get("COALESCE_SAMPLED", "1") == "1"
+
+COALESCED = registry.counter("generation_coalesced_total", "合并到进行中的生成而节省的模型调用次数",
+                             ("kind", "mode"))
+
+
+class _Source:
+    """一个底层流（TokenStreamer 或 RemoteStream）：后台线程读取增量文本并保存，供多个订阅者从头重放"""
+
+    def __init__(self, stream, on_done):
+        self.stream = stream
+        self.deltas = []
+        self.done = False
+        self.error = None
+        self._on_done = on_done
+        self._cond = threading.Condition()
+
+    def start(self):
+        threading.Thread(target=self._pump, name="coalesce-pump", daemon=True).start()
+
+    def _pump(self):
+        try:
+            for delta in self.stream:
+                with self._cond:
+                    self.deltas.append(delta)
+                    self._cond.notify_all()
+        except Exception as e:
+            self.error = e
+        with self._cond:
+            self.done = True
+            self._cond.notify_all()
+        self._on_done(self)
+
+    def wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def read(self, start, cancel):
+        """等待第 start 个之后的增量文本，返回 (新增文本列表, 是否结束)"""
+        with self._cond:
+            while len(self.deltas) <= start and not self.done and not cancel.cancelled:
+                self._cond.wait()
+            return self.deltas[start:], self.done
+
+
+class CoalescedStream:
+    """订阅者看到的流式结果，接口与 TokenStreamer 相同；shared 为 True 表示接入了其他请求的生成"""
+
+    def __init__(self, release, source, cancel, shared):
+        self._release = release
+        self._source = source
+        self._cancel = cancel
+        self.shared = shared
+        self.text = ""
+        self._left = False
+        cancel.on_cancel(self._leave)
+
+    def _leave(self):
+        if not self._left:
+            self._left = True
+            self._release()
+        self._source.wake()
+
+    def __iter__(self):
+        index = 0
+        while not self._cancel.cancelled:
+            deltas, done = self._source.read(index, self._cancel)
+            index += len(deltas)
+            for delta in deltas:
+                self.text += delta
+                yield delta
+            if done:
+                if self._source.error is not None and not self._cancel.cancelled:
+                    raise self._source.error
+                break
+        if not self._left:
+            self._left = True
+            self._release()
+
+    # 生成结束后的统计信息来自底层流
+    @property
+    def timings(self):
+        return self._source.stream.timings
+
+    @property
+    def num_tokens(self):
+        return self._source.stream.num_tokens
+
+    @property
+    def prompt_tokens(self):
+        return self._source.stream.prompt_tokens
+
+    @property
+    def logprob(self):
+        return self._source.stream.logprob
+
+    @property
+    def quality(self):
+        return self._source.stream.quality
+
+    @property
+    def ttft(self):
+        return self._source.stream.ttft
+
+
+class _Flight:
+    """一次进行中的生成及其订阅者数量"""
+
+    def __init__(self, key, cancel):
+        self.key = key
+        self.cancel = cancel
+        self.source = None
+        self.subscribers = 0
+
+
+class SingleFlight:
+    """按规范化的请求键合并进行中的生成；share_sampled 为 False 时采样请求不合并"""
+
+    def __init__(self, share_sampled=COALESCE_SAMPLED):
+        self.share_sampled = share_sampled
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.stats = {"flights": 0, "attached": 0}
+
+    def _close(self, flight):
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def _leave(self, flight):
+        # 所有订阅者都已离开（读完、取消或断开）时停止仍在进行的解码，后续相同请求重新生成
+        with self._lock:
+            flight.subscribers -= 1
+            abandoned = flight.subscribers <= 0
+            if abandoned and self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        if abandoned and not flight.source.done:
+            flight.cancel.cancel()
+
+    def stream(self, key, engine, prompt, cancel=None, kind="", **params):
+        """返回 CoalescedStream：相同的请求正在生成时接入，否则提交新的生成；
+        不合并采样请求时，采样请求直接返回 engine.stream 的结果"""
+        cancel = cancel or CancelToken()
+        greedy = not params.get("do_sample", True)
+        if not greedy and not self.share_sampled:
+            return engine.stream(prompt, cancel=cancel, **params)
+        with self._lock:
+            flight = self._flights.get(key)
+            shared = flight is not None
+            if flight is None:
+                flight = _Flight(key, CancelToken())
+                stream = engine.stream(prompt, cancel=flight.cancel, **params)
+                flight.source = _Source(stream, lambda source: self._close(flight))
+                flight.source.start()
+                self._flights[key] = flight
+                self.stats["flights"] += 1
+            else:
+                self.stats["attached"] += 1
+            flight.subscribers += 1
+        if shared:
+            COALESCED.inc(kind, "greedy" if greedy else "sampled")
+        return CoalescedStream(lambda: self._leave(flight), flight.source, cancel, shared)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    """返回全局的请求合并器，未启用时返回 None"""
+    global _single_flight
+    if not COALESCE_ENABLED:
+        return None
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight()
+        return _single_flight
@@ -0,0 +1,60 @@
+# 收藏作品存储：SQLite（WAL模式，与历史记录同一个数据库），按用户分区，每条收藏有固定的id，
+# 收藏和取消收藏只写入一行，并在同一个事务中更新搜索索引
+import threading
+
+from history_store import HISTORY_DB, DEFAULT_USER, WorkStore
+
+# 旧版JSON收藏文件，首次打开数据库时自动迁移
+LEGACY_FAVORITES_FILES = ("favorite_works.json", "favorites.json")
+
+
+class FavoritesStore(WorkStore):
+    """收藏的持久化存储，收藏的id在取消其他收藏后保持不变，写入由SQLite事务保证原子性"""
+
+    table = "favorites"
+    source = "favorite"
+    # 首次使用或索引格式变化时重建（同时清除旧版按列表位置建立的收藏索引）
+    index_version_key = "favorites_index_version"
+    label = "收藏"
+
+    def __init__(self, path=HISTORY_DB, legacy_files=LEGACY_FAVORITES_FILES):
+        super().__init__(path, legacy_files)
+
+    def remove(self, item_id, user_id=DEFAULT_USER):
+        """取消收藏，只能删除自己的收藏；返回是否删除了记录"""
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute("DELETE FROM favorites WHERE id = ? AND user_id = ?", (item_id, user_id))
+            if cursor.rowcount:
+                self.search_index.remove(conn, "favorite", item_id)
+        return cursor.rowcount > 0
+
+    def _legacy_item(self, item):
+        # 旧版收藏可能是 [标题, 内容, 类型] 形式
+        if isinstance(item, (list, tuple)):
+            item = dict(zip(("title", "content", "type"), item))
+        return super()._legacy_item(item)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_favorites_store():
+    """返回全局收藏存储（首次调用时创建数据库）"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = FavoritesStore()
+        return _store
+
+
+# 分页读取收藏
+def load_favorites_page(user_id, page):
+    """返回 (Dataset样本, 收藏id列表, 实际页码, 页码说明)"""
+    store = get_favorites_store()
+    total_pages = store.page_count(user_id)
+    page = min(max(1, int(page)), total_pages)
+    items = store.page(user_id, page)
+    samples = [[item.get("title", ""), item.get("content", ""), item.get("type", "")] for item in items]
+    return samples, [item["id"] for item in items], page, f"第 {page} / {total_pages} 页"
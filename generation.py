@@ -0,0 +1,323 @@
+# 生成流程：查询缓存、等待模型、提交到批处理调度器（或多进程工作池）并增量后处理
+# 导入本模块不会加载模型，模型在后台加载或首次生成时才加载
+import time
+
+from model_manager import model_manager, ModelNotReadyError
+from batching import get_scheduler
+from result_cache import get_result_cache, make_cache_key
+from semantic_cache import get_semantic_cache
+from worker_pool import WorkerPool
+from metrics import RequestTrace
+from streaming import CancelToken
+from coalesce import get_single_flight
+from quality_guard import record_quality
+from long_story import ChunkedStoryStream, StoryOutline, is_long_story, story_variant
+from postprocess import StoryStreamFormatter, PoemStreamFormatter
+from candidates import rank_candidates, POEM_MAX_CANDIDATES
+from prompts import (POEM_LINE_END_CHARS, STORY_SENTENCE_END_CHARS, STORY_SOFT_LIMIT, poem_token_budget,
+                     story_prompt_prefix, poem_prompt_prefix, build_story_prompt, build_poem_prompt,
+                     template_prefixes)
+
+
+def get_engine(generator):
+    """返回接收生成请求的对象：多进程模式下为工作池，否则为当前进程的批处理调度器"""
+    if isinstance(generator, WorkerPool):
+        return generator
+    return get_scheduler(generator)
+
+
+def _warm_prefix_cache(generator):
+    # 模型加载完成后创建批处理调度器，并预先计算所有模板前缀的KV缓存
+    if isinstance(generator, WorkerPool):
+        generator.warm_prefixes(template_prefixes())
+        return
+    scheduler = get_scheduler(generator)
+    if scheduler.prefix_cache is not None:
+        scheduler.prefix_cache.warm(template_prefixes())
+
+
+model_manager.add_ready_callback(_warm_prefix_cache)
+
+
+def _stream_generation(prompt, formatter, error_prefix, trace, cache_key=None, cancel=None, usage=None,
+                       retrieval=None, outline=None, **params):
+    """流式生成的公共流程：查询缓存、等待模型、提交请求、增量后处理并逐步返回文本
+
+    cancel（CancelToken）被取消时停止解码，返回已生成的部分。
+    usage（dict）用于统计：生成结束后填入 prompt_tokens 和 generated_tokens，命中缓存时不填。
+    retrieval 为 (类型, 关键词, 主题/诗歌类型, 长度/行数)，用于近似请求检索。
+    outline（StoryOutline）不为空时按长篇故事分段生成，不参与相同请求合并。
+    """
+    # 启用结果缓存时，命中则直接返回缓存的作品
+    cache = get_result_cache()
+    if cache is not None and cache_key is not None:
+        with trace.stage("cache_lookup"):
+            cached = cache.get(cache_key)
+        if cached is not None:
+            trace.finish("cache_hit")
+            yield cached
+            return
+
+    # 启用近似请求检索时，关键词相近（如顺序不同）且长度相符的已有作品直接返回
+    semantic = get_semantic_cache() if retrieval is not None else None
+    if semantic is not None:
+        with trace.stage("semantic_lookup"):
+            found = semantic.lookup(*retrieval)
+        if found is not None:
+            trace.finish("semantic_hit")
+            yield found
+            return
+    
+    # 等待模型就绪（后台加载或首次请求时加载）
+    request_start = time.perf_counter()
+    try:
+        with trace.stage("model_wait"):
+            generator = model_manager.get_generator()
+    except ModelNotReadyError as e:
+        trace.finish("not_ready")
+        yield str(e)
+        return
+    wait_seconds = time.perf_counter() - request_start
+    
+    # 调用方不再读取结果（如客户端断开）时也要停止解码
+    cancel = cancel or CancelToken()
+    streamer = None
+    finished = False
+    try:
+        # 通过批处理调度器（或多进程工作池）生成，与其他并发请求合并为一次批量计算；
+        # 相同的请求正在生成时直接接入，不再调用一次模型
+        engine = get_engine(generator)
+        flights = get_single_flight() if cache_key is not None and outline is None else None
+        if outline is not None:
+            streamer = ChunkedStoryStream(engine, outline, cancel=cancel, **params)
+        elif flights is not None:
+            streamer = flights.stream(cache_key, engine, prompt, cancel=cancel, kind=trace.kind, **params)
+        else:
+            streamer = engine.stream(prompt, cancel=cancel, **params)
+        first_token_seconds = None
+        for delta in streamer:
+            if first_token_seconds is None:
+                first_token_seconds = time.perf_counter() - request_start
+            with trace.stage("postprocess"):
+                text = formatter.feed(delta)
+            yield text
+        with trace.stage("postprocess"):
+            result = formatter.finish()
+        finished = True
+    except Exception as e:
+        if streamer is not None:
+            trace.update(streamer.timings)
+        trace.finish("error", error=e)
+        yield f"{error_prefix}: {e}"
+        return
+    finally:
+        if not finished:
+            cancel.cancel()
+    # 排队、分词、预填充、解码的耗时由批处理调度器记录；接入其他请求的生成时这些耗时和token数不重复统计
+    shared = getattr(streamer, "shared", False)
+    if not shared:
+        trace.update(streamer.timings)
+        # 退化检测的纠偏/提前结束次数和节省的token数
+        record_quality(trace.kind, streamer.quality)
+        if streamer.quality:
+            trace.info["quality"] = streamer.quality
+    if outline is not None:
+        trace.info["segments"] = streamer.segments
+        trace.info["max_context"] = streamer.max_context
+    if usage is not None:
+        usage["prompt_tokens"] = streamer.prompt_tokens
+        usage["generated_tokens"] = streamer.num_tokens
+    if cancel.cancelled:
+        # 被取消的结果不完整，不写入结果缓存
+        trace.finish("cancelled", tokens=0 if shared else streamer.num_tokens, ttft=first_token_seconds)
+        yield result
+        return
+    if shared:
+        trace.finish("coalesced", ttft=first_token_seconds)
+    else:
+        trace.finish(tokens=streamer.num_tokens, ttft=first_token_seconds)
+    model_manager.record_request(wait_seconds, first_token_seconds, time.perf_counter() - request_start)
+    # 共享的结果已由发起生成的请求写入缓存
+    if cache is not None and cache_key is not None and not shared:
+        cache.put(cache_key, result)
+    # 退化后提前结束的作品不用于近似检索
+    if semantic is not None and not shared and not (streamer.quality and streamer.quality["aborted"]):
+        semantic.add(retrieval[0], retrieval[1], retrieval[2], result)
+    yield result
+
+
+# 流式生成故事，逐步返回当前已生成的文本；style（写作风格）和 character（主要角色）用于长篇分段生成
+def generate_story_stream(keywords, genre, max_length=200, temperature=0.7, cancel=None, usage=None,
+                          style=None, character=None):
+    # 统一处理关键词分隔符，支持中文逗号和英文逗号
+    keywords = keywords.replace('，', ',').strip()
+    character = (character or "").strip()
+    
+    # 检测是否包含英文关键词
+    if any(ord(c) < 128 and c.isalpha() for c in keywords):
+        yield "请使用中文关键词，生成英文故事暂不支持。"
+        return
+    
+    max_length = int(max_length)
+    # 超过单次上下文能容纳的长度时分段生成，写作风格和主要角色只用于分段生成的prompt
+    long = is_long_story(max_length)
+    trace = RequestTrace("story", keywords=keywords, genre=genre, max_length=max_length, long=long)
+    with trace.stage("prompt_build"):
+        outline = StoryOutline(keywords, genre, style, character) if long else None
+        prompt = outline.prompt() if long else build_story_prompt(keywords, genre)
+    variant = story_variant(genre, style, character, max_length)
+    yield from _stream_generation(
+        prompt,
+        StoryStreamFormatter(),
+        "生成故事时出错",
+        trace,
+        cancel=cancel,
+        usage=usage,
+        prefix=story_prompt_prefix(genre),
+        cache_key=make_cache_key("故事", keywords, variant, max_length, temperature),
+        retrieval=("story", keywords, variant, max_length),
+        outline=outline,
+        max_new_tokens=max_length,
+        # 用完大部分长度后在句末结束，避免截断在句子中间
+        stop_chars=STORY_SENTENCE_END_CHARS,
+        stop_after_tokens=int(max_length * STORY_SOFT_LIMIT),
+        temperature=temperature,
+        top_p=0.9,
+        repetition_penalty=1.1,
+        do_sample=True,
+        # 添加更多生成参数，减少编号生成
+        no_repeat_ngram_size=2  # 避免重复
+    )
+
+
+# 流式生成诗歌，逐步返回当前已生成的文本
+def generate_poem_stream(keywords, style="现代诗", lines=12, temperature=0.8, cancel=None, usage=None):
+    # 统一处理关键词分隔符，支持中文逗号和英文逗号
+    keywords = keywords.replace('，', ',').strip()
+    lines = int(lines)
+    
+    trace = RequestTrace("poem", keywords=keywords, style=style, lines=lines)
+    with trace.stage("prompt_build"):
+        prompt = build_poem_prompt(keywords, style)
+    yield from _stream_generation(
+        prompt,
+        PoemStreamFormatter(style),
+        "生成诗歌时出错",
+        trace,
+        cancel=cancel,
+        usage=usage,
+        cache_key=make_cache_key("诗歌", keywords, style, lines, temperature),
+        retrieval=("poem", keywords, style, lines),
+        **_poem_params(style, lines, temperature)
+    )
+
+
+def _poem_params(style, lines, temperature):
+    return dict(
+        prefix=poem_prompt_prefix(style),
+        # 生成长度由行数决定，写满要求的行数即结束
+        max_new_tokens=poem_token_budget(style, lines),
+        stop_chars=POEM_LINE_END_CHARS,
+        max_lines=lines,
+        temperature=temperature,
+        top_p=0.95,  # 增加多样性
+        repetition_penalty=1.3,  # 减少重复
+        do_sample=True,
+        no_repeat_ngram_size=3  # 避免重复短语
+    )
+
+
+def _stream_candidates(prompt, style, trace, n, rank, cancel=None, usage=None, **params):
+    """多候选生成：n 个请求作为一组在同一批次中生成（prompt只预填充一次），生成过程中展示第一个候选，
+    结束后用 rank 对 [(文本, 对数概率, token数)] 重排序，逐步返回 (文本, 排序后的候选列表)"""
+    request_start = time.perf_counter()
+    try:
+        with trace.stage("model_wait"):
+            generator = model_manager.get_generator()
+    except ModelNotReadyError as e:
+        trace.finish("not_ready")
+        yield str(e), []
+        return
+    wait_seconds = time.perf_counter() - request_start
+
+    cancel = cancel or CancelToken()
+    formatters = [PoemStreamFormatter(style) for _ in range(n)]
+    streamers = []
+    finished = False
+    try:
+        streamers = get_engine(generator).stream_many(prompt, n, cancel=cancel, score=True, **params)
+        first_token_seconds = None
+        # 所有候选在同一批次中同时生成，依次读取不会拖慢生成
+        for index, (streamer, formatter) in enumerate(zip(streamers, formatters)):
+            for delta in streamer:
+                if first_token_seconds is None:
+                    first_token_seconds = time.perf_counter() - request_start
+                with trace.stage("postprocess"):
+                    text = formatter.feed(delta)
+                if index == 0:
+                    yield text, []
+        with trace.stage("rerank"):
+            texts = [formatter.finish() for formatter in formatters]
+            ranked = rank([(text, s.logprob, s.num_tokens) for text, s in zip(texts, streamers)])
+        finished = True
+    except Exception as e:
+        if streamers:
+            trace.update(streamers[0].timings)
+        trace.finish("error", error=e)
+        yield f"生成诗歌时出错: {e}", []
+        return
+    finally:
+        if not finished:
+            cancel.cancel()
+    trace.update(streamers[0].timings)
+    for streamer in streamers:
+        record_quality(trace.kind, streamer.quality)
+    tokens = sum(s.num_tokens for s in streamers)
+    if usage is not None:
+        usage["prompt_tokens"] = sum(s.prompt_tokens for s in streamers)
+        usage["generated_tokens"] = tokens
+    if cancel.cancelled:
+        trace.finish("cancelled", tokens=tokens, ttft=first_token_seconds)
+    else:
+        trace.finish(tokens=tokens, ttft=first_token_seconds)
+        model_manager.record_request(wait_seconds, first_token_seconds, time.perf_counter() - request_start)
+    yield ranked[0]["text"], ranked
+
+
+# 一次生成多首诗歌并重排序，逐步返回 (文本, 候选列表)；候选列表在生成结束后才非空，
+# 按得分从高到低排列，第一个即返回的文本。多候选结果不写入结果缓存
+def generate_poem_candidates_stream(keywords, style="现代诗", lines=12, temperature=0.8, rhyme="不要求",
+                                    n=3, cancel=None, usage=None):
+    keywords = keywords.replace('，', ',').strip()
+    lines = int(lines)
+    n = max(1, min(int(n), POEM_MAX_CANDIDATES))
+
+    trace = RequestTrace("poem", keywords=keywords, style=style, lines=lines, candidates=n, rhyme=rhyme)
+    with trace.stage("prompt_build"):
+        prompt = build_poem_prompt(keywords, style)
+    yield from _stream_candidates(
+        prompt,
+        style,
+        trace,
+        n,
+        lambda candidates: rank_candidates(candidates, keywords, lines, rhyme),
+        cancel=cancel,
+        usage=usage,
+        **_poem_params(style, lines, temperature)
+    )
+
+
+# 生成故事
+def generate_story(keywords, genre, max_length=200, temperature=0.7, usage=None, style=None, character=None):
+    story = ""
+    for story in generate_story_stream(keywords, genre, max_length, temperature, usage=usage,
+                                       style=style, character=character):
+        pass
+    return story
+
+# 生成诗歌
+def generate_poem(keywords, style="现代诗", lines=12, temperature=0.8, usage=None):
+    poem = ""
+    for poem in generate_poem_stream(keywords, style, lines, temperature, usage=usage):
+        pass
+    return poem
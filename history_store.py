@@ -0,0 +1,293 @@
+# 历史记录存储：SQLite（WAL模式），按用户分区，支持分页读取和保留条数限制
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import stage_timer
+from search_index import INDEX_VERSION, SearchIndex, make_snippet
+
+# 数据库文件、每个用户保留的记录条数、每页条数
+HISTORY_DB = os.environ.get("HISTORY_DB", "generation_history.db")
+HISTORY_RETENTION = int(os.environ.get("HISTORY_RETENTION", "50"))
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", "10"))
+# 旧版JSON历史记录文件，首次打开数据库时自动迁移
+LEGACY_HISTORY_FILE = "generation_history.json"
+
+DEFAULT_USER = "default"
+
+# 单独存储为列的字段，其余字段放入 extra（JSON）
+_COLUMNS = ("title", "content", "type", "timestamp", "keywords", "genre", "style")
+
+
+class WorkStore:
+    """作品（历史记录、收藏）的SQLite存储基类，每个线程使用独立的数据库连接，按用户分区
+
+    子类指定表名（table）、搜索索引中的来源名（source）、索引版本在 meta 表中的键名和显示名称。
+    """
+
+    table = None
+    source = None
+    index_version_key = None
+    label = "作品"
+
+    def __init__(self, path=HISTORY_DB, legacy_files=()):
+        self.path = path
+        self._local = threading.local()
+        self._init_schema()
+        # 全文索引与作品在同一个数据库中，写入作品时在同一个事务中更新
+        self.search_index = SearchIndex(self._connect)
+        self._ensure_index()
+        for legacy_file in legacy_files or ():
+            self.migrate_json(legacy_file)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        with conn:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    title TEXT,
+                    content TEXT,
+                    type TEXT,
+                    timestamp REAL,
+                    keywords TEXT,
+                    genre TEXT,
+                    style TEXT,
+                    extra TEXT
+                )
+            """)
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_user ON {self.table}(user_id, id)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _ensure_index(self):
+        # 没有索引（旧数据库）或索引格式变化时，为已有的作品重建索引
+        conn = self._connect()
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (self.index_version_key,)).fetchone()
+        if row is not None and row[0] == INDEX_VERSION:
+            return
+        with conn:
+            self.search_index.remove_where(conn, self.source, "1", ())
+            rows = conn.execute(f"SELECT * FROM {self.table}").fetchall()
+            for row in rows:
+                self.search_index.add(conn, self.source, row["id"], row["user_id"], self._to_item(row))
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                         (self.index_version_key, INDEX_VERSION))
+        if rows:
+            print(f"已为 {len(rows)} 条{self.label}建立搜索索引")
+
+    @staticmethod
+    def _to_item(row):
+        item = {key: row[key] for key in _COLUMNS if row[key] is not None}
+        if row["extra"]:
+            item.update(json.loads(row["extra"]))
+        item["id"] = row["id"]
+        return item
+
+    def _insert(self, conn, item, user_id):
+        """在调用方的事务中写入一条作品并更新搜索索引，返回新作品的id"""
+        values = [item.get(key) for key in _COLUMNS]
+        extra = {k: v for k, v in item.items() if k not in _COLUMNS and k != "id"}
+        cursor = conn.execute(
+            f"INSERT INTO {self.table} (user_id, title, content, type, timestamp, keywords, genre, style, extra) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [user_id] + values + [json.dumps(extra, ensure_ascii=False) if extra else None]
+        )
+        self.search_index.add(conn, self.source, cursor.lastrowid, user_id, item)
+        return cursor.lastrowid
+
+    def add(self, item, user_id=DEFAULT_USER):
+        """添加一条作品，返回它的id"""
+        conn = self._connect()
+        with conn:
+            return self._insert(conn, item, user_id)
+
+    def get(self, item_id, user_id=DEFAULT_USER):
+        row = self._connect().execute(
+            f"SELECT * FROM {self.table} WHERE id = ? AND user_id = ?", (item_id, user_id)
+        ).fetchone()
+        return self._to_item(row) if row else None
+
+    def page(self, user_id=DEFAULT_USER, page=1, page_size=HISTORY_PAGE_SIZE):
+        """按时间倒序返回某一页的作品，page 从1开始"""
+        offset = (max(1, int(page)) - 1) * page_size
+        rows = self._connect().execute(
+            f"SELECT * FROM {self.table} WHERE user_id = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+            (user_id, page_size, offset)
+        ).fetchall()
+        return [self._to_item(row) for row in rows]
+
+    def count(self, user_id=DEFAULT_USER):
+        return self._connect().execute(
+            f"SELECT COUNT(*) FROM {self.table} WHERE user_id = ?", (user_id,)
+        ).fetchone()[0]
+
+    def page_count(self, user_id=DEFAULT_USER, page_size=HISTORY_PAGE_SIZE):
+        return max(1, -(-self.count(user_id) // page_size))
+
+    def iter_works(self, limit=None):
+        """按时间倒序遍历所有用户的作品（至多 limit 条），用于建立索引等离线处理"""
+        rows = self._connect().execute(
+            f"SELECT * FROM {self.table} ORDER BY id DESC LIMIT ?", (-1 if limit is None else int(limit),)
+        )
+        for row in rows:
+            yield self._to_item(row)
+
+    def _legacy_item(self, item):
+        """把旧版JSON中的一条作品转换为 add 接受的字典，子类可补充各自的旧格式"""
+        item = dict(item)
+        item.pop("id", None)
+        # 旧版的时间戳可能是日期字符串
+        if isinstance(item.get("timestamp"), str):
+            item["date"] = item.pop("timestamp")
+        return item
+
+    def migrate_json(self, path, user_id=DEFAULT_USER):
+        """把旧版JSON格式的作品导入数据库（每个文件只执行一次），返回导入条数"""
+        conn = self._connect()
+        marker = f"migrated:{os.path.abspath(path)}"
+        if conn.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+            return 0
+        items = []
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    items = json.load(f)
+            except Exception as e:
+                print(f"读取旧版{self.label}失败: {e}")
+                return 0
+        # 所有作品和迁移标记在同一个事务中写入：中途失败时全部回滚，下次启动重新迁移而不会重复导入
+        with conn:
+            for item in items:
+                self._insert(conn, self._legacy_item(item), user_id)
+            conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (marker, str(time.time())))
+        if items:
+            print(f"已将 {len(items)} 条旧版{self.label}迁移到 {self.path}")
+        return len(items)
+
+
+class HistoryStore(WorkStore):
+    """生成历史的持久化存储，每个用户只保留最近 retention 条"""
+
+    table = "history"
+    source = "history"
+    index_version_key = "search_index_version"
+    label = "历史记录"
+
+    def __init__(self, path=HISTORY_DB, retention=HISTORY_RETENTION, legacy_file=LEGACY_HISTORY_FILE):
+        self.retention = retention
+        super().__init__(path, (legacy_file,) if legacy_file else ())
+
+    def _insert(self, conn, item, user_id):
+        """追加一条记录并按保留条数清理该用户最旧的记录，返回新记录的id"""
+        item_id = super()._insert(conn, item, user_id)
+        if self.retention > 0:
+            self.search_index.remove_where(
+                conn, "history",
+                "user_id = ? AND doc_id <= ("
+                "SELECT id FROM history WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (user_id, user_id, self.retention)
+            )
+            conn.execute(
+                "DELETE FROM history WHERE user_id = ? AND id <= ("
+                "SELECT id FROM history WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (user_id, user_id, self.retention)
+            )
+        return item_id
+
+    def clear(self, user_id=DEFAULT_USER):
+        conn = self._connect()
+        with conn:
+            self.search_index.remove_where(conn, "history", "user_id = ?", (user_id,))
+            conn.execute("DELETE FROM history WHERE user_id = ?", (user_id,))
+
+    def search(self, user_id, query, page=1, page_size=HISTORY_PAGE_SIZE, sources=None):
+        """按相关度分页搜索某个用户的作品（收藏与历史记录在同一个数据库中，共用索引），
+        返回 ([(来源, id)], 命中总数)，来源为 history 或 favorite"""
+        offset = (max(1, int(page)) - 1) * page_size
+        return self.search_index.search(user_id, query, page_size, offset, sources)
+
+    def _legacy_item(self, item):
+        item = super()._legacy_item(item)
+        # 旧记录可能没有标题
+        item.setdefault("title", f"{item.get('type', '作品')}_{item.get('date', '')}")
+        return item
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """返回全局历史记录存储（首次调用时创建数据库）"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore()
+        return _store
+
+
+# 获取当前用户，历史记录按用户分区；未登录时所有人共用默认分区
+def get_user_id(request):
+    if request is not None and getattr(request, "username", None):
+        return request.username
+    return DEFAULT_USER
+
+
+# 保存一条历史记录
+def save_history_item(item, user_id=DEFAULT_USER):
+    kind = "story" if item.get("type") == "故事" else "poem"
+    try:
+        with stage_timer(kind, "history_save"):
+            get_history_store().add(item, user_id)
+    except Exception as e:
+        print(f"保存历史记录失败: {e}")
+
+
+# 分页读取历史记录
+def load_history_page(user_id, page):
+    """返回 (Dataset样本, 记录id列表, 实际页码, 页码说明)"""
+    store = get_history_store()
+    total_pages = store.page_count(user_id)
+    page = min(max(1, int(page)), total_pages)
+    items = store.page(user_id, page)
+    samples = [[item.get("title", ""), item.get("content", ""), item.get("type", "")] for item in items]
+    return samples, [item["id"] for item in items], page, f"第 {page} / {total_pages} 页"
+
+
+# 按关键词搜索历史记录和收藏
+def search_works_page(user_id, query, page):
+    """返回 (Dataset样本, [[来源, id]], 实际页码, 说明)，样本的内容列为命中位置附近的片段"""
+    # 收藏存储依赖本模块，在函数内导入
+    from favorites_store import get_favorites_store
+    store = get_history_store()
+    hits, total = store.search(user_id, query, page)
+    total_pages = max(1, -(-total // HISTORY_PAGE_SIZE))
+    if int(page) > total_pages:
+        page = total_pages
+        hits, total = store.search(user_id, query, page)
+    samples, refs = [], []
+    for source, doc_id in hits:
+        if source == "history":
+            item = store.get(doc_id, user_id)
+        else:
+            item = get_favorites_store().get(doc_id, user_id)
+        if not item:
+            continue
+        label = "收藏" if source == "favorite" else "历史"
+        samples.append([item.get("title", ""), make_snippet(item.get("content", ""), query),
+                        f"{item.get('type', '')}（{label}）"])
+        refs.append([source, doc_id])
+    return samples, refs, max(1, int(page)), f"找到 {total} 条，第 {max(1, int(page))} / {total_pages} 页"
@@ -0,0 +1,180 @@
+# 推理后端：PyTorch（默认）、动态int8量化的PyTorch、带KV缓存的ONNX Runtime
+import os
+import time
+from types import SimpleNamespace
+
+from prefix_cache import cache_to_layers
+
+# 通过环境变量选择推理后端：torch / int8 / onnx
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch")
+BACKENDS = ("torch", "int8", "onnx")
+# ONNX Runtime 的线程数，0 表示由 ONNX Runtime 自动决定
+ONNX_THREADS = int(os.environ.get("ONNX_THREADS", "0"))
+
+
+def _conv1d_to_linear(module):
+    """GPT2 的投影层是 Conv1D（权重为 [in, out]），替换为等价的 nn.Linear 才能被动态量化"""
+    import torch.nn as nn
+    from transformers.pytorch_utils import Conv1D
+
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            in_features, out_features = child.weight.shape
+            linear = nn.Linear(in_features, out_features)
+            linear.weight.data = child.weight.data.t().contiguous()
+            linear.bias.data = child.bias.data
+            setattr(module, name, linear)
+        else:
+            _conv1d_to_linear(child)
+    return module
+
+
+def quantize_int8(model):
+    """对所有线性层做动态int8量化（权重int8，激活在运行时量化），只能在CPU上运行"""
+    import torch
+
+    model = _conv1d_to_linear(model.to("cpu")).eval()
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _kv_names(num_layers, kind):
+    names = []
+    for i in range(num_layers):
+        names += [f"{kind}_key_{i}", f"{kind}_value_{i}"]
+    return names
+
+
+def export_onnx(model, path):
+    """把模型导出为带KV缓存输入输出的ONNX图（每层的 key/value 作为独立的输入输出）"""
+    import torch
+    from transformers import DynamicCache
+
+    config = model.config
+    num_layers = config.n_layer
+    head_dim = config.n_embd // config.n_head
+
+    class _Wrapper(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask, position_ids, *past):
+            cache = DynamicCache([(past[2 * i], past[2 * i + 1]) for i in range(num_layers)])
+            outputs = self.inner(input_ids=input_ids, attention_mask=attention_mask,
+                                 position_ids=position_ids, past_key_values=cache, use_cache=True)
+            present = []
+            for key, value in cache_to_layers(outputs.past_key_values):
+                present += [key, value]
+            return (outputs.logits, *present)
+
+    model = model.to("cpu").eval()
+    past_names = _kv_names(num_layers, "past")
+    present_names = _kv_names(num_layers, "present")
+    dynamic_axes = {
+        "input_ids": {0: "batch", 1: "sequence"},
+        "attention_mask": {0: "batch", 1: "total"},
+        "position_ids": {0: "batch", 1: "sequence"},
+        "logits": {0: "batch", 1: "sequence"},
+    }
+    for name in past_names:
+        dynamic_axes[name] = {0: "batch", 2: "past"}
+    for name in present_names:
+        dynamic_axes[name] = {0: "batch", 2: "total"}
+
+    # 用长度不为0的历史缓存导出，保证拼接KV的分支被记录下来
+    past = [torch.zeros(2, config.n_head, 3, head_dim) for _ in past_names]
+    example = (
+        torch.tensor([[1, 2], [3, 4]]),
+        torch.ones((2, 5), dtype=torch.long),
+        torch.tensor([[3, 4], [3, 4]]),
+        *past,
+    )
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    start = time.perf_counter()
+    with torch.no_grad():
+        torch.onnx.export(
+            _Wrapper(model),
+            example,
+            path,
+            input_names=["input_ids", "attention_mask", "position_ids"] + past_names,
+            output_names=["logits"] + present_names,
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            dynamo=False
+        )
+    # 导出过程会改变模块的训练状态，恢复为推理模式
+    model.eval()
+    print(f"ONNX模型导出完成: {path}（耗时 {time.perf_counter() - start:.1f} 秒）")
+
+
+class OnnxCausalLM:
+    """用 ONNX Runtime 执行的语言模型，调用方式与 transformers 模型的 forward 相同"""
+
+    def __init__(self, path, config):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_THREADS > 0:
+            options.intra_op_num_threads = ONNX_THREADS
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.config = config
+        self.device = "cpu"
+        self._past_names = _kv_names(config.n_layer, "past")
+        self._head_dim = config.n_embd // config.n_head
+
+    def __call__(self, input_ids=None, attention_mask=None, position_ids=None,
+                 past_key_values=None, use_cache=True, **kwargs):
+        import numpy as np
+        import torch
+
+        batch, length = input_ids.shape
+        if past_key_values is None:
+            empty = np.zeros((batch, self.config.n_head, 0, self._head_dim), dtype=np.float32)
+            past = [empty] * len(self._past_names)
+            past_length = 0
+        else:
+            past = []
+            for key, value in cache_to_layers(past_key_values):
+                past += [key.float().contiguous().numpy(), value.float().contiguous().numpy()]
+            past_length = past[0].shape[2]
+        if attention_mask is None:
+            attention_mask = torch.ones((batch, past_length + length), dtype=torch.long)
+        if position_ids is None:
+            position_ids = torch.arange(past_length, past_length + length).expand(batch, -1)
+
+        feed = {
+            "input_ids": input_ids.numpy(),
+            "attention_mask": attention_mask.numpy(),
+            "position_ids": position_ids.numpy(),
+        }
+        feed.update(zip(self._past_names, past))
+        outputs = self.session.run(None, feed)
+        present = [torch.from_numpy(array) for array in outputs[1:]]
+        layers = tuple((present[2 * i], present[2 * i + 1]) for i in range(self.config.n_layer))
+        return SimpleNamespace(logits=torch.from_numpy(outputs[0]), past_key_values=layers)
+
+
+def load_onnx_model(model, model_dir):
+    """加载（必要时先导出）模型目录下的ONNX图"""
+    path = os.path.join(model_dir, "onnx", "model.onnx")
+    if not os.path.exists(path):
+        export_onnx(model, path)
+    return OnnxCausalLM(path, model.config)
+
+
+def prepare_backend(model, backend=INFERENCE_BACKEND, model_dir="."):
+    """按后端名称准备推理用的模型，返回 (推理模型, 实际使用的后端)；失败时回退到PyTorch"""
+    if backend not in BACKENDS:
+        print(f"未知的推理后端 {backend}，使用 torch")
+        return model, "torch"
+    try:
+        if backend == "int8":
+            model = quantize_int8(model)
+        elif backend == "onnx":
+            model = load_onnx_model(model, model_dir)
+    except Exception as e:
+        print(f"推理后端 {backend} 初始化失败，回退到 torch: {e}")
+        return model, "torch"
+    print(f"使用推理后端: {backend}")
+    return model, backend
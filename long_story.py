@@ -0,0 +1,171 @@
+# 长篇故事分段生成：超过单次上下文长度的故事分成若干段依次生成。每段的prompt只包含固定的模板前缀、
+# 简短的故事梗概（关键词、风格、角色、开头和之前各段的要点）和上一段末尾的原文，
+# 每段重新预填充（模板前缀命中前缀KV缓存），不再携带之前全部的KV缓存，上下文长度和每个token的耗时不随故事变长而增加
+import os
+import re
+import time
+from collections import deque
+
+from prompts import STORY_SENTENCE_END_CHARS, STORY_SOFT_LIMIT, story_prompt_prefix
+
+# 故事长度超过该值时分段生成（GPT-2中文模型的上下文为1024个token，包含prompt）
+LONG_STORY_THRESHOLD = int(os.environ.get("LONG_STORY_THRESHOLD", "600"))
+# 每段生成的token数
+LONG_STORY_SEGMENT_TOKENS = int(os.environ.get("LONG_STORY_SEGMENT_TOKENS", "256"))
+# 续写时携带的前文末尾字数，以及故事梗概的字数上限
+LONG_STORY_CONTEXT_CHARS = int(os.environ.get("LONG_STORY_CONTEXT_CHARS", "192"))
+LONG_STORY_SUMMARY_CHARS = int(os.environ.get("LONG_STORY_SUMMARY_CHARS", "160"))
+# 梗概中每一句的字数上限
+_POINT_CHARS = 48
+
+_SENTENCE = re.compile(r'[^。！？…!?\n]+[。！？…!?]*')
+
+
+def is_long_story(max_length):
+    return int(max_length) > LONG_STORY_THRESHOLD
+
+
+def story_variant(genre, style=None, character=None, max_length=0):
+    """结果缓存和近似检索中区分故事的主题；写作风格和主要角色只写入分段生成的prompt，
+    只在分段生成时参与区分，普通长度的故事与原来的缓存键相同"""
+    if not is_long_story(max_length) or (not style and not character):
+        return genre
+    return f"{genre}/{style or ''}/{character or ''}"
+
+
+def split_sentences(text):
+    return [s.strip() for s in _SENTENCE.findall(text) if s.strip()]
+
+
+def context_tail(text, max_chars=LONG_STORY_CONTEXT_CHARS):
+    """前文末尾至多 max_chars 个字，尽量从一句话的开头截取"""
+    text = text.strip()
+    if len(text) <= max_chars:
+        return text
+    tail = text[-max_chars:]
+    cut = min((tail.find(c) for c in STORY_SENTENCE_END_CHARS if 0 <= tail.find(c) < max_chars // 2),
+              default=-1)
+    return tail[cut + 1:].lstrip() if cut >= 0 else tail
+
+
+class StoryOutline:
+    """分段生成时携带的故事状态：主题、关键词、写作风格、主要角色、开头一句和之前各段的要点
+
+    要点只保留最近几段，梗概总长度不超过 max_chars，故事再长占用的内存和prompt长度也不变。
+    """
+
+    def __init__(self, keywords, genre, style=None, character=None, max_chars=LONG_STORY_SUMMARY_CHARS):
+        self.keywords = keywords
+        self.genre = genre
+        self.style = style
+        self.character = character
+        self.max_chars = max_chars
+        self.opening = ""
+        self.points = deque()
+
+    def update(self, segment):
+        """一段生成结束后记录要点：第一段记录开头一句，之后每段记录该段的第一句"""
+        sentences = split_sentences(segment)
+        if not sentences:
+            return
+        if not self.opening:
+            self.opening = sentences[0][:_POINT_CHARS]
+        else:
+            self.points.append(sentences[0][:_POINT_CHARS])
+        while self.points and len(self.summary()) > self.max_chars:
+            self.points.popleft()
+
+    def summary(self):
+        return "".join([self.opening] + list(self.points))
+
+    def prompt(self, context=""):
+        """续写的prompt：关键词之后依次是写作风格、主要角色（未填写的项省略）、梗概和前文末尾"""
+        settings = ""
+        if self.style:
+            settings += f"写作风格：{self.style}\n"
+        if self.character:
+            settings += f"主要角色：{self.character}\n"
+        summary = self.summary()
+        if summary:
+            settings += f"前情提要：{summary}\n"
+        return f"{story_prompt_prefix(self.genre)}{self.keywords}\n{settings}故事内容：{context}"
+
+
+class ChunkedStoryStream:
+    """分段生成的长篇故事，接口与 TokenStreamer 相同：迭代得到增量文本，结束后提供各阶段耗时和token数
+
+    每段写满约 segment_tokens 个token后在句末结束，下一段另起一行；模型提前结束、
+    退化检测提前结束或被取消时整篇故事结束。
+    """
+
+    def __init__(self, engine, outline, cancel=None, max_new_tokens=LONG_STORY_SEGMENT_TOKENS,
+                 segment_tokens=LONG_STORY_SEGMENT_TOKENS, context_chars=LONG_STORY_CONTEXT_CHARS,
+                 prefix=None, stop_chars=STORY_SENTENCE_END_CHARS, stop_after_tokens=0, **params):
+        self.engine = engine
+        self.outline = outline
+        self.cancel = cancel
+        self.max_new_tokens = int(max_new_tokens)
+        self.segment_tokens = max(1, int(segment_tokens))
+        self.context_chars = context_chars
+        self.prefix = prefix or story_prompt_prefix(outline.genre)
+        self.stop_chars = stop_chars
+        # 其余为采样参数；每段的长度和提前结束条件按段计算
+        self.params = params
+        self.created_at = time.perf_counter()
+        self.first_token_at = None
+        self.timings = {}
+        self.num_tokens = 0
+        self.prompt_tokens = 0
+        self.logprob = 0.0
+        self.quality = None
+        self.segments = 0
+        # 各段中最长的上下文（prompt + 该段生成的token数），决定KV缓存的大小
+        self.max_context = 0
+
+    @property
+    def ttft(self):
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.created_at
+
+    def _segment_size(self, remaining):
+        # 剩余长度不足一段半时合并为最后一段，避免最后一段过短
+        return remaining if remaining < self.segment_tokens * 3 // 2 else self.segment_tokens
+
+    def __iter__(self):
+        context = ""
+        remaining = self.max_new_tokens
+        while remaining > 0 and not (self.cancel is not None and self.cancel.cancelled):
+            size = self._segment_size(remaining)
+            stream = self.engine.stream(
+                self.outline.prompt(context),
+                cancel=self.cancel,
+                prefix=self.prefix,
+                max_new_tokens=size,
+                stop_chars=self.stop_chars,
+                stop_after_tokens=int(size * STORY_SOFT_LIMIT),
+                **self.params
+            )
+            segment = ""
+            for delta in stream:
+                if not segment and context and context[-1] in STORY_SENTENCE_END_CHARS:
+                    # 上一段在句末结束，新的一段另起一行
+                    yield "\n"
+                if self.first_token_at is None:
+                    self.first_token_at = time.perf_counter()
+                segment += delta
+                yield delta
+            self.segments += 1
+            for name, seconds in stream.timings.items():
+                self.timings[name] = self.timings.get(name, 0.0) + seconds
+            self.num_tokens += stream.num_tokens
+            self.prompt_tokens += stream.prompt_tokens
+            self.max_context = max(self.max_context, stream.prompt_tokens + stream.num_tokens)
+            if stream.quality:
+                self.quality = stream.quality
+            remaining -= stream.num_tokens
+            # 没有写到本段的句末条件（模型结束、退化检测提前结束）时整篇故事结束
+            if stream.num_tokens < int(size * STORY_SOFT_LIMIT) or (self.quality and self.quality["aborted"]):
+                break
+            self.outline.update(segment)
+            context = context_tail(context + segment, self.context_chars)
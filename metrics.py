@@ -0,0 +1,250 @@
+# 运行指标：各阶段耗时直方图、请求/错误计数、Prometheus文本格式输出，以及慢请求的追踪记录
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 指标端口（0 表示不启动），默认只监听本机
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9100"))
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+# 总耗时超过该值（秒）的请求把各阶段耗时写入追踪文件，0 表示不记录
+SLOW_TRACE_SECONDS = float(os.environ.get("SLOW_TRACE_SECONDS", "0"))
+SLOW_TRACE_FILE = os.environ.get("SLOW_TRACE_FILE", "slow_traces.jsonl")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # 每组标签值对应 [各桶计数, 总和, 总数]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return series[2] if series else 0
+
+    def sum(self, *label_values):
+        series = self._series.get(label_values)
+        return series[1] if series else 0.0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labels, label_values, [("le", bound)])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels, label_values, [("le", "+Inf")])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """返回 Prometheus 文本格式的全部指标"""
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+REQUESTS = registry.counter("generation_requests_total", "生成请求数", ("kind", "status"))
+ERRORS = registry.counter("generation_errors_total", "生成失败数", ("kind", "stage"))
+TOKENS = registry.counter("generation_tokens_total", "生成的token总数", ("kind",))
+STAGE_SECONDS = registry.histogram("generation_stage_seconds", "各阶段耗时（秒）", ("kind", "stage"))
+LATENCY_SECONDS = registry.histogram("generation_latency_seconds", "请求总耗时（秒）", ("kind",))
+TTFT_SECONDS = registry.histogram("generation_ttft_seconds", "首个token耗时（秒）", ("kind",))
+TOKENS_PER_SECOND = registry.histogram("generation_tokens_per_second", "每个请求的生成速度（tokens/秒）",
+                                       ("kind",), RATE_BUCKETS)
+
+
+@contextmanager
+def stage_timer(kind, stage):
+    """在请求追踪之外单独统计一个阶段的耗时（如历史记录写入）"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.inc(kind, stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, kind, stage)
+
+
+class RequestTrace:
+    """一个生成请求的各阶段耗时，结束时汇总到直方图，慢请求写入追踪文件"""
+
+    def __init__(self, kind, **info):
+        self.kind = kind
+        self.info = info
+        self.started_at = time.perf_counter()
+        self.stages = {}
+        self.stage_name = None
+
+    @contextmanager
+    def stage(self, name):
+        previous, self.stage_name = self.stage_name, name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+            self.stage_name = previous
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def update(self, timings):
+        """合并批处理调度器记录的阶段耗时（排队、分词、预填充、解码）"""
+        for name, seconds in (timings or {}).items():
+            self.add(name, seconds)
+
+    def finish(self, status="ok", tokens=0, ttft=None, error=None):
+        total = time.perf_counter() - self.started_at
+        REQUESTS.inc(self.kind, status)
+        LATENCY_SECONDS.observe(total, self.kind)
+        for name, seconds in self.stages.items():
+            STAGE_SECONDS.observe(seconds, self.kind, name)
+        if status == "error":
+            ERRORS.inc(self.kind, self.stage_name or "generate")
+        if ttft is not None:
+            TTFT_SECONDS.observe(ttft, self.kind)
+        if tokens:
+            TOKENS.inc(self.kind, amount=tokens)
+            decode = self.stages.get("decode") or total
+            TOKENS_PER_SECOND.observe(tokens / max(decode, 1e-9), self.kind)
+        if SLOW_TRACE_SECONDS > 0 and total >= SLOW_TRACE_SECONDS:
+            self.dump(total, status, tokens, ttft, error)
+        return total
+
+    def dump(self, total, status, tokens, ttft, error):
+        record = {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "kind": self.kind,
+            "status": status,
+            "total_seconds": round(total, 4),
+            "ttft_seconds": round(ttft, 4) if ttft is not None else None,
+            "tokens": tokens,
+            "stages": {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            "info": self.info,
+        }
+        if error is not None:
+            record["error"] = str(error)
+        try:
+            with _trace_lock, open(SLOW_TRACE_FILE, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"写入慢请求追踪失败: {e}")
+
+
+_trace_lock = threading.Lock()
+
+
+def _metrics_handler():
+    # http.server 只在启动指标服务时导入，导入本模块保持轻量
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """在后台线程中启动指标HTTP服务（GET /metrics），端口为0时不启动"""
+    if port <= 0:
+        return None
+    try:
+        from http.server import ThreadingHTTPServer
+        server = ThreadingHTTPServer((host, port), _metrics_handler())
+    except OSError as e:
+        print(f"指标服务启动失败: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"指标服务已启动: http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,285 @@
+# 模型管理器：在后台线程中加载模型，界面可以立即启动
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from inference_backends import INFERENCE_BACKEND, prepare_backend
+from worker_pool import WORKER_PROCESSES, start_worker_pool
+
+# 设置模型存储目录和模型名称
+MODEL_DIR = os.environ.get("MODEL_DIR", "./local_model")
+MODEL_NAME = os.environ.get("MODEL_NAME", "uer/gpt2-chinese-cluecorpussmall")
+# 模型下载使用的国内镜像源，只在加载模型时写入 HF_ENDPOINT（导入本模块不修改环境变量）
+HF_MIRROR = os.environ.get("HF_MIRROR", "https://hf-mirror.com")
+
+# 加载方式：background（启动时后台加载）或 lazy（首次请求时加载）
+MODEL_LOAD_MODE = os.environ.get("MODEL_LOAD_MODE", "background")
+# 生成请求等待模型就绪的最长时间（秒）
+MODEL_WAIT_TIMEOUT = float(os.environ.get("MODEL_WAIT_TIMEOUT", "600"))
+# 加载失败后重新加载前的等待时间（秒），连续失败时加倍，不超过上限
+MODEL_RETRY_BACKOFF = float(os.environ.get("MODEL_RETRY_BACKOFF", "10"))
+MODEL_RETRY_MAX_BACKOFF = float(os.environ.get("MODEL_RETRY_MAX_BACKOFF", "300"))
+# 本地模型以 safetensors 格式保存，并以内存映射方式只读加载：同一台机器上的多个进程共享页缓存中的权重
+MODEL_MMAP = os.environ.get("MODEL_MMAP", "1") == "1"
+SAFETENSORS_FILES = ("model.safetensors", "model.safetensors.index.json")
+
+# 记录进程启动时间，用于统计启动到就绪的耗时
+_PROCESS_START = time.perf_counter()
+
+
+class ModelNotReadyError(Exception):
+    """模型尚未加载完成或加载失败"""
+
+
+def process_rss_mb():
+    """当前进程的常驻内存（MB），无法读取时返回 None（仅支持Linux）"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def use_hf_mirror():
+    """设置模型下载镜像；huggingface_hub 在导入时读取 HF_ENDPOINT，需要在导入 transformers/gradio 之前调用，
+    已经设置了 HF_ENDPOINT 时保留原设置"""
+    os.environ.setdefault("HF_ENDPOINT", HF_MIRROR)
+    os.environ.setdefault("HF_HUB_OFFLINE", "0")
+
+
+def has_safetensors(model_dir):
+    return any(os.path.exists(os.path.join(model_dir, name)) for name in SAFETENSORS_FILES)
+
+
+def load_local_model(model_dir, mmap=MODEL_MMAP):
+    """从本地目录加载模型；启用内存映射时，旧的 pytorch_model.bin 会先转换为 safetensors
+
+    safetensors 文件以内存映射方式打开，权重直接使用映射的页面而不复制到进程私有内存，
+    多个进程加载同一目录时只占用一份物理内存。权重在推理时只读，不会触发写时复制。
+    """
+    from transformers import AutoModelForCausalLM
+
+    if not mmap:
+        # 复制到进程私有内存：运行期间替换模型文件也不会影响已加载的权重
+        model = AutoModelForCausalLM.from_pretrained(model_dir, local_files_only=True)
+        for param in model.parameters():
+            param.data = param.data.clone()
+        return model
+    if not has_safetensors(model_dir):
+        model = AutoModelForCausalLM.from_pretrained(model_dir, local_files_only=True)
+        print(f"把本地模型转换为 safetensors 格式: {model_dir}")
+        model.save_pretrained(model_dir, safe_serialization=True)
+        del model
+    model = AutoModelForCausalLM.from_pretrained(
+        model_dir, local_files_only=True, use_safetensors=True, low_cpu_mem_usage=True)
+    return model.requires_grad_(False)
+
+
+def load_generator(model_name=MODEL_NAME, model_dir=MODEL_DIR, backend=INFERENCE_BACKEND):
+    """加载中文预训练模型并创建生成器，失败时降级为备用模型"""
+    use_hf_mirror()
+    import torch
+    from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM
+
+    os.makedirs(model_dir, exist_ok=True)
+    try:
+        try:
+            # 尝试从本地文件夹加载模型
+            print(f"尝试从本地文件夹 {model_dir} 加载模型...")
+            start = time.perf_counter()
+            tokenizer = AutoTokenizer.from_pretrained(model_dir, local_files_only=True)
+            model = load_local_model(model_dir)
+            rss = process_rss_mb()
+            print(f"成功从本地文件夹加载模型（{'内存映射' if MODEL_MMAP else '完整复制'}，"
+                  f"耗时 {time.perf_counter() - start:.2f} 秒"
+                  + (f"，进程内存 {rss:.0f} MB）" if rss is not None else "）"))
+        except Exception as local_e:
+            print(f"从本地文件夹加载模型失败: {local_e}")
+            print(f"尝试从国内镜像下载模型到 {model_dir}...")
+            # 从镜像下载模型并保存到本地文件夹
+            tokenizer = AutoTokenizer.from_pretrained(
+                model_name,
+                cache_dir=model_dir,
+                resume_download=True
+            )
+            model = AutoModelForCausalLM.from_pretrained(
+                model_name,
+                cache_dir=model_dir,
+                resume_download=True
+            )
+
+            # 保存模型到本地文件夹（safetensors格式），之后以内存映射方式重新加载
+            tokenizer.save_pretrained(model_dir)
+            model.save_pretrained(model_dir, safe_serialization=True)
+            print(f"成功从国内镜像下载模型并保存到 {model_dir}")
+            if MODEL_MMAP:
+                del model
+                model = load_local_model(model_dir)
+
+        # 按配置准备推理后端，int8量化和ONNX Runtime后端只在CPU上运行
+        inference_model, backend = prepare_backend(model, backend, model_dir)
+        if backend == "int8":
+            model = inference_model
+        use_cuda = backend == "torch" and torch.cuda.is_available()
+        
+        # 创建生成器
+        generator = pipeline(
+            "text-generation",
+            model=model,
+            tokenizer=tokenizer,
+            device=0 if use_cuda else -1
+        )
+        # 批处理调度器使用 inference_model 进行生成
+        generator.inference_model = inference_model if backend == "onnx" else generator.model
+        generator.backend = backend
+        print("模型加载完成，生成器创建成功")
+    except Exception as e:
+        print(f"模型加载过程中出现错误: {e}")
+        # 降级使用更简单的模型
+        generator = pipeline("text-generation", model="gpt2")
+        print("成功加载备用模型")
+    return generator
+
+
+def load_engine():
+    """WORKER_PROCESSES 大于0时启动多进程工作池，否则（或工作池启动超时）在当前进程中加载生成器"""
+    if WORKER_PROCESSES > 0:
+        pool = start_worker_pool(WORKER_PROCESSES)
+        if pool is not None:
+            return pool
+        print("改为在当前进程中加载模型")
+    return load_generator()
+
+
+class ModelManager:
+    """管理模型的加载状态，生成函数通过 Future 等待模型就绪"""
+
+    def __init__(self, loader=load_generator, retry_backoff=MODEL_RETRY_BACKOFF,
+                 max_retry_backoff=MODEL_RETRY_MAX_BACKOFF):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._future = None
+        self.state = "idle"  # idle / loading / ready / failed
+        self.error = None
+        # 连续加载失败的次数和允许重新加载的时间（time.monotonic）
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self.failures = 0
+        self._retry_at = 0.0
+        self._ready_callbacks = []
+        self.stats = {
+            "load_started_at": None,
+            "load_seconds": None,
+            "startup_to_ready_seconds": None,
+            "first_request_wait_seconds": None,
+            "first_request_ttft_seconds": None,
+            "first_request_latency_seconds": None,
+        }
+
+    def start(self):
+        """在后台线程中开始加载模型（重复调用不会重复加载）；上次加载失败且已过等待时间时重新加载"""
+        with self._lock:
+            if self._future is not None and not (self.state == "failed" and time.monotonic() >= self._retry_at):
+                return self._future
+            if self._future is not None:
+                print(f"重新加载模型（第 {self.failures + 1} 次尝试）")
+            self._future = Future()
+            self.state = "loading"
+            self.stats["load_started_at"] = time.perf_counter() - _PROCESS_START
+        thread = threading.Thread(target=self._load, name="model-loader", daemon=True)
+        thread.start()
+        return self._future
+
+    def _load(self):
+        start = time.perf_counter()
+        try:
+            generator = self._loader()
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+                delay = min(self.max_retry_backoff, self.retry_backoff * 2 ** (self.failures - 1))
+                self._retry_at = time.monotonic() + delay
+                self.state = "failed"
+                self.error = e
+            print(f"模型加载失败: {e}（{delay:.0f} 秒后的请求会重新加载）")
+            self._future.set_exception(e)
+            return
+        self.failures = 0
+        self.stats["load_seconds"] = time.perf_counter() - start
+        self.stats["startup_to_ready_seconds"] = time.perf_counter() - _PROCESS_START
+        # 先执行就绪回调（如预热缓存），再让等待中的请求开始生成
+        while True:
+            with self._lock:
+                callbacks, self._ready_callbacks = self._ready_callbacks, []
+                if not callbacks:
+                    self.state = "ready"
+                    break
+            for callback in callbacks:
+                self._run_callback(callback, generator)
+        print(f"模型就绪：加载耗时 {self.stats['load_seconds']:.2f} 秒，"
+              f"启动到就绪 {self.stats['startup_to_ready_seconds']:.2f} 秒")
+        self._future.set_result(generator)
+
+    def _run_callback(self, callback, generator):
+        try:
+            callback(generator)
+        except Exception as e:
+            print(f"模型就绪回调执行失败: {e}")
+
+    def add_ready_callback(self, callback):
+        """注册模型加载完成后执行的回调（如预热缓存），模型已就绪时在后台线程中立即执行"""
+        with self._lock:
+            ready = self.state == "ready"
+            if not ready:
+                self._ready_callbacks.append(callback)
+        if ready:
+            threading.Thread(
+                target=self._run_callback,
+                args=(callback, self._future.result()),
+                daemon=True
+            ).start()
+
+    def is_ready(self):
+        return self.state == "ready"
+
+    def get_generator(self, timeout=MODEL_WAIT_TIMEOUT):
+        """返回已加载的生成器；未开始加载时会先触发加载，超时抛出 ModelNotReadyError"""
+        future = self.start()
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise ModelNotReadyError("模型仍在加载中，请稍后再试")
+        except Exception as e:
+            raise ModelNotReadyError(f"模型加载失败: {e}")
+
+    def record_request(self, wait_seconds, first_token_seconds, latency_seconds):
+        """记录首个生成请求的等待时间、首个token耗时和总耗时"""
+        if self.stats["first_request_latency_seconds"] is not None:
+            return
+        self.stats["first_request_wait_seconds"] = wait_seconds
+        self.stats["first_request_ttft_seconds"] = first_token_seconds
+        self.stats["first_request_latency_seconds"] = latency_seconds
+        ttft_text = f"{first_token_seconds:.2f} 秒" if first_token_seconds is not None else "无输出"
+        print(f"首个生成请求：等待模型 {wait_seconds:.2f} 秒，首个token {ttft_text}，"
+              f"总耗时 {latency_seconds:.2f} 秒")
+
+    def status_text(self):
+        """返回用于界面展示的模型状态"""
+        if self.state == "ready":
+            return f"🟢 模型已就绪（加载耗时 {self.stats['load_seconds']:.1f} 秒）"
+        if self.state == "loading":
+            elapsed = time.perf_counter() - _PROCESS_START - self.stats["load_started_at"]
+            return f"🟡 模型加载中...（已用时 {elapsed:.0f} 秒）"
+        if self.state == "failed":
+            wait = self._retry_at - time.monotonic()
+            retry = f"，{wait:.0f} 秒后可重试" if wait > 0 else "，下次生成时重新加载"
+            return f"🔴 模型加载失败: {self.error}{retry}"
+        return "⚪ 模型尚未加载，首次生成时自动加载"
+
+
+# 全局模型管理器
+model_manager = ModelManager(loader=load_engine)
@@ -0,0 +1,151 @@
+# 生成文本后处理：正则只在导入时编译一次，流式输出时每个字符只扫描一次
+# （已完成的行清理一次后不再处理，每次只重新处理正在生成的最后一行）
+import re
+
+STORY_END_PUNCS = ('.', '。', '!', '！', '?', '？', '…')
+POEM_SPLIT_CHARS = '，。！？；：'
+
+# 中日韩文字及全角标点（含省略号、中文引号），这些字符之间的空格是分词器解码留下的
+_CJK = r'\u2018-\u201d\u2026\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef'
+# 特殊token（连同后面的空格）
+_SPECIAL_TOKENS = re.compile(r'\[(?:CLS|SEP|PAD|UNK|MASK)\][ \t]*|<\|endoftext\|>[ \t]*')
+# 中文字符之间、全角标点两侧的空格；以空格开头再做后向断言，正则引擎可以直接跳到空格处，而不是在每个字符上做断言
+_CJK_PUNCT = r'\u2018-\u201d\u2026\u3000-\u303f\uff00-\uffef'
+_CJK_SPACES = re.compile(
+    rf'[ \t](?<=[{_CJK}][ \t])[ \t]*(?=[{_CJK}])'
+    rf'|[ \t](?<=[{_CJK_PUNCT}][ \t])[ \t]*|[ \t]+(?=[{_CJK_PUNCT}])'
+)
+# 中文与英文、数字之间的空格需要保留，没有与英文、数字相邻的空格时可以直接删除全部空格
+_ASCII_SPACE = re.compile(r'[!-~][ \t]|[ \t][!-~]')
+# 行首编号："1. "，诗歌还包括 "一、"、"2、" 等中文编号
+_NUMBERED_LINE = re.compile(r'^\s*\d+\.\s*')
+_CN_NUMBERED_LINE = re.compile(r'^\s*[\d一二三四五六七八九十]+\s*[、.]\s*')
+_NUMBERED_LINES = re.compile(r'^\s*\d+\.\s*', re.MULTILINE)
+_BLANK_LINES = re.compile(r'\n+')
+
+
+def _strip_special(text):
+    if '[' in text or '<' in text:
+        return _SPECIAL_TOKENS.sub('', text)
+    return text
+
+
+def _collapse_spaces(text):
+    if ' ' not in text and '\t' not in text:
+        return text
+    if _ASCII_SPACE.search(text) is None:
+        return text.replace(' ', '').replace('\t', '')
+    return _CJK_SPACES.sub('', text)
+
+
+def clean_tokens(text):
+    """删除特殊token和中文字符之间的空格（如 “[CLS] 故 宫 博 物 院” → “故宫博物院”）"""
+    return _collapse_spaces(_strip_special(text))
+
+
+def detokenize(tokenizer, token_ids):
+    """把token id解码为文本：跳过特殊token，并去掉中文分词器在字与字之间插入的空格"""
+    return clean_tokens(tokenizer.decode(token_ids, skip_special_tokens=True))
+
+
+def remove_numbered_list(text):
+    """去除文本中的编号列表，将编号转换为连续文本"""
+    return _BLANK_LINES.sub('\n', _NUMBERED_LINES.sub('', text))
+
+
+class StoryStreamFormatter:
+    """故事的增量后处理：去除特殊token、多余空格和行首编号，合并空行"""
+
+    def __init__(self):
+        self.done_text = ""  # 已完成并清理过的行
+        self.tail = ""  # 正在生成的最后一行（原始文本）
+
+    def _clean(self, line):
+        # 先删除特殊token，再去除行首编号（编号后的空格一并删除），最后合并中文字符间的空格
+        return _collapse_spaces(_NUMBERED_LINE.sub('', _strip_special(line)))
+
+    def _append_line(self, line):
+        if line:
+            self.done_text = f"{self.done_text}\n{line}" if self.done_text else line
+
+    def feed(self, delta):
+        """追加新生成的文本片段，返回当前可展示的完整文本"""
+        self.tail += delta
+        if '\n' in self.tail:
+            lines = self.tail.split('\n')
+            self.tail = lines.pop()
+            for line in lines:
+                self._append_line(self._clean(line))
+        return self.text()
+
+    def text(self):
+        tail = self._clean(self.tail)
+        if not self.done_text:
+            return tail.strip()
+        return f"{self.done_text}\n{tail}".strip() if tail else self.done_text.strip()
+
+    def finish(self):
+        """生成结束后的最终文本：确保故事有完整结尾，避免截断"""
+        story = self.text()
+        if story and not story.endswith(STORY_END_PUNCS):
+            story += '。'
+        return story
+
+
+class PoemStreamFormatter(StoryStreamFormatter):
+    """诗歌的增量后处理：去除中英文编号、空行，现代诗只有一行时按标点分行"""
+
+    def __init__(self, style):
+        super().__init__()
+        self.style = style
+        self.line_count = 0
+        # 按标点分行的增量状态
+        self._split_source = ""
+        self._split_lines = []
+        self._split_current = ""
+
+    def _clean(self, line):
+        return _collapse_spaces(_CN_NUMBERED_LINE.sub('', _strip_special(line))).strip()
+
+    def _append_line(self, line):
+        if line:
+            self.line_count += 1
+        super()._append_line(line)
+
+    def _split_by_punctuation(self, line):
+        # 只处理上次之后新增的字符；行首被重新清理时从头开始
+        if not line.startswith(self._split_source):
+            self._split_source, self._split_lines, self._split_current = "", [], ""
+        for char in line[len(self._split_source):]:
+            self._split_current += char
+            if char in POEM_SPLIT_CHARS:
+                self._split_lines.append(self._split_current.strip())
+                self._split_current = ""
+        self._split_source = line
+        current = self._split_current.strip()
+        return '\n'.join(self._split_lines + [current] if current else self._split_lines)
+
+    def text(self):
+        tail = self._clean(self.tail)
+        # 为现代诗添加适当的分行：如果只有一行，按标点符号分行
+        if self.style == "现代诗" and self.line_count + (1 if tail else 0) < 2:
+            line = self.done_text or tail
+            return self._split_by_punctuation(line) if line else ""
+        return f"{self.done_text}\n{tail}" if self.done_text and tail else (self.done_text or tail)
+
+    def finish(self):
+        return self.text()
+
+
+def clean_story(text):
+    """一次性清理完整的故事文本"""
+    formatter = StoryStreamFormatter()
+    formatter.feed(text)
+    return formatter.finish()
+
+
+def clean_poem(text, style="现代诗"):
+    """一次性清理完整的诗歌文本"""
+    formatter = PoemStreamFormatter(style)
+    formatter.feed(text)
+    return formatter.finish()
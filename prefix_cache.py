@@ -0,0 +1,100 @@
+# 前缀KV缓存：固定的prompt指令前缀只编码一次，之后的请求只需编码关键词部分
+import os
+import threading
+from collections import OrderedDict
+
+# 是否启用前缀缓存，以及最多缓存的前缀数量
+PREFIX_CACHE_ENABLED = os.environ.get("PREFIX_CACHE", "1") == "1"
+PREFIX_CACHE_MAX_ENTRIES = int(os.environ.get("PREFIX_CACHE_MAX_ENTRIES", "32"))
+
+
+def cache_to_layers(past):
+    """把模型返回的KV缓存转换为 [(key, value), ...]，兼容新旧版本的transformers"""
+    if isinstance(past, (tuple, list)):
+        return [(layer[0], layer[1]) for layer in past]
+    if hasattr(past, "layers"):
+        return [(layer.keys, layer.values) for layer in past.layers]
+    if hasattr(past, "key_cache"):
+        return list(zip(past.key_cache, past.value_cache))
+    return [(layer[0], layer[1]) for layer in past.to_legacy_cache()]
+
+
+def layers_to_cache(layers):
+    """把 [(key, value), ...] 转换为模型可以接受的KV缓存对象"""
+    try:
+        from transformers import DynamicCache
+    except ImportError:
+        return tuple(layers)
+    if hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache(tuple(layers))
+    return DynamicCache(layers)
+
+
+def merge_layers(groups):
+    """把多组KV缓存在序列维度左侧补零对齐后按批次拼接
+
+    groups 为 [(layers, attention_mask), ...]，返回合并后的 (layers, attention_mask)。
+    """
+    import torch
+    import torch.nn.functional as F
+
+    if len(groups) == 1:
+        return groups[0]
+    max_len = max(mask.shape[1] for _, mask in groups)
+    merged_layers = []
+    for layer_index in range(len(groups[0][0])):
+        keys, values = [], []
+        for layers, mask in groups:
+            pad = max_len - mask.shape[1]
+            key, value = layers[layer_index]
+            keys.append(F.pad(key, (0, 0, pad, 0)))
+            values.append(F.pad(value, (0, 0, pad, 0)))
+        merged_layers.append((torch.cat(keys), torch.cat(values)))
+    masks = [F.pad(mask, (max_len - mask.shape[1], 0)) for _, mask in groups]
+    return merged_layers, torch.cat(masks)
+
+
+class PrefixCache:
+    """按前缀文本缓存其token和KV缓存（batch=1），LRU淘汰"""
+
+    def __init__(self, model, tokenizer, max_entries=PREFIX_CACHE_MAX_ENTRIES):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _compute(self, prefix):
+        import torch
+
+        ids = self.tokenizer(prefix, add_special_tokens=False)["input_ids"]
+        with torch.inference_mode():
+            outputs = self.model(
+                input_ids=torch.tensor([ids], device=self.model.device),
+                use_cache=True
+            )
+        return ids, cache_to_layers(outputs.past_key_values)
+
+    def get(self, prefix):
+        """返回 (前缀token列表, KV层列表)，未缓存时先计算"""
+        with self._lock:
+            entry = self._entries.get(prefix)
+            if entry is not None:
+                self._entries.move_to_end(prefix)
+                self.stats["hits"] += 1
+                return entry
+        entry = self._compute(prefix)
+        with self._lock:
+            self.stats["misses"] += 1
+            self._entries[prefix] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def warm(self, prefixes):
+        """预先计算一组前缀（模型加载完成后调用）"""
+        for prefix in prefixes:
+            if prefix not in self._entries:
+                self.get(prefix)
+        print(f"前缀KV缓存预热完成，共 {len(self._entries)} 个模板前缀")
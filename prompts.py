@@ -0,0 +1,54 @@
+# prompt构建：故事主题、诗歌类型、提前结束条件和prompt模板（不依赖模型，可以单独导入）
+from postprocess import POEM_SPLIT_CHARS
+
+# 故事主题和诗歌类型选项
+STORY_GENRES = ["奇幻", "科幻", "悬疑", "爱情", "冒险", "历史", "恐怖", "喜剧"]
+POEM_TYPES = ["现代诗", "古体诗", "宋词", "儿歌", "俳句", "自由诗"]
+
+# 提前结束条件：诗歌按行尾标点/换行计数，满足行数立即结束；故事在用完大部分长度后遇到句末即结束
+POEM_LINE_END_CHARS = POEM_SPLIT_CHARS + '\n'
+STORY_SENTENCE_END_CHARS = '。！？…!?\n'
+STORY_SOFT_LIMIT = 0.9
+# 各类诗歌每行大约的token数（含行尾标点），按行数估算生成长度上限
+POEM_TOKENS_PER_LINE = {"现代诗": 12, "古体诗": 8, "宋词": 9, "儿歌": 8, "俳句": 7, "自由诗": 14}
+
+
+def poem_token_budget(style, lines):
+    """按行数估算诗歌的token上限：留出一半余量，正常情况下由行数条件提前结束"""
+    return int(lines) * POEM_TOKENS_PER_LINE.get(style, 12) * 3 // 2 + 8
+
+
+# prompt模板：关键词之前的部分是固定前缀，可以复用前缀KV缓存
+def story_prompt_prefix(genre):
+    # 优化prompt，明确要求连续文本段落，避免编号列表
+    return f"请根据以下关键词生成一个{genre}风格的完整故事，要求以连续的文本段落形式呈现，不要使用数字编号列表，要有明确的开头、发展和结尾："
+
+
+def poem_prompt_prefix(style):
+    # 根据诗歌风格设计不同的prompt模板
+    if style == "现代诗":
+        # 参考中国现代诗风格，要求意境优美，语言流畅
+        return "请根据以下关键词创作一首优美的现代诗，要求以连续的分行形式呈现，不要使用任何数字编号，语言优美，意境深远，具有文学性："
+    elif style == "古体诗":
+        # 古体诗要求押韵，对仗工整
+        return "请根据以下关键词创作一首古体诗，要求符合古诗格律，押韵工整，不要使用数字编号，语言典雅，意境优美："
+    elif style == "宋词":
+        # 宋词要求符合词牌格式，情感细腻
+        return "请根据以下关键词创作一首宋词风格的作品，要求情感细腻，语言优美，不要使用数字编号，具有古典韵味："
+    else: # 儿歌
+        return "请根据以下关键词创作一首简单易懂的儿歌，要求语言明快，节奏流畅，不要使用数字编号，适合儿童传唱："
+
+
+def build_story_prompt(keywords, genre):
+    return f"{story_prompt_prefix(genre)}{keywords}\n故事内容："
+
+
+def build_poem_prompt(keywords, style):
+    return f"{poem_prompt_prefix(style)}{keywords}\n诗歌内容："
+
+
+def template_prefixes():
+    """所有固定的模板前缀，模型加载完成后预先计算它们的KV缓存"""
+    prefixes = [story_prompt_prefix(genre) for genre in STORY_GENRES]
+    prefixes += [poem_prompt_prefix(style) for style in POEM_TYPES]
+    return list(dict.fromkeys(prefixes))
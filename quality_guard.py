@@ -0,0 +1,156 @@
+# 退化生成检测：解码过程中逐个token检查重复、照抄prompt和数字编号/列表符号，
+# 模型跑题成网页文本或列表时先纠偏（禁止数字和列表符号），仍然退化则提前结束，不再生成到长度上限
+import os
+import threading
+from collections import deque
+
+from metrics import registry
+
+# 是否启用退化检测（默认开启）
+QUALITY_GUARD_ENABLED = os.environ.get("QUALITY_GUARD", "1") == "1"
+# 统计最近多少个token；生成不足一个窗口时只检查列表编号
+QUALITY_WINDOW = int(os.environ.get("QUALITY_WINDOW", "32"))
+# 窗口内三元组（连续3个token）在前文已出现过的比例上限
+QUALITY_MAX_REPEAT = float(os.environ.get("QUALITY_MAX_REPEAT", "0.5"))
+# 窗口内不同token的比例下限（同几个字来回重复）
+QUALITY_MIN_DISTINCT = float(os.environ.get("QUALITY_MIN_DISTINCT", "0.25"))
+# 窗口内三元组出现在prompt中的比例上限（照抄prompt模板）
+QUALITY_MAX_PROMPT_OVERLAP = float(os.environ.get("QUALITY_MAX_PROMPT_OVERLAP", "0.5"))
+# 数字编号（“2.”、“3、”、“4）”）的个数上限，以及窗口内数字和列表符号的比例上限
+QUALITY_MAX_LIST_ITEMS = int(os.environ.get("QUALITY_MAX_LIST_ITEMS", "2"))
+QUALITY_MAX_SYMBOLS = float(os.environ.get("QUALITY_MAX_SYMBOLS", "0.3"))
+
+# 跟在数字后面构成编号的符号，以及正常故事和诗歌中很少出现的列表/网页符号
+LIST_ITEM_CHARS = ".．、)）"
+LIST_SYMBOL_CHARS = ".．《》【】()（）[]［］_#*|/<>~@=+"
+
+DEGENERATE = registry.counter(
+    "generation_degenerate_total", "检测到的退化生成次数（action 为 resteer 纠偏或 abort 提前结束）",
+    ("kind", "reason", "action"))
+DEGENERATE_TOKENS_SAVED = registry.counter(
+    "generation_degenerate_tokens_saved_total", "退化生成提前结束节省的token数", ("kind",))
+
+_vocab_cache = {}
+_vocab_lock = threading.Lock()
+
+
+def _vocab_ids(tokenizer):
+    """返回 (数字token, 编号符号token, 列表符号token) 的id集合，按分词器缓存"""
+    key = id(tokenizer)
+    with _vocab_lock:
+        ids = _vocab_cache.get(key)
+        if ids is None:
+            digits, items, symbols = set(), set(), set()
+            for token, token_id in tokenizer.get_vocab().items():
+                text = token[2:] if token.startswith("##") else token
+                if text.isdigit():
+                    digits.add(token_id)
+                elif text and text in LIST_ITEM_CHARS:
+                    items.add(token_id)
+                if text and text in LIST_SYMBOL_CHARS:
+                    symbols.add(token_id)
+            ids = _vocab_cache[key] = (frozenset(digits), frozenset(items), frozenset(symbols))
+        return ids
+
+
+class QualityMonitor:
+    """单个请求的在线质量监控，observe 每个新token的开销为常数
+
+    第一次检测到数字编号/列表时纠偏：之后禁止生成数字和列表符号（banned_ids），并从头重新统计；
+    重复、照抄prompt，或纠偏之后再次退化时提前结束（aborted 为 True，reason 为原因）。
+    """
+
+    def __init__(self, tokenizer, prompt_ids, window=QUALITY_WINDOW):
+        self.digit_ids, self.item_ids, self.symbol_ids = _vocab_ids(tokenizer)
+        self.window = max(4, int(window))
+        # 词表外的字都是 [UNK]，不参与重复和照抄判断
+        self.unk_id = tokenizer.unk_token_id
+        self.prompt_ngrams = {tuple(prompt_ids[i:i + 3]) for i in range(len(prompt_ids) - 2)}
+        self.banned_ids = frozenset()
+        self.resteered = False
+        self.aborted = False
+        self.reason = None
+        self._reset()
+
+    def _reset(self):
+        self._tokens = []
+        self._seen = set()
+        # 窗口内每个位置的 (token, 三元组是否重复, 是否出现在prompt中, 是否为数字/列表符号)
+        self._recent = deque()
+        self._counts = {}
+        self._repeats = 0
+        self._echoes = 0
+        self._symbols = 0
+        self._list_items = 0
+
+    def observe(self, token):
+        """记录一个新生成的token，返回 None（正常）、"resteer"（已纠偏）或 "abort"（应结束生成）"""
+        tokens = self._tokens
+        if tokens and tokens[-1] in self.digit_ids and token in self.item_ids:
+            self._list_items += 1
+        tokens.append(token)
+        repeat = echo = False
+        if len(tokens) >= 3 and self.unk_id not in tokens[-3:]:
+            ngram = tuple(tokens[-3:])
+            repeat = ngram in self._seen
+            echo = ngram in self.prompt_ngrams
+            self._seen.add(ngram)
+        symbol = token in self.digit_ids or token in self.symbol_ids
+        self._recent.append((token, repeat, echo, symbol))
+        self._counts[token] = self._counts.get(token, 0) + 1
+        self._repeats += repeat
+        self._echoes += echo
+        self._symbols += symbol
+        if len(self._recent) > self.window:
+            old, old_repeat, old_echo, old_symbol = self._recent.popleft()
+            self._counts[old] -= 1
+            if not self._counts[old]:
+                del self._counts[old]
+            self._repeats -= old_repeat
+            self._echoes -= old_echo
+            self._symbols -= old_symbol
+        reason = self._check()
+        if reason is None:
+            return None
+        if reason == "list" and not self.resteered:
+            self.resteered = True
+            self.banned_ids = self.digit_ids | self.symbol_ids
+            self._reset()
+            return "resteer"
+        self.aborted = True
+        self.reason = reason
+        return "abort"
+
+    def summary(self, tokens_saved=0):
+        """生成结束时的检测结果（可序列化，随流式结果返回给调用方），没有检测到退化时为 None"""
+        if not self.resteered and not self.aborted:
+            return None
+        return {"resteered": self.resteered, "aborted": self.aborted, "reason": self.reason,
+                "tokens_saved": tokens_saved if self.aborted else 0}
+
+    def _check(self):
+        # 原因：list 数字编号/列表，repeat 重复，low_diversity 用字单一，prompt_echo 照抄prompt
+        if self._list_items >= QUALITY_MAX_LIST_ITEMS:
+            return "list"
+        if len(self._recent) < self.window:
+            return None
+        if self._repeats >= QUALITY_MAX_REPEAT * self.window:
+            return "repeat"
+        if len(self._counts) < QUALITY_MIN_DISTINCT * self.window:
+            return "low_diversity"
+        if self._echoes >= QUALITY_MAX_PROMPT_OVERLAP * self.window:
+            return "prompt_echo"
+        if self._symbols >= QUALITY_MAX_SYMBOLS * self.window:
+            return "list"
+        return None
+
+
+def record_quality(kind, quality):
+    """把一个请求的检测结果（QualityMonitor.summary）计入指标"""
+    if not quality:
+        return
+    if quality.get("resteered"):
+        DEGENERATE.inc(kind, "list", "resteer")
+    if quality.get("aborted"):
+        DEGENERATE.inc(kind, quality["reason"], "abort")
+        DEGENERATE_TOKENS_SAVED.inc(kind, amount=quality["tokens_saved"])
@@ -0,0 +1,171 @@
+# 生成结果缓存：内存LRU + TTL + 内存上限，SQLite磁盘层在重启后保留
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# 是否启用缓存（默认关闭）
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE", "0") == "1"
+# 内存中最多缓存的键数量和文本总字节数
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "1000"))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# 缓存有效期（秒）
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", str(24 * 3600)))
+# 每个键保留的样本数，命中时轮流返回，避免相同输入总是得到同一结果
+RESULT_CACHE_VARIETY = int(os.environ.get("RESULT_CACHE_VARIETY", "3"))
+# 磁盘缓存文件，设为空字符串时只使用内存缓存
+RESULT_CACHE_DB = os.environ.get("RESULT_CACHE_DB", "result_cache.db")
+# 创意度分桶宽度，同一桶内的创意度共享缓存
+TEMPERATURE_BUCKET = float(os.environ.get("RESULT_CACHE_TEMPERATURE_BUCKET", "0.1"))
+
+
+def normalize_keywords(keywords):
+    """统一关键词格式：中文逗号转英文逗号，去除空白和空关键词"""
+    parts = keywords.replace('，', ',').split(',')
+    return ','.join(part.strip() for part in parts if part.strip())
+
+
+def make_cache_key(kind, keywords, style, max_length, temperature):
+    """根据生成类型、关键词、风格、长度和创意度分桶构造缓存键"""
+    bucket = round(round(float(temperature) / TEMPERATURE_BUCKET) * TEMPERATURE_BUCKET, 3)
+    return f"{kind}|{normalize_keywords(keywords)}|{style}|{int(max_length)}|{bucket}"
+
+
+class _Entry:
+    def __init__(self, created_at):
+        self.samples = []
+        self.created_at = created_at
+        self.next_index = 0
+        self.size = 0
+
+
+class ResultCache:
+    """按键缓存多个生成样本，样本数达到 variety 后才开始命中并轮流返回"""
+
+    def __init__(self, max_entries=RESULT_CACHE_MAX_ENTRIES, max_bytes=RESULT_CACHE_MAX_BYTES,
+                 ttl=RESULT_CACHE_TTL, variety=RESULT_CACHE_VARIETY, db_path=RESULT_CACHE_DB):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.variety = max(1, variety)
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {"hits": 0, "misses": 0, "disk_loads": 0, "evictions": 0, "expired": 0}
+        if db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache ("
+                    "key TEXT NOT NULL, sample TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_key ON cache(key, created_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _load_from_disk(self, key, now):
+        rows = self._connect().execute(
+            "SELECT sample, created_at FROM cache WHERE key = ? AND created_at > ? "
+            "ORDER BY created_at DESC LIMIT ?",
+            (key, now - self.ttl, self.variety)
+        ).fetchall()
+        if not rows:
+            return None
+        entry = _Entry(min(created_at for _, created_at in rows))
+        for sample, _ in rows:
+            entry.samples.append(sample)
+            entry.size += len(sample.encode('utf-8'))
+        self.stats["disk_loads"] += 1
+        return entry
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _evict(self):
+        # 超出条数或内存上限时淘汰最久未使用的键
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.stats["evictions"] += 1
+
+    def _entry(self, key, now):
+        # 从磁盘载入的键不在这里淘汰：调用方修改完条目后再调用 _evict，避免修改已被淘汰的条目
+        entry = self._entries.get(key)
+        if entry is not None and now - entry.created_at > self.ttl:
+            self._remove(key)
+            self.stats["expired"] += 1
+            entry = None
+        if entry is None and self.db_path:
+            entry = self._load_from_disk(key, now)
+            if entry is not None:
+                self._entries[key] = entry
+                self._bytes += entry.size
+        if entry is not None and key in self._entries:
+            self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key):
+        """命中时返回缓存的文本，否则返回 None"""
+        with self._lock:
+            entry = self._entry(key, time.time())
+            if entry is None or len(entry.samples) < self.variety:
+                self.stats["misses"] += 1
+                self._evict()
+                return None
+            sample = entry.samples[entry.next_index % len(entry.samples)]
+            entry.next_index += 1
+            self.stats["hits"] += 1
+            self._evict()
+            return sample
+
+    def put(self, key, text):
+        """保存一个新生成的样本"""
+        if not text:
+            return
+        now = time.time()
+        with self._lock:
+            entry = self._entry(key, now)
+            if entry is None:
+                entry = _Entry(now)
+                self._entries[key] = entry
+            if len(entry.samples) >= self.variety:
+                self._evict()
+                return
+            entry.samples.append(text)
+            size = len(text.encode('utf-8'))
+            entry.size += size
+            self._bytes += size
+            # 追加之后再按上限淘汰（条目仍在缓存中，字节数统计一致）
+            self._evict()
+            if self.db_path:
+                conn = self._connect()
+                with conn:
+                    conn.execute("INSERT INTO cache (key, sample, created_at) VALUES (?, ?, ?)", (key, text, now))
+                    conn.execute("DELETE FROM cache WHERE created_at <= ?", (now - self.ttl,))
+
+    def hit_rate(self):
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """返回全局结果缓存；未启用缓存时返回 None"""
+    global _cache
+    if not RESULT_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+        return _cache
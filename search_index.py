@@ -0,0 +1,148 @@
+# 作品全文检索：SQLite FTS5 倒排索引，中文按单字和相邻二字切分（n-gram），英文和数字按单词切分
+# 索引与作品存在同一个数据库中，作品写入或删除时在同一个事务中增量更新索引
+import re
+
+# 参与切分的中日韩文字（不含标点）
+_CJK_RUN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+_WORD = re.compile(r'[0-9a-z]+')
+# 各字段在排序中的权重（bm25），关键词和标题命中比正文更重要
+FIELD_WEIGHTS = {"title": 2.0, "content": 1.0, "keywords": 3.0, "meta": 1.5}
+# 索引格式版本：切分方式变化时需要重建索引
+INDEX_VERSION = "1"
+
+
+def ngram_tokens(text):
+    """把文本切分为索引用的词元：中文单字和相邻二字，英文和数字为小写单词"""
+    if not text:
+        return []
+    text = str(text).lower()
+    tokens = []
+    for run in _CJK_RUN.findall(text):
+        # 同一段的二字组合连续排列，检索时可以用短语匹配连续的子串
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(_WORD.findall(text))
+    return tokens
+
+
+def query_phrases(query):
+    """把搜索词切分为检索用的短语：连续的中文切成相邻二字组成的短语（即子串匹配），单字用单字，英文和数字为单词"""
+    query = (query or "").lower()
+    phrases = []
+    for run in _CJK_RUN.findall(query):
+        phrases.append(run if len(run) == 1 else " ".join(run[i:i + 2] for i in range(len(run) - 1)))
+    return list(dict.fromkeys(phrases)), list(dict.fromkeys(_WORD.findall(query)))
+
+
+def match_expression(query):
+    """生成 FTS5 的 MATCH 表达式（所有短语都要命中，英文单词按前缀匹配），没有可检索的内容时返回 None"""
+    phrases, words = query_phrases(query)
+    parts = [f'"{phrase}"' for phrase in phrases] + [f'"{word}"*' for word in words]
+    return " AND ".join(parts) if parts else None
+
+
+def make_snippet(text, query, width=40):
+    """截取正文中第一个命中位置附近的片段"""
+    text = (text or "").replace("\n", " ")
+    positions = [text.find(part) for part in re.split(r'[\s,，]+', query or "") if part]
+    positions = [p for p in positions if p >= 0]
+    start = max(0, min(positions) - width // 4) if positions else 0
+    snippet = text[start:start + width]
+    return ("…" if start > 0 else "") + snippet + ("…" if start + width < len(text) else "")
+
+
+class SearchIndex:
+    """作品的全文索引：search_docs 记录每篇作品的来源、id和用户，search_fts 是对应的FTS5倒排索引
+
+    connect 返回当前线程的数据库连接；写入方法不提交事务，由调用方和作品本身的写入放在同一个事务中。
+    """
+
+    def __init__(self, connect):
+        self._connect = connect
+        self.available = True
+        conn = connect()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS search_docs (
+                    id INTEGER PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    doc_id INTEGER NOT NULL,
+                    user_id TEXT NOT NULL,
+                    timestamp REAL,
+                    UNIQUE (source, doc_id)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_search_docs_user ON search_docs(user_id, source)")
+            try:
+                conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(title, content, keywords, meta)")
+            except Exception as e:
+                # 个别 SQLite 编译版本没有 FTS5，此时搜索不可用（作品的保存和读取不受影响）
+                print(f"SQLite 不支持 FTS5，作品搜索不可用: {e}")
+                self.available = False
+
+    @staticmethod
+    def _fields(item):
+        meta = " ".join(str(item.get(key) or "") for key in ("type", "genre", "style"))
+        return [" ".join(ngram_tokens(item.get(key))) for key in ("title", "content", "keywords")] + \
+               [" ".join(ngram_tokens(meta))]
+
+    def add(self, conn, source, doc_id, user_id, item):
+        """索引一篇作品（已存在时替换）"""
+        self.remove(conn, source, doc_id)
+        # 旧版记录的时间戳可能是日期字符串，不参与排序
+        timestamp = item.get("timestamp")
+        cursor = conn.execute(
+            "INSERT INTO search_docs (source, doc_id, user_id, timestamp) VALUES (?, ?, ?, ?)",
+            (source, doc_id, user_id, timestamp if isinstance(timestamp, (int, float)) else None)
+        )
+        if self.available:
+            conn.execute("INSERT INTO search_fts (rowid, title, content, keywords, meta) VALUES (?, ?, ?, ?, ?)",
+                         [cursor.lastrowid] + self._fields(item))
+
+    def remove(self, conn, source, doc_id):
+        row = conn.execute("SELECT id FROM search_docs WHERE source = ? AND doc_id = ?", (source, doc_id)).fetchone()
+        if row is None:
+            return
+        conn.execute("DELETE FROM search_docs WHERE id = ?", (row[0],))
+        if self.available:
+            conn.execute("DELETE FROM search_fts WHERE rowid = ?", (row[0],))
+
+    def remove_where(self, conn, source, condition, params):
+        """删除 search_docs 中满足条件的作品（condition 为 SQL 条件，如 "user_id = ?"）"""
+        where = f"source = ? AND {condition}"
+        if self.available:
+            conn.execute(f"DELETE FROM search_fts WHERE rowid IN (SELECT id FROM search_docs WHERE {where})",
+                         [source] + list(params))
+        conn.execute(f"DELETE FROM search_docs WHERE {where}", [source] + list(params))
+
+    def clear(self, conn):
+        conn.execute("DELETE FROM search_docs")
+        if self.available:
+            conn.execute("DELETE FROM search_fts")
+
+    def search(self, user_id, query, limit=10, offset=0, sources=None):
+        """按相关度（bm25，相同时新作品在前）返回 ([(来源, id)], 命中总数)"""
+        expression = match_expression(query)
+        if expression is None or not self.available:
+            return [], 0
+        where = "search_fts MATCH ? AND d.user_id = ?"
+        params = [expression, user_id]
+        if sources:
+            where += f" AND d.source IN ({', '.join('?' * len(sources))})"
+            params += list(sources)
+        conn = self._connect()
+        # CROSS JOIN 固定连接顺序：先用倒排索引找出命中的作品，再按用户过滤，
+        # 否则 SQLite 可能先遍历该用户的全部作品，再逐条执行全文匹配
+        total = conn.execute(
+            f"SELECT COUNT(*) FROM search_fts CROSS JOIN search_docs d ON d.id = search_fts.rowid WHERE {where}",
+            params
+        ).fetchone()[0]
+        if total == 0:
+            return [], 0
+        weights = ", ".join(str(w) for w in FIELD_WEIGHTS.values())
+        rows = conn.execute(
+            f"SELECT d.source, d.doc_id FROM search_fts CROSS JOIN search_docs d ON d.id = search_fts.rowid "
+            f"WHERE {where} ORDER BY bm25(search_fts, {weights}), d.timestamp DESC LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return [(row[0], row[1]) for row in rows], total
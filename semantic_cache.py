@@ -0,0 +1,222 @@
+# 近似请求检索缓存：关键词集合用字n-gram哈希成向量（与关键词顺序无关），按生成类型和主题/诗歌类型分区，
+# 在已有作品中做最近邻检索（NumPy 暴力计算余弦相似度），相似度超过阈值且长度相符时直接返回已有作品
+import os
+import random
+import re
+import threading
+import zlib
+
+from metrics import registry
+from long_story import story_variant
+from prompts import STORY_GENRES, POEM_TYPES
+from result_cache import normalize_keywords
+
+# 是否启用（默认关闭）：开启后相似的请求可能直接得到已有的作品，而不是重新生成
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE", "0") == "1"
+# 余弦相似度阈值；关键词相同、只是顺序不同时为1
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.8"))
+# 向量维数和每个分区最多保留的作品数（超出后覆盖最旧的作品）
+SEMANTIC_CACHE_DIM = int(os.environ.get("SEMANTIC_CACHE_DIM", "256"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+# 故事字数与请求长度的允许偏差（比例）；诗歌要求行数相同
+SEMANTIC_CACHE_LENGTH_TOLERANCE = float(os.environ.get("SEMANTIC_CACHE_LENGTH_TOLERANCE", "0.2"))
+# 从相似度最高的几个作品中随机返回一个，避免相同请求总是得到同一篇
+SEMANTIC_CACHE_TOP_K = int(os.environ.get("SEMANTIC_CACHE_TOP_K", "3"))
+
+# 各类特征的权重：完整关键词、关键词中相邻的两个字、单字
+FEATURE_WEIGHTS = {"word": 0.4, "bigram": 0.8, "char": 1.0}
+# 不是作品的内容（出错或未就绪时的提示），不放入索引
+_NOT_WORKS = ("生成故事时出错", "生成诗歌时出错", "请使用中文关键词", "模型仍在加载中", "模型加载失败")
+_POEM_LINE = re.compile(r'[^，。！？；：,.!?;:\n]+')
+
+SEMANTIC_LOOKUPS = registry.counter(
+    "generation_semantic_cache_total", "近似请求检索次数（result 为 hit 或 miss）", ("kind", "result"))
+
+
+def keyword_set(keywords):
+    return frozenset(normalize_keywords(keywords).lower().split(',')) - {""}
+
+
+def keyword_features(keywords):
+    """关键词集合的特征：[(特征, 权重)]，与关键词的顺序和重复无关"""
+    features = {}
+    for word in keyword_set(keywords):
+        features["w:" + word] = FEATURE_WEIGHTS["word"]
+        for i in range(len(word) - 1):
+            features["b:" + word[i:i + 2]] = features.get("b:" + word[i:i + 2], 0) + FEATURE_WEIGHTS["bigram"]
+        for char in word:
+            features["c:" + char] = features.get("c:" + char, 0) + FEATURE_WEIGHTS["char"]
+    return features.items()
+
+
+def embed_keywords(keywords, dim=SEMANTIC_CACHE_DIM):
+    """把关键词集合哈希成单位长度的向量（带符号的特征哈希，crc32 在不同进程中结果相同）"""
+    import numpy as np
+
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, weight in keyword_features(keywords):
+        h = zlib.crc32(feature.encode('utf-8'))
+        vector[h % dim] += weight if (h >> 31) & 1 else -weight
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else vector
+
+
+def covers(words, others):
+    """words 中的每个关键词都与 others 中的某个关键词有相同的字（如“巨龙”与“龙”）
+
+    多出或缺少一个关键词时余弦相似度仍然较高，用这一条件排除。
+    """
+    chars = set("".join(others))
+    return all(chars & set(word) for word in words)
+
+
+def work_length(kind, text):
+    """作品的长度：故事为字数，诗歌为行数（与生成时按行尾标点计数的规则一致）"""
+    if kind == "story":
+        return len(re.sub(r'\s', '', text))
+    return len(_POEM_LINE.findall(text))
+
+
+def is_work(text):
+    """是否为生成的作品：生成函数出错、模型未就绪或关键词不支持时以文本形式返回提示"""
+    return bool(text) and not text.startswith(_NOT_WORKS)
+
+
+class _Partition:
+    """同一生成类型和主题/诗歌类型的作品：向量矩阵按需扩容，满了以后循环覆盖最旧的作品"""
+
+    def __init__(self, dim, capacity):
+        import numpy as np
+
+        self.capacity = capacity
+        self.vectors = np.zeros((min(64, capacity), dim), dtype=np.float32)
+        self.lengths = np.zeros(len(self.vectors), dtype=np.int32)
+        self.texts = [None] * len(self.vectors)
+        self.keywords = [None] * len(self.vectors)
+        self.size = 0
+        self.next = 0
+
+    def add(self, vector, length, text, keywords):
+        import numpy as np
+
+        if self.next == len(self.vectors) and len(self.vectors) < self.capacity:
+            grow = min(len(self.vectors) * 2, self.capacity)
+            self.vectors = np.concatenate([self.vectors, np.zeros((grow - len(self.vectors), self.vectors.shape[1]),
+                                                                  dtype=np.float32)])
+            self.lengths = np.concatenate([self.lengths, np.zeros(grow - len(self.lengths), dtype=np.int32)])
+            self.texts += [None] * (grow - len(self.texts))
+            self.keywords += [None] * (grow - len(self.keywords))
+        slot = self.next % self.capacity
+        self.vectors[slot] = vector
+        self.lengths[slot] = length
+        self.texts[slot] = text
+        self.keywords[slot] = keywords
+        self.size = min(self.size + 1, self.capacity)
+        self.next = slot + 1
+
+
+class SemanticCache:
+    """已有作品的近似检索索引，add 增量写入，lookup 返回相似请求的作品或 None"""
+
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, dim=SEMANTIC_CACHE_DIM,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES, tolerance=SEMANTIC_CACHE_LENGTH_TOLERANCE,
+                 top_k=SEMANTIC_CACHE_TOP_K):
+        self.threshold = threshold
+        self.dim = dim
+        self.max_entries = max(1, max_entries)
+        self.tolerance = tolerance
+        self.top_k = max(1, top_k)
+        self._partitions = {}
+        self._lock = threading.Lock()
+        self.stats = {"entries": 0, "hits": 0, "misses": 0}
+
+    def add(self, kind, keywords, style, text):
+        """加入一篇作品（kind 为 story 或 poem，style 为故事主题或诗歌类型）"""
+        words = keyword_set(keywords)
+        if not is_work(text) or not words:
+            return
+        vector = embed_keywords(keywords, self.dim)
+        with self._lock:
+            partition = self._partitions.get((kind, style))
+            if partition is None:
+                partition = self._partitions[(kind, style)] = _Partition(self.dim, self.max_entries)
+            partition.add(vector, work_length(kind, text), text, words)
+            self.stats["entries"] = sum(p.size for p in self._partitions.values())
+
+    def nearest(self, kind, keywords, style, length):
+        """返回长度相符、关键词互相覆盖的作品中相似度最高的至多 top_k 个 [(相似度, 文本)]，从高到低排列"""
+        import numpy as np
+
+        words = keyword_set(keywords)
+        if not words:
+            return []
+        vector = embed_keywords(keywords, self.dim)
+        with self._lock:
+            partition = self._partitions.get((kind, style))
+            if partition is None or partition.size == 0:
+                return []
+            scores = partition.vectors[:partition.size] @ vector
+            lengths = partition.lengths[:partition.size]
+            if kind == "story":
+                fits = np.abs(lengths - int(length)) <= self.tolerance * int(length)
+            else:
+                fits = lengths == int(length)
+            scores = np.where(fits, scores, -1.0)
+            # 先按相似度取出较多的候选，再检查关键词覆盖
+            k = min(self.top_k * 4, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            matches = [(float(scores[i]), partition.texts[i]) for i in top
+                       if scores[i] >= 0 and covers(words, partition.keywords[i])
+                       and covers(partition.keywords[i], words)]
+            return matches[:self.top_k]
+
+    def lookup(self, kind, keywords, style, length):
+        """相似度超过阈值时随机返回其中一篇作品，否则返回 None"""
+        matches = [text for score, text in self.nearest(kind, keywords, style, length) if score >= self.threshold]
+        with self._lock:
+            self.stats["hits" if matches else "misses"] += 1
+        SEMANTIC_LOOKUPS.inc(kind, "hit" if matches else "miss")
+        return random.choice(matches) if matches else None
+
+    def load_history(self, store):
+        """用历史记录中的作品建立索引（所有用户，较新的作品优先），返回加入的作品数"""
+        items = list(store.iter_works(self.max_entries * (len(STORY_GENRES) + len(POEM_TYPES))))
+        count = 0
+        # 从旧到新加入，分区满时保留较新的作品
+        for item in reversed(items):
+            kind = "story" if item.get("type") == "故事" else "poem"
+            if kind == "story":
+                # 与生成时一样分区（长篇分段生成的故事还按写作风格和主要角色区分）
+                style = story_variant(item.get("genre"), item.get("style"), item.get("character"),
+                                      item.get("max_length", 0))
+            else:
+                style = item.get("style")
+            if item.get("keywords") and style and is_work(item.get("content")):
+                self.add(kind, item["keywords"], style, item["content"])
+                count += 1
+        return count
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache():
+    """返回全局近似检索缓存（首次调用时用历史记录建立索引）；未启用时返回 None"""
+    global _cache
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            from history_store import get_history_store
+
+            cache = SemanticCache()
+            try:
+                count = cache.load_history(get_history_store())
+                if count:
+                    print(f"近似请求检索：已为 {count} 篇历史作品建立索引")
+            except Exception as e:
+                print(f"读取历史作品失败，近似请求检索只使用之后生成的作品: {e}")
+            _cache = cache
+        return _cache
@@ -0,0 +1,279 @@
+# 推测解码：小型草稿模型连续提出多个候选token，主模型一次前向计算验证，长文本生成时减少主模型的解码步数
+import os
+import threading
+import time
+
+from metrics import registry
+
+# 是否启用推测解码（默认关闭），以及草稿模型的名称和本地目录
+SPECULATIVE_ENABLED = os.environ.get("SPECULATIVE", "0") == "1"
+DRAFT_MODEL_NAME = os.environ.get("DRAFT_MODEL_NAME", "uer/gpt2-distil-chinese-cluecorpussmall")
+DRAFT_MODEL_DIR = os.environ.get("DRAFT_MODEL_DIR", "./local_draft_model")
+# 每轮草稿模型提出的token数
+SPECULATIVE_K = int(os.environ.get("SPECULATIVE_K", "4"))
+# 剩余生成长度不少于该值的请求才使用推测解码
+SPECULATIVE_MIN_TOKENS = int(os.environ.get("SPECULATIVE_MIN_TOKENS", "128"))
+# 接受率低于该值时回退到普通解码；至少提出 SPECULATIVE_WARMUP 个候选后才判断
+SPECULATIVE_MIN_ACCEPTANCE = float(os.environ.get("SPECULATIVE_MIN_ACCEPTANCE", "0.4"))
+SPECULATIVE_WARMUP = int(os.environ.get("SPECULATIVE_WARMUP", "32"))
+# 回退发生后，之后直接使用普通解码的请求数
+SPECULATIVE_COOLDOWN = int(os.environ.get("SPECULATIVE_COOLDOWN", "20"))
+
+SPECULATIVE_TOKENS = registry.counter(
+    "speculative_tokens_total", "推测解码的候选token数（proposed / accepted）", ("result",))
+SPECULATIVE_FALLBACKS = registry.counter("speculative_fallbacks_total", "推测解码回退到普通解码的次数")
+
+
+def load_draft_model(model_name=DRAFT_MODEL_NAME, model_dir=DRAFT_MODEL_DIR):
+    """加载草稿模型（本地优先，否则从镜像下载并保存到本地），失败时返回 None"""
+    from transformers import AutoModelForCausalLM
+
+    try:
+        try:
+            model = AutoModelForCausalLM.from_pretrained(model_dir, local_files_only=True)
+            print(f"成功从本地文件夹 {model_dir} 加载草稿模型")
+        except Exception:
+            print(f"尝试从国内镜像下载草稿模型 {model_name} 到 {model_dir}...")
+            model = AutoModelForCausalLM.from_pretrained(model_name, cache_dir=model_dir)
+            model.save_pretrained(model_dir)
+        return model.eval()
+    except Exception as e:
+        print(f"草稿模型加载失败，不使用推测解码: {e}")
+        return None
+
+
+def _crop(past, length):
+    """把KV缓存截断到前 length 个位置（丢弃未被接受的候选）"""
+    if hasattr(past, "crop"):
+        # 负数表示从末尾删除的token数，新旧版本的transformers都支持
+        remove = past.get_seq_length() - length
+        if remove > 0:
+            past.crop(-remove)
+        return past
+    return tuple((key[:, :, :length], value[:, :, :length]) for key, value in past)
+
+
+class SpeculativeDecoder:
+    """对单个请求执行推测采样：按 min(1, p/q) 接受草稿token，拒绝时从 max(0, p-q) 重新采样
+
+    主模型和草稿模型的logits经过同样的重复惩罚、温度和top-p处理，
+    因此生成结果的分布与普通解码相同（贪心解码时结果完全一致）。
+    """
+
+    def __init__(self, draft_model, k=SPECULATIVE_K):
+        self.draft = draft_model
+        self.k = max(1, k)
+        self._lock = threading.Lock()
+        self._cooldown = 0
+        self.stats = {
+            "requests": 0,
+            "rounds": 0,
+            "proposed": 0,
+            "accepted": 0,
+            "tokens": 0,
+            "fallbacks": 0,
+            "acceptance_rate": 0.0,
+            "estimated_speedup": 1.0,
+        }
+        # 用于估算加速比：每轮主模型验证耗时、草稿模型耗时
+        self._verify_seconds = 0.0
+        self._draft_seconds = 0.0
+
+    def eligible(self, request):
+        """剩余生成长度足够长、没有回退过且不在冷却期的请求才使用推测解码"""
+        if request.speculation_disabled:
+            return False
+        if request.max_new_tokens - len(request.output_ids) < SPECULATIVE_MIN_TOKENS:
+            return False
+        with self._lock:
+            if self._cooldown > 0:
+                self._cooldown -= 1
+                request.speculation_disabled = True
+                return False
+        return True
+
+    def _finish_request(self, proposed, accepted, fallback):
+        with self._lock:
+            self.stats["requests"] += 1
+            if self.stats["proposed"]:
+                self.stats["acceptance_rate"] = self.stats["accepted"] / self.stats["proposed"]
+            if fallback:
+                # 接受率过低时之后的若干请求直接使用普通解码，避免每个请求都先浪费草稿计算再回退
+                self.stats["fallbacks"] += 1
+                self._cooldown = SPECULATIVE_COOLDOWN
+                SPECULATIVE_FALLBACKS.inc()
+
+    def _record_round(self, proposed, accepted, emitted, draft_seconds, verify_seconds):
+        with self._lock:
+            self.stats["rounds"] += 1
+            self.stats["proposed"] += proposed
+            self.stats["accepted"] += accepted
+            self.stats["tokens"] += emitted
+            self._draft_seconds += draft_seconds
+            self._verify_seconds += verify_seconds
+            # 普通解码每个token约需一次主模型前向（与一次验证耗时相近）
+            per_round = self._draft_seconds + self._verify_seconds
+            if per_round > 0:
+                plain = self.stats["tokens"] * self._verify_seconds / self.stats["rounds"]
+                self.stats["estimated_speedup"] = plain / per_round
+        SPECULATIVE_TOKENS.inc("proposed", amount=proposed)
+        SPECULATIVE_TOKENS.inc("accepted", amount=accepted)
+
+    @staticmethod
+    def _distribution(logits, request, history):
+        """与 sample_next_tokens 相同的处理，返回下一个token的概率分布（贪心时为one-hot）"""
+        import torch
+        from batching import penalize_logits, warp_logits
+
+        ids = torch.tensor([history], device=logits.device)
+        logits = penalize_logits(logits.float().unsqueeze(0), [request], ids, torch.ones_like(ids), [history])
+        if not request.do_sample:
+            probs = torch.zeros_like(logits[0])
+            probs[logits[0].argmax()] = 1.0
+            return probs
+        return warp_logits(logits, [request]).softmax(dim=-1)[0]
+
+    @staticmethod
+    def _sample(probs):
+        import torch
+
+        return int(torch.multinomial(probs, num_samples=1))
+
+    @staticmethod
+    def _emit(request, token, eos_id):
+        """追加一个token并推送给流式输出，返回请求是否已结束"""
+        from batching import append_token
+
+        if token == eos_id or request.cancelled():
+            return True
+        append_token(request, token)
+        return (len(request.output_ids) >= request.max_new_tokens or request.reached_stop(token)
+                or request.degenerated(token))
+
+    def decode(self, model, request, past, attention_mask, position_ids, logits, eos_id):
+        """从当前状态开始用推测解码继续生成该请求（批次大小为1）
+
+        logits 为主模型对下一个token的输出。请求结束时返回 None；接受率过低回退时
+        返回 (past, attention_mask, position_ids, logits)，由调用方继续普通解码。
+        """
+        import torch
+
+        device = logits.device
+        draft = self.draft
+        proposed = accepted = 0
+        next_pos = int(position_ids[0, -1]) + 1
+
+        # 第一个token直接从主模型已有的logits采样
+        history = request.prompt_ids + request.output_ids
+        token = self._sample(self._distribution(logits[0], request, history))
+        if self._emit(request, token, eos_id):
+            self._finish_request(proposed, accepted, False)
+            return None
+
+        draft_past, draft_len = None, 0
+        while True:
+            # pending（最后一个token）尚未送入主模型
+            history = request.prompt_ids + request.output_ids
+            pending = history[-1]
+            k = min(self.k, request.max_new_tokens - len(request.output_ids))
+
+            # 草稿模型补齐尚未处理的token，然后连续提出k个候选
+            draft_start = time.perf_counter()
+            outputs = draft(input_ids=torch.tensor([history[draft_len:]], device=device),
+                            past_key_values=draft_past, use_cache=True)
+            draft_past, draft_len = outputs.past_key_values, len(history)
+            proposals, draft_probs = [], []
+            for i in range(k):
+                q = self._distribution(outputs.logits[0, -1], request, history + proposals)
+                candidate = self._sample(q)
+                proposals.append(candidate)
+                draft_probs.append(q)
+                if candidate == eos_id or i == k - 1:
+                    break
+                outputs = draft(input_ids=torch.tensor([[candidate]], device=device),
+                                past_key_values=draft_past, use_cache=True)
+                draft_past, draft_len = outputs.past_key_values, draft_len + 1
+            draft_seconds = time.perf_counter() - draft_start
+
+            # 主模型一次前向计算验证 pending 之后的全部候选
+            verify_start = time.perf_counter()
+            base = attention_mask.shape[1]
+            length = 1 + len(proposals)
+            outputs = model(
+                input_ids=torch.tensor([[pending] + proposals], device=device),
+                attention_mask=torch.cat([attention_mask, attention_mask.new_ones((1, length))], dim=1),
+                position_ids=torch.arange(next_pos, next_pos + length, device=device).unsqueeze(0),
+                past_key_values=past,
+                use_cache=True
+            )
+            past = outputs.past_key_values
+            verify_logits = outputs.logits[0]
+
+            n_accepted = 0
+            token = None
+            for j, candidate in enumerate(proposals):
+                p = self._distribution(verify_logits[j], request, history + proposals[:j])
+                q = draft_probs[j]
+                if float(torch.rand(())) * float(q[candidate]) < float(p[candidate]):
+                    n_accepted += 1
+                    continue
+                residual = (p - q).clamp(min=0)
+                total = float(residual.sum())
+                token = self._sample(residual / total if total > 0 else p)
+                break
+            if token is None:
+                # 全部接受时，主模型最后一个位置的输出额外给出一个token
+                p = self._distribution(verify_logits[len(proposals)], request, history + proposals)
+                token = self._sample(p)
+            verify_seconds = time.perf_counter() - verify_start
+
+            proposed += len(proposals)
+            accepted += n_accepted
+            new_tokens = proposals[:n_accepted] + [token]
+            finished = False
+            for emitted, new_token in enumerate(new_tokens, 1):
+                if self._emit(request, new_token, eos_id):
+                    finished = True
+                    break
+            self._record_round(len(proposals), n_accepted, emitted, draft_seconds, verify_seconds)
+            if finished:
+                self._finish_request(proposed, accepted, False)
+                return None
+
+            # 丢弃未被接受的候选：主模型保留 pending 和已接受的候选，草稿模型保留已确认的部分
+            past = _crop(past, base + 1 + n_accepted)
+            attention_mask = torch.cat([attention_mask, attention_mask.new_ones((1, 1 + n_accepted))], dim=1)
+            next_pos += 1 + n_accepted
+            draft_keep = min(draft_len, len(history) + n_accepted)
+            draft_past, draft_len = _crop(draft_past, draft_keep), draft_keep
+
+            if proposed >= SPECULATIVE_WARMUP and accepted / proposed < SPECULATIVE_MIN_ACCEPTANCE:
+                # 接受率过低：把 pending 送入主模型后交回普通解码
+                request.speculation_disabled = True
+                self._finish_request(proposed, accepted, True)
+                pending = request.output_ids[-1]
+                attention_mask = torch.cat([attention_mask, attention_mask.new_ones((1, 1))], dim=1)
+                position_ids = torch.tensor([[next_pos]], device=device)
+                outputs = model(
+                    input_ids=torch.tensor([[pending]], device=device),
+                    attention_mask=attention_mask,
+                    position_ids=position_ids,
+                    past_key_values=past,
+                    use_cache=True
+                )
+                return outputs.past_key_values, attention_mask, position_ids, outputs.logits[:, -1, :]
+
+
+def load_speculative_decoder(model):
+    """启用推测解码时加载草稿模型；词表与主模型不一致或主模型不在同一设备时返回 None"""
+    if not SPECULATIVE_ENABLED:
+        return None
+    draft = load_draft_model()
+    if draft is None:
+        return None
+    if draft.config.vocab_size != model.config.vocab_size:
+        print("草稿模型与主模型的词表不一致，不使用推测解码")
+        return None
+    draft = draft.to(model.device)
+    print(f"推测解码已启用：草稿模型 {DRAFT_MODEL_NAME}，每轮 {SPECULATIVE_K} 个候选")
+    return SpeculativeDecoder(draft)
@@ -0,0 +1,124 @@
+# 流式输出：把批处理线程逐个产生的token转换为增量文本
+import queue
+import threading
+import time
+
+from postprocess import clean_tokens
+
+_END = object()
+
+
+class CancelToken:
+    """取消标记：超时或客户端断开时调用 cancel()，批处理调度器在下一步解码前停止该请求"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback):
+        """注册取消时执行的回调（如通知工作进程），已取消时立即执行"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+
+class TokenStreamer:
+    """接收生成线程推送的token，迭代时返回新增的文本片段
+
+    每次只解码上一次输出位置附近的token，而不是重新解码全部已生成的token。
+    """
+
+    def __init__(self, tokenizer, timeout=None):
+        self.tokenizer = tokenizer
+        self.timeout = timeout
+        self.token_ids = []
+        self.text = ""
+        self.created_at = time.perf_counter()
+        self.first_token_at = None
+        # 生成结束时由批处理调度器填入各阶段耗时、prompt的token数、生成内容的对数概率和退化检测结果
+        self.timings = {}
+        self.prompt_tokens = 0
+        self.logprob = 0.0
+        self.quality = None
+        self._queue = queue.Queue()
+        # 增量解码的位置：[_prefix_offset, _read_offset) 是上一次已输出的token，作为解码的上下文
+        self._prefix_offset = 0
+        self._read_offset = 0
+
+    def put(self, token_id):
+        """由生成线程调用，推送一个新token"""
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self._queue.put(token_id)
+
+    def end(self):
+        """由生成线程调用，表示生成结束"""
+        self._queue.put(_END)
+
+    def fail(self, error):
+        """由生成线程调用，把异常传递给迭代方"""
+        self._queue.put(error)
+
+    @property
+    def ttft(self):
+        """首个token耗时（秒），尚未产生token时为 None"""
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.created_at
+
+    @property
+    def num_tokens(self):
+        """已生成的token数（不含prompt）"""
+        return len(self.token_ids)
+
+    def _decode_new(self, finished):
+        # 连同上一次输出的token一起解码，保证子词拼接和字间空格与完整解码一致
+        decode = self.tokenizer.decode
+        prefix = decode(self.token_ids[self._prefix_offset:self._read_offset], skip_special_tokens=True)
+        text = decode(self.token_ids[self._prefix_offset:], skip_special_tokens=True)
+        # 多字节字符尚未完整时先不输出
+        if len(text) <= len(prefix) or (text.endswith("�") and not finished):
+            return ""
+        self._prefix_offset, self._read_offset = self._read_offset, len(self.token_ids)
+        delta = text[len(prefix):]
+        context = self.text[-1:]
+        return clean_tokens(context + delta)[len(context):]
+
+    def __iter__(self):
+        finished = False
+        while not finished:
+            items = [self._queue.get(timeout=self.timeout)]
+            # 一次取出所有已到达的token，避免每个token都重新解码一次
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for item in items:
+                if item is _END:
+                    finished = True
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                self.token_ids.append(item)
+
+            delta = self._decode_new(finished)
+            if delta:
+                self.text += delta
+                yield delta
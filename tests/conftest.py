@@ -0,0 +1,58 @@
+# 测试公共部分：把项目根目录加入 sys.path，并提供随机初始化的小型GPT-2（离线，不下载模型）
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 词表：测试用到的关键词、prompt模板中的字和一部分常用汉字
+TEST_KEYWORDS = ["公主,城堡,龙", "春天,花朵,希望", "月光,思念", "飞船,星球,机器人"]
+
+
+def _build_model(model_dir, seed):
+    import torch
+    from transformers import BertTokenizer, GPT2Config, GPT2LMHeadModel
+
+    from prompts import template_prefixes
+
+    vocab_file = os.path.join(model_dir, "vocab.txt")
+    if not os.path.exists(vocab_file):
+        chars = set("".join(template_prefixes()) + "".join(TEST_KEYWORDS) + "故事内容诗歌：，。！？\n")
+        chars |= {chr(code) for code in range(0x4E00, 0x4E00 + 500)}
+        vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + sorted(c for c in chars if not c.isspace())
+        with open(vocab_file, "w", encoding="utf-8") as f:
+            f.write("\n".join(vocab) + "\n")
+    tokenizer = BertTokenizer(vocab_file)
+    torch.manual_seed(seed)
+    # initializer_range 调大，让注意力明显依赖上下文（KV缓存出错时输出会变）
+    config = GPT2Config(vocab_size=tokenizer.vocab_size, n_positions=256, n_embd=64, n_layer=2, n_head=4,
+                        bos_token_id=tokenizer.cls_token_id, eos_token_id=tokenizer.sep_token_id,
+                        pad_token_id=tokenizer.pad_token_id, initializer_range=0.2)
+    model = GPT2LMHeadModel(config).eval()
+    return SimpleNamespace(model=model, tokenizer=tokenizer, model_dir=model_dir)
+
+
+@pytest.fixture(scope="session")
+def tiny_generator(tmp_path_factory):
+    """与 text-generation pipeline 接口相同的最小生成器（model + tokenizer）"""
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    return _build_model(str(tmp_path_factory.mktemp("tiny_model")), seed=0)
+
+
+@pytest.fixture(scope="session")
+def draft_model(tiny_generator):
+    """在 tiny_generator 参数上加噪声的草稿模型：部分候选被接受、部分被拒绝"""
+    import copy
+
+    import torch
+
+    model = copy.deepcopy(tiny_generator.model)
+    torch.manual_seed(1)
+    with torch.no_grad():
+        for param in model.parameters():
+            param.add_(torch.randn_like(param) * 0.02)
+    return model
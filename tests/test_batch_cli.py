@@ -0,0 +1,70 @@
+# 命令行批量生成：以文本形式返回的错误记为失败，续跑时重试失败的行，残缺的最后一行不影响新记录
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import batch_cli
+
+
+@pytest.fixture(autouse=True)
+def no_model(monkeypatch):
+    # 不加载模型：没有分词器时按字数统计token
+    monkeypatch.setattr(batch_cli.model_manager, "get_generator", lambda: SimpleNamespace())
+
+
+def write_rows(path, keywords):
+    path.write_text("".join(json.dumps({"id": str(n), "keywords": k}, ensure_ascii=False) + "\n"
+                            for n, k in enumerate(keywords, 1)), encoding="utf-8")
+
+
+def read_records(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def fake_story(results):
+    calls = []
+
+    def generate_story(keywords, genre, max_length, temperature, usage=None):
+        calls.append(keywords)
+        return results.get(keywords, f"{keywords}的故事。")
+    generate_story.calls = calls
+    return generate_story
+
+
+def test_text_errors_are_failures_and_retried(tmp_path):
+    rows, output = tmp_path / "rows.jsonl", tmp_path / "out.jsonl"
+    write_rows(rows, ["公主", "城堡", "dragon", "龙"])
+    story = fake_story({"城堡": "模型仍在加载中，请稍后再试", "dragon": "请使用中文关键词，生成英文故事暂不支持。",
+                        "龙": "生成故事时出错: CUDA out of memory"})
+    assert batch_cli.run(str(rows), str(output), story, None, concurrency=2) == (1, 3)
+    records = {record["id"]: record for record in read_records(output)}
+    assert records["1"]["content"] == "公主的故事。"
+    assert records["2"] == {"id": "2", "error": "模型仍在加载中，请稍后再试"}
+    assert "content" not in records["4"]
+    assert batch_cli.load_done_ids(str(output)) == {"1"}
+    # 续跑只重新生成失败的行
+    story = fake_story({"dragon": "请使用中文关键词，生成英文故事暂不支持。"})
+    assert batch_cli.run(str(rows), str(output), story, None, concurrency=2) == (2, 1)
+    assert sorted(story.calls) == sorted(["城堡", "dragon", "龙"])
+    assert batch_cli.load_done_ids(str(output)) == {"1", "2", "4"}
+
+
+def test_old_outputs_with_text_errors_are_not_done(tmp_path):
+    output = tmp_path / "out.jsonl"
+    output.write_text(json.dumps({"id": "1", "content": "模型加载失败: 找不到模型"}, ensure_ascii=False) + "\n"
+                      + json.dumps({"id": "2", "content": "一个故事。"}, ensure_ascii=False) + "\n", encoding="utf-8")
+    assert batch_cli.load_done_ids(str(output)) == {"2"}
+
+
+def test_resume_after_truncated_last_line(tmp_path):
+    rows, output = tmp_path / "rows.jsonl", tmp_path / "out.jsonl"
+    write_rows(rows, ["公主", "城堡"])
+    # 上次运行在写第二行时中断
+    output.write_text(json.dumps({"id": "1", "content": "公主的故事。"}, ensure_ascii=False) + '\n{"id": "2", "con',
+                      encoding="utf-8")
+    assert batch_cli.run(str(rows), str(output), fake_story({}), None, concurrency=1) == (1, 0)
+    lines = output.read_text(encoding="utf-8").splitlines()
+    assert lines[1] == '{"id": "2", "con'
+    assert json.loads(lines[2])["content"] == "城堡的故事。"
+    assert batch_cli.load_done_ids(str(output)) == {"1", "2"}
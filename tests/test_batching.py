@@ -0,0 +1,57 @@
+# 批处理调度：批量生成与逐个生成在贪心解码下结果一致
+import pytest
+
+from batching import BatchScheduler, GenerationRequest, run_batch
+from prompts import build_poem_prompt, build_story_prompt
+
+PROMPTS = [
+    build_story_prompt("公主,城堡,龙", "奇幻"),
+    build_poem_prompt("月光,思念", "古体诗"),
+    build_story_prompt("飞船,星球,机器人", "科幻"),
+]
+PARAMS = dict(max_new_tokens=24, do_sample=False, repetition_penalty=1.2, no_repeat_ngram_size=2, guard=False)
+
+
+def generate(generator, prompts, **params):
+    requests = [GenerationRequest(prompt, **dict(PARAMS, **params)) for prompt in prompts]
+    run_batch(generator.model, generator.tokenizer, requests)
+    return [request.output_ids for request in requests]
+
+
+def test_batched_greedy_matches_single_requests(tiny_generator):
+    single = [generate(tiny_generator, [prompt])[0] for prompt in PROMPTS]
+    assert all(len(ids) == PARAMS["max_new_tokens"] for ids in single)
+    assert generate(tiny_generator, PROMPTS) == single
+
+
+def test_finished_rows_leave_the_batch_without_changing_others(tiny_generator):
+    # 长度不同的请求：较短的请求先结束并移出批次，其余请求的结果不变
+    lengths = [4, 24, 12]
+    requests = [GenerationRequest(prompt, **dict(PARAMS, max_new_tokens=n)) for prompt, n in zip(PROMPTS, lengths)]
+    run_batch(tiny_generator.model, tiny_generator.tokenizer, requests)
+    for request, prompt, n in zip(requests, PROMPTS, lengths):
+        assert request.output_ids == generate(tiny_generator, [prompt], max_new_tokens=n)[0]
+
+
+def test_scheduler_returns_generated_text_only(tiny_generator):
+    scheduler = BatchScheduler(tiny_generator, wait_ms=5)
+    text = scheduler.submit(PROMPTS[0], **PARAMS).result(timeout=60)
+    streamed = "".join(scheduler.stream(PROMPTS[0], **PARAMS))
+    assert text == streamed
+    assert not text.startswith(PROMPTS[0])
+
+
+def test_cancelled_request_stops_early(tiny_generator):
+    from streaming import CancelToken
+
+    cancel = CancelToken()
+    cancel.cancel()
+    scheduler = BatchScheduler(tiny_generator, wait_ms=5)
+    streamer = scheduler.stream(PROMPTS[0], cancel=cancel, **PARAMS)
+    assert "".join(streamer) == ""
+
+
+@pytest.mark.parametrize("score", [False, True])
+def test_scored_requests_keep_greedy_output(tiny_generator, score):
+    # 记录对数概率（多候选重排序）不影响生成结果
+    assert generate(tiny_generator, PROMPTS[:1], score=score) == generate(tiny_generator, PROMPTS[:1])
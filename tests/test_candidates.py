@@ -0,0 +1,41 @@
+# 多候选生成：同一prompt的一组请求只预填充一次、总是在同一批次中生成
+from batching import BatchScheduler, GenerationRequest, run_batch
+from prompts import build_poem_prompt
+
+PROMPT = build_poem_prompt("春天,花朵,希望", "现代诗")
+PARAMS = dict(max_new_tokens=16, do_sample=False, guard=False)
+
+
+def test_identical_prompts_are_prefilled_once(tiny_generator, monkeypatch):
+    model = tiny_generator.model
+    batch_sizes = []
+    forward = model.forward
+
+    def counting_forward(*args, **kwargs):
+        batch_sizes.append(kwargs["input_ids"].shape[0])
+        return forward(*args, **kwargs)
+
+    monkeypatch.setattr(model, "forward", counting_forward)
+    requests = [GenerationRequest(PROMPT, score=True, **PARAMS) for _ in range(4)]
+    run_batch(model, tiny_generator.tokenizer, requests)
+    # 预填充只计算一行，之后展开成4行解码
+    assert batch_sizes[0] == 1
+    assert batch_sizes[1] == 4
+    monkeypatch.undo()
+    single = GenerationRequest(PROMPT, score=True, **PARAMS)
+    run_batch(model, tiny_generator.tokenizer, [single])
+    for request in requests:
+        assert request.output_ids == single.output_ids
+        assert abs(request.logprob - single.logprob) < 1e-4
+
+
+def test_candidate_group_is_not_split_across_batches(tiny_generator):
+    scheduler = BatchScheduler(tiny_generator, max_batch_size=2, wait_ms=50)
+    streamers = scheduler.stream_many(PROMPT, 3, **PARAMS)
+    other = scheduler.stream(PROMPT, **PARAMS)
+    texts = ["".join(streamer) for streamer in streamers]
+    "".join(other)
+    # 超过批次上限的一组单独组成一个批次，之后的请求进入下一个批次
+    assert scheduler.stats["batches"] == 2
+    assert scheduler.stats["max_batch_size_seen"] == 3
+    assert len(set(texts)) == 1
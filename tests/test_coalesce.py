@@ -0,0 +1,104 @@
+# 相同请求合并：同时提交的相同请求只调用一次模型；关闭采样请求合并时采样请求各自生成
+import threading
+
+import pytest
+
+from coalesce import SingleFlight
+from streaming import CancelToken
+
+
+class FakeStream:
+    """按顺序输出若干段文本的假流；gate 打开前阻塞，模拟仍在进行中的生成"""
+
+    def __init__(self, text, gate, cancel):
+        self.text = text
+        self.gate = gate
+        self.cancel = cancel
+        self.timings = {}
+        self.num_tokens = len(text)
+
+    def __iter__(self):
+        for char in self.text:
+            self.gate.wait(10)
+            if self.cancel.cancelled:
+                return
+            yield char
+
+
+class FakeEngine:
+    def __init__(self):
+        self.gate = threading.Event()
+        self.calls = 0
+
+    def stream(self, prompt, cancel=None, **params):
+        self.calls += 1
+        return FakeStream(f"样本{self.calls}", self.gate, cancel)
+
+
+@pytest.fixture
+def engine():
+    engine = FakeEngine()
+    yield engine
+    engine.gate.set()
+
+
+def read_all(streams):
+    return ["".join(stream) for stream in streams]
+
+
+def test_identical_sampled_requests_make_one_model_call_by_default(engine):
+    flights = SingleFlight()
+    first = flights.stream("k", engine, "prompt", do_sample=True, temperature=0.7)
+    second = flights.stream("k", engine, "prompt", do_sample=True, temperature=0.7)
+    engine.gate.set()
+    # 接入的请求得到同一篇作品
+    assert read_all([first, second]) == ["样本1", "样本1"]
+    assert engine.calls == 1
+    assert (first.shared, second.shared) == (False, True)
+    assert second.num_tokens == 3
+    assert flights.stats == {"flights": 1, "attached": 1}
+
+
+def test_greedy_requests_attach_when_sampled_are_not_shared(engine):
+    flights = SingleFlight(share_sampled=False)
+    first = flights.stream("k", engine, "prompt", do_sample=False)
+    second = flights.stream("k", engine, "prompt", do_sample=False)
+    engine.gate.set()
+    assert read_all([first, second]) == ["样本1", "样本1"]
+    assert engine.calls == 1 and second.shared
+
+
+def test_sampled_requests_generate_separately_when_not_shared(engine):
+    flights = SingleFlight(share_sampled=False)
+    streams = [flights.stream("k", engine, "prompt", do_sample=True) for _ in range(2)]
+    engine.gate.set()
+    assert read_all(streams) == ["样本1", "样本2"]
+    assert engine.calls == 2
+    assert not any(getattr(stream, "shared", False) for stream in streams)
+    assert flights.in_flight() == 0
+
+
+def test_different_keys_and_finished_flights_are_not_merged(engine):
+    flights = SingleFlight()
+    engine.gate.set()
+    assert read_all([flights.stream("a", engine, "prompt")]) == ["样本1"]
+    assert read_all([flights.stream("b", engine, "prompt")]) == ["样本2"]
+    # 生成结束后相同的请求重新生成
+    again = flights.stream("a", engine, "prompt")
+    assert read_all([again]) == ["样本3"] and not again.shared
+    assert flights.in_flight() == 0
+
+
+def test_generation_is_cancelled_when_all_subscribers_leave(engine):
+    flights = SingleFlight()
+    cancels = [CancelToken(), CancelToken()]
+    first = flights.stream("k", engine, "prompt", cancel=cancels[0])
+    flights.stream("k", engine, "prompt", cancel=cancels[1])
+    flight = flights._flights["k"]
+    cancels[0].cancel()
+    # 还有订阅者时继续生成
+    assert not flight.cancel.cancelled
+    assert list(first) == []
+    cancels[1].cancel()
+    assert flight.cancel.cancelled
+    assert flights.in_flight() == 0
@@ -0,0 +1,53 @@
+# 收藏存储：固定id、只能取消自己的收藏、旧版列表格式迁移、与历史记录共用数据库
+import json
+
+from favorites_store import FavoritesStore
+from history_store import HistoryStore
+
+
+def work(n):
+    return {"title": f"诗{n}", "content": f"诗句{n}", "type": "诗歌"}
+
+
+def test_ids_stay_stable_after_remove(tmp_path):
+    store = FavoritesStore(path=str(tmp_path / "works.db"), legacy_files=())
+    ids = [store.add(work(n)) for n in range(4)]
+    assert store.remove(ids[1])
+    assert not store.remove(ids[1])
+    # 取消一条收藏后，其余收藏的id不变，仍能按id读取
+    assert [item["id"] for item in store.page()] == [ids[3], ids[2], ids[0]]
+    assert store.get(ids[2])["title"] == "诗2"
+
+
+def test_cannot_remove_other_users_favorite(tmp_path):
+    store = FavoritesStore(path=str(tmp_path / "works.db"), legacy_files=())
+    item_id = store.add(work(1), "alice")
+    assert not store.remove(item_id, "bob")
+    assert store.get(item_id, "bob") is None
+    assert store.count("alice") == 1
+
+
+def test_legacy_list_format_is_migrated(tmp_path):
+    legacy = tmp_path / "favorites.json"
+    legacy.write_text(json.dumps([
+        ["春晓", "春眠不觉晓", "诗歌"],
+        {"title": "小红帽", "content": "从前有个小女孩", "type": "故事", "timestamp": "2023-06-01 08:00:00"},
+    ], ensure_ascii=False), encoding="utf-8")
+    store = FavoritesStore(path=str(tmp_path / "works.db"), legacy_files=(str(legacy), str(tmp_path / "missing.json")))
+    items = store.page()
+    assert [(item["title"], item["type"]) for item in items] == [("小红帽", "故事"), ("春晓", "诗歌")]
+    assert items[0]["date"] == "2023-06-01 08:00:00"
+    assert FavoritesStore(path=str(tmp_path / "works.db"), legacy_files=(str(legacy),)).count() == 2
+
+
+def test_shares_database_with_history(tmp_path):
+    path = str(tmp_path / "works.db")
+    history = HistoryStore(path=path, retention=1, legacy_file=None)
+    favorites = FavoritesStore(path=path, legacy_files=())
+    favorite_id = favorites.add(work(1))
+    for n in range(3):
+        history.add(work(n))
+    # 历史记录的保留条数清理不影响收藏
+    assert history.count() == 1
+    assert favorites.count() == 1
+    assert favorites.get(favorite_id)["content"] == "诗句1"
@@ -0,0 +1,113 @@
+# 历史记录存储：分页、保留条数、按用户分区、旧版JSON迁移
+import json
+
+import pytest
+
+from history_store import HistoryStore
+
+
+def make_store(tmp_path, retention=50, legacy_file=None):
+    return HistoryStore(path=str(tmp_path / "history.db"), retention=retention, legacy_file=legacy_file)
+
+
+def story(n):
+    return {"title": f"故事{n}", "content": f"内容{n}", "type": "故事", "timestamp": 1000.0 + n, "max_length": 300}
+
+
+def test_pages_are_newest_first(tmp_path):
+    store = make_store(tmp_path)
+    for n in range(7):
+        store.add(story(n))
+    assert store.count() == 7
+    assert store.page_count(page_size=3) == 3
+    assert [item["title"] for item in store.page(page=1, page_size=3)] == ["故事6", "故事5", "故事4"]
+    assert [item["title"] for item in store.page(page=3, page_size=3)] == ["故事0"]
+    assert store.page(page=4, page_size=3) == []
+    # 非列字段存入 extra，读取时还原
+    assert store.page(page=1, page_size=1)[0]["max_length"] == 300
+
+
+def test_empty_store_has_one_page(tmp_path):
+    store = make_store(tmp_path)
+    assert store.page_count() == 1
+    assert store.page() == []
+
+
+def test_retention_keeps_newest_items(tmp_path):
+    store = make_store(tmp_path, retention=3)
+    ids = [store.add(story(n)) for n in range(5)]
+    assert store.count() == 3
+    assert [item["id"] for item in store.page()] == ids[:1:-1]
+    assert store.get(ids[0]) is None
+
+
+def test_users_are_isolated(tmp_path):
+    store = make_store(tmp_path, retention=2)
+    alice_id = store.add(story(1), "alice")
+    for n in range(3):
+        store.add(story(n), "bob")
+    # bob 的保留条数清理不影响 alice
+    assert store.count("alice") == 1
+    assert store.count("bob") == 2
+    assert store.get(alice_id, "bob") is None
+    store.clear("bob")
+    assert store.count("bob") == 0
+    assert store.get(alice_id, "alice")["title"] == "故事1"
+
+
+def test_legacy_json_is_migrated_once(tmp_path):
+    legacy = tmp_path / "generation_history.json"
+    legacy.write_text(json.dumps([
+        {"title": "旧故事", "content": "很久以前", "type": "故事", "timestamp": "2023-05-01 10:00:00"},
+        {"content": "床前明月光", "type": "诗歌", "timestamp": "2023-05-02 09:00:00", "id": 7},
+    ], ensure_ascii=False), encoding="utf-8")
+    store = make_store(tmp_path, legacy_file=str(legacy))
+    items = store.page()
+    assert [item["content"] for item in items] == ["床前明月光", "很久以前"]
+    # 日期字符串保存为 date，没有标题的旧记录补上标题
+    assert items[0]["date"] == "2023-05-02 09:00:00"
+    assert "timestamp" not in items[0]
+    assert items[0]["title"] == "诗歌_2023-05-02 09:00:00"
+    # 重新打开数据库不会重复导入
+    assert make_store(tmp_path, legacy_file=str(legacy)).count() == 2
+    assert store.migrate_json(str(legacy)) == 0
+
+
+def test_failed_migration_imports_nothing_and_can_be_retried(tmp_path, monkeypatch):
+    legacy = tmp_path / "generation_history.json"
+    legacy.write_text(json.dumps([story(n) for n in range(3)], ensure_ascii=False), encoding="utf-8")
+    store = make_store(tmp_path)
+    index_add = store.search_index.add
+    calls = []
+
+    def crash_on_second_item(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise RuntimeError("进程中断")
+        return index_add(*args)
+
+    monkeypatch.setattr(store.search_index, "add", crash_on_second_item)
+    with pytest.raises(RuntimeError):
+        store.migrate_json(str(legacy))
+    # 已写入的第一条随迁移标记一起回滚
+    assert store.count() == 0
+    monkeypatch.setattr(store.search_index, "add", index_add)
+    assert store.migrate_json(str(legacy)) == 3
+    assert [item["title"] for item in store.page()] == ["故事2", "故事1", "故事0"]
+    assert store.migrate_json(str(legacy)) == 0
+
+
+def test_migration_respects_retention(tmp_path):
+    legacy = tmp_path / "generation_history.json"
+    legacy.write_text(json.dumps([story(n) for n in range(5)], ensure_ascii=False), encoding="utf-8")
+    store = make_store(tmp_path, retention=2, legacy_file=str(legacy))
+    assert [item["title"] for item in store.page()] == ["故事4", "故事3"]
+
+
+def test_iter_works_covers_all_users_newest_first(tmp_path):
+    store = make_store(tmp_path)
+    for n in range(4):
+        store.add(story(n), "alice" if n % 2 else "bob")
+    assert [item["title"] for item in store.iter_works()] == ["故事3", "故事2", "故事1", "故事0"]
+    assert [item["title"] for item in store.iter_works(2)] == ["故事3", "故事2"]
+    assert next(store.iter_works())["max_length"] == 300
@@ -0,0 +1,40 @@
+# 前缀KV缓存：命中缓存、不同前缀的分组合并为一个批次时，贪心解码结果与完整预填充一致
+from batching import GenerationRequest, run_batch
+from prefix_cache import PrefixCache
+from prompts import build_poem_prompt, build_story_prompt, poem_prompt_prefix, story_prompt_prefix
+
+CASES = [
+    (build_story_prompt("公主,城堡,龙", "奇幻"), story_prompt_prefix("奇幻")),
+    (build_story_prompt("飞船,星球,机器人", "奇幻"), story_prompt_prefix("奇幻")),
+    (build_poem_prompt("月光,思念", "古体诗"), poem_prompt_prefix("古体诗")),
+    (build_story_prompt("春天,花朵", "科幻"), None),
+]
+PARAMS = dict(max_new_tokens=20, do_sample=False, repetition_penalty=1.2, no_repeat_ngram_size=2, guard=False)
+
+
+def generate(generator, cases, prefix_cache=None):
+    requests = [GenerationRequest(prompt, prefix=prefix, **PARAMS) for prompt, prefix in cases]
+    run_batch(generator.model, generator.tokenizer, requests, prefix_cache=prefix_cache)
+    return [request.output_ids for request in requests]
+
+
+def test_prefix_cache_matches_full_prefill(tiny_generator):
+    cache = PrefixCache(tiny_generator.model, tiny_generator.tokenizer)
+    expected = [generate(tiny_generator, [case])[0] for case in CASES]
+    assert [generate(tiny_generator, [case], cache)[0] for case in CASES] == expected
+    assert cache.stats["hits"] >= 1
+
+
+def test_mixed_prefix_groups_merge_into_one_batch(tiny_generator):
+    # 同一前缀、不同前缀和没有前缀的请求在同一批次中，各分组分别预填充后合并
+    cache = PrefixCache(tiny_generator.model, tiny_generator.tokenizer)
+    expected = [generate(tiny_generator, [case])[0] for case in CASES]
+    assert generate(tiny_generator, CASES, cache) == expected
+
+
+def test_prefix_cache_evicts_least_recently_used(tiny_generator):
+    cache = PrefixCache(tiny_generator.model, tiny_generator.tokenizer, max_entries=1)
+    cache.get(story_prompt_prefix("奇幻"))
+    cache.get(poem_prompt_prefix("古体诗"))
+    cache.get(story_prompt_prefix("奇幻"))
+    assert cache.stats == {"hits": 0, "misses": 3}
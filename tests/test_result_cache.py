@@ -0,0 +1,88 @@
+# 结果缓存：样本轮换、TTL过期、LRU条数和字节上限淘汰、磁盘层重启后保留
+import pytest
+
+import result_cache
+from result_cache import ResultCache, make_cache_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可控的当前时间"""
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "time", lambda: now[0])
+    return now
+
+
+def assert_bytes_consistent(cache):
+    assert cache._bytes == sum(entry.size for entry in cache._entries.values())
+    assert cache._bytes <= cache.max_bytes and len(cache._entries) <= cache.max_entries
+
+
+def test_cache_key_normalizes_keywords_and_buckets_temperature():
+    assert make_cache_key("story", " 公主， 城堡,,", "奇幻", 300.0, 0.72) == "story|公主,城堡|奇幻|300|0.7"
+    assert make_cache_key("story", "公主,城堡", "奇幻", 300, 0.68) == make_cache_key("story", "公主,城堡", "奇幻", 300, 0.7)
+
+
+def test_hits_only_after_variety_samples_and_rotates(clock):
+    cache = ResultCache(variety=2, db_path="")
+    cache.put("k", "甲")
+    assert cache.get("k") is None
+    cache.put("k", "乙")
+    cache.put("k", "丙")  # 样本数已满，不再保存
+    assert [cache.get("k") for _ in range(3)] == ["甲", "乙", "甲"]
+    assert cache.stats["hits"] == 3 and cache.stats["misses"] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = ResultCache(ttl=60, variety=1, db_path="")
+    cache.put("k", "故事")
+    clock[0] += 59
+    assert cache.get("k") == "故事"
+    clock[0] += 2
+    assert cache.get("k") is None
+    assert cache.stats["expired"] == 1
+    assert_bytes_consistent(cache)
+
+
+def test_least_recently_used_key_is_evicted(clock):
+    cache = ResultCache(max_entries=2, variety=1, db_path="")
+    cache.put("a", "一")
+    cache.put("b", "二")
+    cache.get("a")
+    cache.put("c", "三")
+    assert cache.get("b") is None
+    assert cache.get("a") == "一" and cache.get("c") == "三"
+    assert cache.stats["evictions"] == 1
+
+
+def test_byte_cap_evicts_oldest(clock):
+    cache = ResultCache(max_bytes=12, variety=1, db_path="")
+    cache.put("a", "一二")
+    cache.put("b", "三四")
+    cache.put("c", "五六")  # 每个样本6字节，超出上限淘汰 a
+    assert cache.get("a") is None and cache.get("b") == "三四"
+    assert_bytes_consistent(cache)
+
+
+def test_disk_layer_survives_restart_and_respects_ttl(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+    cache = ResultCache(ttl=60, variety=2, db_path=path)
+    cache.put("k", "甲")
+    cache.put("k", "乙")
+    restarted = ResultCache(ttl=60, variety=2, db_path=path)
+    assert restarted.get("k") in ("甲", "乙")
+    assert restarted.stats["disk_loads"] == 1
+    clock[0] += 61
+    assert ResultCache(ttl=60, variety=2, db_path=path).get("k") is None
+
+
+def test_put_after_disk_load_over_byte_cap_keeps_accounting(tmp_path, clock):
+    # 从磁盘载入的条目本身就超出内存上限时，追加样本后再淘汰，字节数统计不会错乱
+    path = str(tmp_path / "cache.db")
+    ResultCache(variety=2, db_path=path).put("k", "很长的一段故事")
+    cache = ResultCache(max_bytes=10, variety=2, db_path=path)
+    cache.put("k", "短")
+    assert_bytes_consistent(cache)
+    cache.put("other", "诗")
+    assert_bytes_consistent(cache)
+    assert cache.get("other") is None  # variety=2，只有一个样本不命中
@@ -0,0 +1,76 @@
+# 作品全文检索：中文子串匹配、按用户过滤、收藏与历史共用索引、删除后从索引中移除、重建索引
+import sqlite3
+
+import pytest
+
+from favorites_store import FavoritesStore
+from history_store import HistoryStore
+from search_index import match_expression, ngram_tokens
+
+
+@pytest.fixture
+def stores(tmp_path):
+    path = str(tmp_path / "works.db")
+    history = HistoryStore(path=path, retention=3, legacy_file=None)
+    favorites = FavoritesStore(path=path, legacy_files=())
+    if not history.search_index.available:
+        pytest.skip("SQLite 不支持 FTS5")
+    return history, favorites
+
+
+def test_tokens_and_match_expression():
+    assert ngram_tokens("小龙 AI") == ["小", "龙", "小龙", "ai"]
+    assert match_expression("城堡里的龙") == '"城堡 堡里 里的 的龙"'
+    assert match_expression("，。") is None
+
+
+def test_search_matches_substrings_for_one_user(stores):
+    history, favorites = stores
+    castle = history.add({"title": "城堡", "content": "公主住在古老的城堡里", "type": "故事"}, "alice")
+    history.add({"title": "森林", "content": "小鹿在森林里奔跑", "type": "故事"}, "alice")
+    history.add({"title": "城堡", "content": "公主住在古老的城堡里", "type": "故事"}, "bob")
+    favorite = favorites.add({"title": "古堡之夜", "content": "古老的城堡在月光下沉睡", "type": "诗歌"}, "alice")
+    hits, total = history.search("alice", "古老的城堡")
+    assert total == 2
+    assert set(hits) == {("history", castle), ("favorite", favorite)}
+    # 不连续的字不算命中
+    assert history.search("alice", "城里") == ([], 0)
+    assert history.search("alice", "古老", sources=["favorite"]) == ([("favorite", favorite)], 1)
+
+
+def test_search_pages(stores):
+    history, favorites = stores
+    ids = [favorites.add({"title": f"月光{n}", "content": "月光洒在湖面", "timestamp": float(n)}) for n in range(5)]
+    first, total = history.search("default", "月光", page=1, page_size=2)
+    second, _ = history.search("default", "月光", page=3, page_size=2)
+    assert total == 5
+    assert len(first) == 2 and len(second) == 1
+    assert {doc_id for _, doc_id in first + second} <= set(ids)
+
+
+def test_removed_works_leave_the_index(stores):
+    history, favorites = stores
+    favorite = favorites.add({"title": "星星", "content": "满天星星"})
+    oldest = history.add({"title": "星星", "content": "一颗星星"})
+    for n in range(3):
+        history.add({"title": f"雨{n}", "content": "下雨了"})
+    # 超出保留条数被清理的历史记录、取消的收藏、清空的历史都不再被搜到
+    assert history.get(oldest) is None
+    assert history.search("default", "星星") == ([("favorite", favorite)], 1)
+    favorites.remove(favorite)
+    assert history.search("default", "星星") == ([], 0)
+    history.clear()
+    assert history.search("default", "下雨") == ([], 0)
+
+
+def test_index_is_rebuilt_for_existing_database(stores):
+    history, _ = stores
+    item_id = history.add({"title": "海浪", "content": "海浪拍打礁石"})
+    conn = sqlite3.connect(history.path)
+    with conn:
+        conn.execute("DELETE FROM search_fts")
+        conn.execute("DELETE FROM search_docs")
+        conn.execute("DELETE FROM meta WHERE key = 'search_index_version'")
+    conn.close()
+    reopened = HistoryStore(path=history.path, retention=3, legacy_file=None)
+    assert reopened.search("default", "礁石") == ([("history", item_id)], 1)
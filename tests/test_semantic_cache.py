@@ -0,0 +1,59 @@
+# 近似请求检索：关键词顺序无关、按类型和主题分区、长度和关键词覆盖检查、从历史记录建立索引
+import pytest
+
+from history_store import HistoryStore
+from semantic_cache import SemanticCache, work_length
+
+pytest.importorskip("numpy")
+
+STORY = "公主在城堡里遇见了一条会说话的龙。" * 10
+
+
+def test_similar_keywords_hit_in_the_same_partition():
+    cache = SemanticCache(threshold=0.8)
+    cache.add("story", "公主,城堡,龙", "奇幻", STORY)
+    length = work_length("story", STORY)
+    # 关键词顺序、全角逗号和空白不影响检索
+    assert cache.lookup("story", "龙， 城堡,公主", "奇幻", length) == STORY
+    assert cache.lookup("story", "公主,城堡,龙", "科幻", length) is None
+    assert cache.lookup("poem", "公主,城堡,龙", "奇幻", length) is None
+    assert cache.stats == {"entries": 1, "hits": 1, "misses": 2}
+
+
+def test_length_and_keyword_coverage_must_match():
+    cache = SemanticCache(threshold=0.5, tolerance=0.2)
+    cache.add("story", "公主,城堡,龙", "奇幻", STORY)
+    length = work_length("story", STORY)
+    assert cache.lookup("story", "公主,城堡,龙", "奇幻", int(length * 1.5)) is None
+    # 多出一个无关的关键词时相似度仍然较高，但关键词不能互相覆盖
+    assert cache.lookup("story", "公主,城堡,龙,飞船", "奇幻", length) is None
+    cache.add("poem", "月光,思念", "五言绝句", "床前明月光，疑是地上霜。举头望明月，低头思故乡。")
+    assert cache.lookup("poem", "思念,月光", "五言绝句", 4) is not None
+    assert cache.lookup("poem", "思念,月光", "五言绝句", 8) is None
+
+
+def test_errors_are_not_cached_and_full_partitions_wrap():
+    cache = SemanticCache(max_entries=2)
+    cache.add("story", "公主,城堡", "奇幻", "生成故事时出错: 显存不足")
+    assert cache.stats["entries"] == 0
+    for keywords in ("公主,城堡", "飞船,星球", "春天,花朵"):
+        cache.add("story", keywords, "奇幻", STORY)
+    # 分区满了以后覆盖最旧的作品
+    assert cache.stats["entries"] == 2
+    assert cache.lookup("story", "公主,城堡", "奇幻", work_length("story", STORY)) is None
+    assert cache.lookup("story", "春天,花朵", "奇幻", work_length("story", STORY)) == STORY
+
+
+def test_load_history_uses_long_story_partitions(tmp_path):
+    store = HistoryStore(path=str(tmp_path / "history.db"), retention=10, legacy_file=None)
+    store.add({"type": "故事", "keywords": "公主,城堡,龙", "genre": "奇幻", "content": STORY, "max_length": 300})
+    store.add({"type": "故事", "keywords": "飞船,星球", "genre": "科幻", "style": "幽默", "character": "小明",
+               "content": STORY, "max_length": 1200})
+    store.add({"type": "诗歌", "keywords": "月光", "style": "五言绝句", "content": "模型仍在加载中"})
+    cache = SemanticCache()
+    assert cache.load_history(store) == 2
+    length = work_length("story", STORY)
+    assert cache.lookup("story", "公主,城堡,龙", "奇幻", length) == STORY
+    # 分段生成的长故事按写作风格和主要角色单独分区
+    assert cache.lookup("story", "飞船,星球", "科幻", length) is None
+    assert cache.lookup("story", "飞船,星球", "科幻/幽默/小明", length) == STORY
@@ -0,0 +1,52 @@
+# 推测解码：贪心解码时与普通解码结果完全一致（包括KV缓存截断和接受率过低回退的情况）
+import pytest
+
+import speculative
+from batching import GenerationRequest, run_batch
+from prompts import build_story_prompt
+
+PROMPT = build_story_prompt("公主,城堡,龙", "奇幻")
+PARAMS = dict(max_new_tokens=48, do_sample=False, repetition_penalty=1.2, no_repeat_ngram_size=2, guard=False)
+
+
+@pytest.fixture(autouse=True)
+def short_requests_use_speculation(monkeypatch):
+    monkeypatch.setattr(speculative, "SPECULATIVE_MIN_TOKENS", 1)
+
+
+def generate(generator, decoder=None, **params):
+    request = GenerationRequest(PROMPT, **dict(PARAMS, **params))
+    run_batch(generator.model, generator.tokenizer, [request], speculative=decoder)
+    return request.output_ids
+
+
+def test_identical_draft_accepts_everything_and_matches(tiny_generator):
+    # 草稿模型与主模型相同时每个候选都被接受
+    decoder = speculative.SpeculativeDecoder(tiny_generator.model, k=4)
+    assert generate(tiny_generator, decoder) == generate(tiny_generator)
+    assert decoder.stats["rounds"] > 0
+    assert decoder.stats["accepted"] == decoder.stats["proposed"]
+
+
+def test_different_draft_matches_plain_greedy(tiny_generator, draft_model, monkeypatch):
+    # 草稿模型不同时大部分候选被拒绝，每轮都要截断KV缓存，结果仍与普通解码一致
+    monkeypatch.setattr(speculative, "SPECULATIVE_MIN_ACCEPTANCE", 0)
+    decoder = speculative.SpeculativeDecoder(draft_model, k=3)
+    assert generate(tiny_generator, decoder) == generate(tiny_generator)
+    assert 0 < decoder.stats["accepted"] < decoder.stats["proposed"]
+    assert decoder.stats["fallbacks"] == 0
+
+
+def test_fallback_to_plain_decoding_keeps_output(tiny_generator, draft_model, monkeypatch):
+    monkeypatch.setattr(speculative, "SPECULATIVE_WARMUP", 4)
+    monkeypatch.setattr(speculative, "SPECULATIVE_MIN_ACCEPTANCE", 1.1)
+    decoder = speculative.SpeculativeDecoder(draft_model, k=2)
+    assert generate(tiny_generator, decoder) == generate(tiny_generator)
+    assert decoder.stats["fallbacks"] == 1
+
+
+def test_stop_conditions_apply_inside_speculative_rounds(tiny_generator):
+    decoder = speculative.SpeculativeDecoder(tiny_generator.model, k=4)
+    expected = generate(tiny_generator, max_new_tokens=7)
+    assert generate(tiny_generator, decoder, max_new_tokens=7) == expected
+    assert len(expected) == 7
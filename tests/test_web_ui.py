@@ -0,0 +1,89 @@
+# 界面事件：通过 Gradio 的事件处理流程（预处理、会话状态）调用真实的处理函数，不加载模型
+import asyncio
+
+import pytest
+
+import favorites_store
+import history_store
+
+gr = pytest.importorskip("gradio")
+
+
+class UiSession:
+    """一个用户的界面会话：按处理函数名触发事件，State 的值保存在会话状态中"""
+
+    def __init__(self, demo, username):
+        from gradio.state_holder import SessionState
+
+        self.demo = demo
+        self.state = SessionState(demo)
+        self.request = gr.Request(username=username)
+        self.fns = {}
+        for fn in demo.fns.values():
+            self.fns.setdefault(fn.fn.__name__, fn)
+
+    def run(self, name, *inputs):
+        block_fn = self.fns[name]
+        # State 输入从会话状态读取，这里传入的值不会被使用
+        inputs = list(inputs) + [None] * (len(block_fn.inputs) - len(inputs))
+        output = asyncio.run(self.demo.process_api(block_fn=block_fn, inputs=inputs, state=self.state,
+                                                   request=self.request))
+        return output["data"]
+
+    def samples(self, name, *inputs):
+        return self.run(name, *inputs)[0]["samples"]
+
+
+@pytest.fixture
+def demo(tmp_path, monkeypatch):
+    import web_ui
+
+    path = str(tmp_path / "works.db")
+    monkeypatch.setattr(history_store, "_store", history_store.HistoryStore(path=path, legacy_file=None))
+    monkeypatch.setattr(favorites_store, "_store", favorites_store.FavoritesStore(path=path, legacy_files=()))
+    return web_ui.create_interface()
+
+
+def test_click_favorite_then_remove_it(demo):
+    store = favorites_store.get_favorites_store()
+    for n in range(3):
+        store.add({"title": f"诗{n}", "content": f"诗句{n}", "type": "诗歌"}, "alice")
+    bob_id = store.add({"title": "别人的诗", "content": "别人的诗句", "type": "诗歌"}, "bob")
+    alice = UiSession(demo, "alice")
+    assert [row[0] for row in alice.samples("refresh_favorites")] == ["诗2", "诗1", "诗0"]
+    # 点击第二条收藏：显示内容并记住它的id
+    assert alice.run("load_from_favorites", 1) == ["诗句1", None]
+    samples = alice.samples("remove_favorite")
+    assert [row[0] for row in samples] == ["诗2", "诗0"]
+    # 移除后清空选中的收藏，再次点击移除不会删除其他收藏
+    assert [row[0] for row in alice.samples("remove_favorite")] == ["诗2", "诗0"]
+    assert store.count("alice") == 2 and store.get(bob_id, "bob") is not None
+
+
+def test_click_search_result_loads_history_or_favorite(demo):
+    history = history_store.get_history_store()
+    if not history.search_index.available:
+        pytest.skip("SQLite 不支持 FTS5")
+    history.add({"title": "城堡", "content": "公主住在古老的城堡里", "type": "故事"}, "alice")
+    favorites_store.get_favorites_store().add({"title": "古堡", "content": "城堡在月光下沉睡", "type": "诗歌"}, "alice")
+    history.add({"title": "城堡", "content": "别人的城堡", "type": "故事"}, "bob")
+    alice = UiSession(demo, "alice")
+    samples = alice.samples("run_search", "城堡")
+    assert len(samples) == 2
+    contents = {alice.run("load_from_search", index)[0] for index in range(len(samples))}
+    assert contents == {"公主住在古老的城堡里", "城堡在月光下沉睡"}
+    # 超出当前页的点击不加载内容
+    assert alice.run("load_from_search", 5) == [""]
+
+
+def test_click_history_entry_on_second_page(demo):
+    page_size = history_store.HISTORY_PAGE_SIZE
+    for n in range(page_size + 2):
+        history_store.save_history_item({"title": f"故事{n}", "content": f"内容{n}", "type": "故事"}, "alice")
+    alice = UiSession(demo, "alice")
+    assert len(alice.samples("refresh_history")) == page_size
+    assert alice.run("load_from_history", 0) == [f"内容{page_size + 1}"]
+    assert [row[0] for row in alice.samples("next_history_page")] == ["故事1", "故事0"]
+    # 点击的是当前页（第2页）的第一条
+    assert alice.run("load_from_history", 0) == ["内容1"]
+    assert UiSession(demo, "bob").run("load_from_history", 0) == [""]
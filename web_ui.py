@@ -0,0 +1,807 @@
+# Gradio 界面：只在启动界面时导入（导入本模块会导入 gradio）
+import asyncio
+import functools
+import time
+
+import gradio as gr
+
+from model_manager import model_manager, MODEL_LOAD_MODE
+from history_store import (get_history_store, get_user_id, save_history_item, load_history_page,
+                           search_works_page)
+from favorites_store import get_favorites_store, load_favorites_page
+from metrics import start_metrics_server
+from admission import admitted_stream, ServerBusyError, ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE
+from candidates import RHYME_MODES, POEM_MAX_CANDIDATES
+from prompts import STORY_GENRES, POEM_TYPES, poem_token_budget
+from generation import generate_story_stream, generate_poem_stream, generate_poem_candidates_stream
+
+# 创建Gradio界面
+def create_interface():
+    with gr.Blocks(
+        title="AI故事/诗歌生成器",
+        theme=gr.themes.Default(),  # 使用默认主题
+        css="""
+        .gradio-container {
+            max-width: 1200px !important;
+            margin: 0 auto;
+        }
+        .history-item {
+            border: 1px solid #e0e0e0;
+            border-radius: 8px;
+            padding: 10px;
+            margin-bottom: 10px;
+            cursor: pointer;
+            transition: all 0.2s ease;
+        }
+        .history-item:hover {
+            background-color: #f5f5f5;
+            box-shadow: 0 2px 8px rgba(0,0,0,0.1);
+        }
+        .favorite-btn {
+            margin-top: 10px;
+        }
+        .export-btn {
+            margin-top: 10px;
+            margin-left: 10px;
+        }
+        .control-panel {
+            background-color: #fafafa;
+            padding: 20px;
+            border-radius: 10px;
+            border: 1px solid #e0e0e0;
+        }
+        .result-panel {
+            background-color: #ffffff;
+            padding: 20px;
+            border-radius: 10px;
+            border: 1px solid #e0e0e0;
+            min-height: 300px;
+        }
+        .tabs-container {
+            margin-top: 20px;
+        }
+        .history-panel {
+            max-height: 400px;
+            overflow-y: auto;
+            margin-top: 20px;
+        }
+        .keyword-buttons {
+            margin-bottom: 20px;
+        }
+        .slider-label {
+            margin-bottom: 5px;
+            font-weight: 600;
+        }
+        .section-title {
+            font-size: 18px;
+            font-weight: bold;
+            margin-bottom: 15px;
+            color: #2c3e50;
+        }
+        """
+    ) as demo:
+        # 页面标题和介绍
+        gr.Markdown("# 🎨 AI故事/诗歌生成器")
+        gr.Markdown("**智能创作，无限创意** - 输入关键词，生成属于你的精彩故事或优美诗歌")
+        
+        # 模型加载状态
+        with gr.Row():
+            model_status = gr.Markdown(model_manager.status_text())
+            refresh_status_btn = gr.Button("🔄 刷新模型状态", size="sm")
+        
+        # 主内容区域
+        with gr.Row():
+            # 左侧控制面板
+            with gr.Column(scale=1, min_width=400):
+                # 功能选择标签页
+                with gr.Tabs(elem_id="tabs-container") as tabs:
+                    # 故事生成面板
+                    with gr.TabItem("📖 故事生成", id="story-tab"):
+                        gr.Markdown("## 故事生成", elem_classes="section-title")
+                        
+                        story_keywords = gr.Textbox(
+                            label="🔑 关键词",
+                            placeholder="输入关键词，用逗号分隔，如：公主,城堡,龙",
+                            lines=2,
+                            elem_classes="control-panel"
+                        )
+                        
+                        # 故事关键词按钮组
+                        gr.Markdown("### 常用关键词", elem_classes="slider-label")
+                        with gr.Row(elem_classes="keyword-buttons"):
+                            story_keyword_btns = [
+                                gr.Button("公主", size="sm"),
+                                gr.Button("城堡", size="sm"),
+                                gr.Button("龙", size="sm"),
+                                gr.Button("魔法", size="sm")
+                            ]
+                        with gr.Row(elem_classes="keyword-buttons"):
+                            story_keyword_btns += [
+                                gr.Button("冒险", size="sm"),
+                                gr.Button("森林", size="sm"),
+                                gr.Button("巫师", size="sm"),
+                                gr.Button("宝藏", size="sm")
+                            ]
+                        
+                        # 故事生成参数
+                        with gr.Row():
+                            with gr.Column():
+                                story_theme = gr.Dropdown(
+                                    choices=STORY_GENRES,
+                                    label="🎭 故事主题",
+                                    value="奇幻",
+                                    elem_classes="control-panel"
+                                )
+                                
+                                story_style = gr.Dropdown(
+                                    choices=["通俗", "文艺", "古典", "现代", "悬疑", "轻松"],
+                                    label="✏️ 写作风格",
+                                    value="通俗",
+                                    elem_classes="control-panel"
+                                )
+                            
+                            with gr.Column():
+                                story_character = gr.Textbox(
+                                    label="👤 主要角色",
+                                    placeholder="如：勇敢的骑士、聪明的公主",
+                                    elem_classes="control-panel"
+                                )
+                                
+                                story_max_length = gr.Slider(
+                                    minimum=100, 
+                                    maximum=2000, 
+                                    value=500, 
+                                    label="📏 故事长度",
+                                    step=50,
+                                    elem_classes="control-panel"
+                                )
+                        
+                        story_temperature = gr.Slider(
+                            minimum=0.1, 
+                            maximum=1.0, 
+                            value=0.7, 
+                            label="✨ 创意度",
+                            step=0.1,
+                            elem_classes="control-panel"
+                        )
+                        
+                        generate_story_btn = gr.Button(
+                            "🚀 生成故事",
+                            variant="primary",
+                            size="lg",
+                            elem_classes="control-panel"
+                        )
+                    
+                    # 诗歌生成面板
+                    with gr.TabItem("📝 诗歌生成", id="poem-tab"):
+                        gr.Markdown("## 诗歌生成", elem_classes="section-title")
+                        
+                        poem_keywords = gr.Textbox(
+                            label="🔑 关键词",
+                            placeholder="输入关键词，用逗号分隔，如：春天,花朵,希望",
+                            lines=2,
+                            elem_classes="control-panel"
+                        )
+                        
+                        # 诗歌关键词按钮组
+                        gr.Markdown("### 常用关键词", elem_classes="slider-label")
+                        with gr.Row(elem_classes="keyword-buttons"):
+                            poem_keyword_btns = [
+                                gr.Button("春天", size="sm"),
+                                gr.Button("花朵", size="sm"),
+                                gr.Button("希望", size="sm"),
+                                gr.Button("月光", size="sm")
+                            ]
+                        with gr.Row(elem_classes="keyword-buttons"):
+                            poem_keyword_btns += [
+                                gr.Button("梦想", size="sm"),
+                                gr.Button("河流", size="sm"),
+                                gr.Button("星辰", size="sm"),
+                                gr.Button("思念", size="sm")
+                            ]
+                        
+                        # 诗歌生成参数
+                        with gr.Row():
+                            with gr.Column():
+                                poem_type = gr.Dropdown(
+                                    choices=POEM_TYPES,
+                                    label="📜 诗歌类型",
+                                    value="现代诗",
+                                    elem_classes="control-panel"
+                                )
+                                
+                                poem_rhyme = gr.Dropdown(
+                                    choices=RHYME_MODES,
+                                    label="🎵 押韵方式",
+                                    value="不要求",
+                                    elem_classes="control-panel"
+                                )
+                            
+                            with gr.Column():
+                                poem_lines = gr.Slider(
+                                    minimum=4, 
+                                    maximum=50, 
+                                    value=12, 
+                                    label="📏 行数控制",
+                                    step=1,
+                                    elem_classes="control-panel"
+                                )
+                                
+                                poem_emotion = gr.Dropdown(
+                                    choices=["喜悦", "忧伤", "思念", "励志", "平静", "激昂"],
+                                    label="😊 情感基调",
+                                    value="平静",
+                                    elem_classes="control-panel"
+                                )
+                        
+                        poem_temperature = gr.Slider(
+                            minimum=0.1, 
+                            maximum=1.0, 
+                            value=0.8, 
+                            label="✨ 创意度",
+                            step=0.1,
+                            elem_classes="control-panel"
+                        )
+                        
+                        # 一次批量生成多首并自动挑选最好的一首，其余可直接切换
+                        poem_candidates = gr.Slider(
+                            minimum=1,
+                            maximum=POEM_MAX_CANDIDATES,
+                            value=1,
+                            label="🎲 候选数量",
+                            step=1,
+                            elem_classes="control-panel"
+                        )
+                        
+                        generate_poem_btn = gr.Button(
+                            "🚀 生成诗歌",
+                            variant="primary",
+                            size="lg",
+                            elem_classes="control-panel"
+                        )
+                    
+                    # 历史记录面板
+                    with gr.TabItem("📚 历史记录", id="history-tab"):
+                        gr.Markdown("## 生成历史", elem_classes="section-title")
+                        
+                        history_list = gr.Dataset(
+                            components=[gr.Textbox(label="标题"), gr.Textbox(label="内容"), gr.Textbox(label="类型")],
+                            samples=[],
+                            type="index",
+                            elem_id="history-panel"
+                        )
+                        # 当前页的记录id和页码
+                        history_ids = gr.State([])
+                        history_page = gr.State(1)
+                        
+                        with gr.Row():
+                            prev_history_btn = gr.Button("⬅️ 上一页", size="sm")
+                            history_page_info = gr.Markdown("第 1 / 1 页")
+                            next_history_btn = gr.Button("下一页 ➡️", size="sm")
+                        
+                        with gr.Row():
+                            clear_history_btn = gr.Button("🗑️ 清空历史", variant="stop")
+                            refresh_history_btn = gr.Button("🔄 刷新历史")
+                    
+                    # 收藏作品面板
+                    with gr.TabItem("❤️ 我的收藏", id="favorites-tab"):
+                        gr.Markdown("## 我的收藏", elem_classes="section-title")
+                        
+                        favorites_list = gr.Dataset(
+                            components=[gr.Textbox(label="标题"), gr.Textbox(label="内容"), gr.Textbox(label="类型")],
+                            samples=[],
+                            type="index",
+                            elem_id="history-panel"
+                        )
+                        # 当前页的收藏id、页码和最近点击的收藏id（移除收藏时使用）
+                        favorites_ids = gr.State([])
+                        favorites_page = gr.State(1)
+                        selected_favorite = gr.State(None)
+                        
+                        with gr.Row():
+                            prev_favorites_btn = gr.Button("⬅️ 上一页", size="sm")
+                            favorites_page_info = gr.Markdown("第 1 / 1 页")
+                            next_favorites_btn = gr.Button("下一页 ➡️", size="sm")
+                        
+                        with gr.Row():
+                            remove_favorite_btn = gr.Button("🗑️ 移除收藏", variant="stop")
+                            refresh_favorites_btn = gr.Button("🔄 刷新收藏")
+                    
+                    # 作品搜索面板：按相关度搜索历史记录和收藏
+                    with gr.TabItem("🔍 搜索作品", id="search-tab"):
+                        gr.Markdown("## 搜索作品", elem_classes="section-title")
+                        
+                        with gr.Row():
+                            search_query = gr.Textbox(
+                                label="🔍 搜索",
+                                placeholder="输入关键词、主题或正文中的词语，如：城堡 奇幻",
+                                scale=4
+                            )
+                            search_btn = gr.Button("搜索", variant="primary", scale=1)
+                        
+                        search_results = gr.Dataset(
+                            components=[gr.Textbox(label="标题"), gr.Textbox(label="内容"), gr.Textbox(label="类型")],
+                            samples=[],
+                            type="index",
+                            elem_id="history-panel"
+                        )
+                        # 当前页结果的 [来源, id] 和页码
+                        search_refs = gr.State([])
+                        search_page = gr.State(1)
+                        
+                        with gr.Row():
+                            prev_search_btn = gr.Button("⬅️ 上一页", size="sm")
+                            search_page_info = gr.Markdown("")
+                            next_search_btn = gr.Button("下一页 ➡️", size="sm")
+                
+            # 右侧结果展示区域
+            with gr.Column(scale=2):
+                gr.Markdown("## 🎯 生成结果", elem_classes="section-title")
+                
+                # 结果展示区域
+                result_output = gr.Textbox(
+                    label="",
+                    lines=15,
+                    interactive=False,
+                    elem_classes="result-panel"
+                )
+                
+                # 多候选生成时的其他候选，切换时不重新生成
+                poem_alternates = gr.Dropdown(
+                    choices=[],
+                    label="🔀 其他候选",
+                    visible=False,
+                    interactive=True
+                )
+                poem_candidates_state = gr.State([])
+                
+                # 结果控制按钮
+                with gr.Row():
+                    favorite_btn = gr.Button("❤️ 收藏作品", variant="secondary")
+                    export_btn = gr.Button("💾 导出文本", variant="secondary")
+                    copy_btn = gr.Button("📋 复制内容", variant="secondary")
+                    clear_result_btn = gr.Button("🗑️ 清空结果", variant="stop")
+                
+                # 导出文件组件
+                export_file = gr.File(
+                    label="下载文件",
+                    visible=False
+                )
+        
+        # 模型状态刷新
+        refresh_status_btn.click(
+            fn=model_manager.status_text,
+            inputs=[],
+            outputs=model_status
+        )
+        demo.load(
+            fn=model_manager.status_text,
+            inputs=[],
+            outputs=model_status
+        )
+        
+        # 关键词按钮点击事件
+        def add_keyword(textbox_value, keyword):
+            if textbox_value.strip() == "":
+                return keyword
+            else:
+                return f"{textbox_value.strip()},{keyword}"
+        
+        # 绑定故事关键词按钮
+        for btn in story_keyword_btns:
+            btn.click(
+                fn=add_keyword,
+                inputs=[story_keywords, gr.Textbox(value=btn.label, visible=False)],
+                outputs=story_keywords
+            )
+        
+        # 绑定诗歌关键词按钮
+        for btn in poem_keyword_btns:
+            btn.click(
+                fn=add_keyword,
+                inputs=[poem_keywords, gr.Textbox(value=btn.label, visible=False)],
+                outputs=poem_keywords
+            )
+        
+        # 故事生成函数包装器（带历史记录）
+        async def generate_story_with_history(keywords, genre, style, character, max_length, temperature,
+                                              request: gr.Request):
+            story = ""
+            # 流式输出：边生成边展示；经过准入控制，繁忙时直接提示而不是无限等待
+            stream_fn = functools.partial(generate_story_stream, style=style, character=character)
+            try:
+                async for story in admitted_stream("story", max_length, stream_fn,
+                                                   keywords, genre, max_length, temperature):
+                    yield story
+            except ServerBusyError as e:
+                yield str(e)
+                return
+            # 保存到历史记录（保留条数由 HISTORY_RETENTION 控制）
+            history_item = {
+                "title": f"故事_{time.strftime('%Y%m%d_%H%M%S')}",
+                "content": story,
+                "type": "故事",
+                "timestamp": time.time(),
+                "keywords": keywords,
+                "genre": genre,
+                "style": style,
+                "character": (character or "").strip(),
+                "max_length": int(max_length)
+            }
+            await asyncio.to_thread(save_history_item, history_item, get_user_id(request))
+        
+        # 诗歌生成函数包装器（带历史记录）
+        async def generate_poem_with_history(keywords, style, lines, temperature, rhyme, n, request: gr.Request):
+            poem = ""
+            ranked = []
+            hidden = gr.update(choices=[], value=None, visible=False)
+            # 流式输出：边生成边展示；经过准入控制，繁忙时直接提示而不是无限等待
+            try:
+                if int(n) <= 1:
+                    async for poem in admitted_stream("poem", poem_token_budget(style, lines), generate_poem_stream,
+                                                      keywords, style, lines, temperature):
+                        yield poem, hidden, []
+                else:
+                    # 多个候选合并在同一批次中生成，按总生成长度参与准入控制
+                    async for poem, ranked in admitted_stream(
+                            "poem", poem_token_budget(style, lines) * int(n), generate_poem_candidates_stream,
+                            keywords, style, lines, temperature, rhyme, n):
+                        yield poem, hidden, []
+            except ServerBusyError as e:
+                yield str(e), hidden, []
+                return
+            if ranked:
+                choices = [(f"候选{i + 1}（得分 {item['score']:.2f}）", i) for i, item in enumerate(ranked)]
+                yield poem, gr.update(choices=choices, value=0, visible=True), [item["text"] for item in ranked]
+            # 保存到历史记录（保留条数由 HISTORY_RETENTION 控制）
+            history_item = {
+                "title": f"诗歌_{time.strftime('%Y%m%d_%H%M%S')}",
+                "content": poem,
+                "type": "诗歌",
+                "timestamp": time.time(),
+                "keywords": keywords,
+                "style": style
+            }
+            await asyncio.to_thread(save_history_item, history_item, get_user_id(request))
+        
+        # 生成按钮事件
+        generate_story_btn.click(
+            fn=generate_story_with_history,
+            inputs=[story_keywords, story_theme, story_style, story_character, story_max_length, story_temperature],
+            outputs=result_output
+        )
+        generate_story_btn.click(
+            fn=lambda: (gr.update(choices=[], value=None, visible=False), []),
+            inputs=[],
+            outputs=[poem_alternates, poem_candidates_state]
+        )
+        
+        generate_poem_btn.click(
+            fn=generate_poem_with_history,
+            # 按行数提前结束，生成长度在函数内部估算
+            inputs=[poem_keywords, poem_type, poem_lines, poem_temperature, poem_rhyme, poem_candidates],
+            outputs=[result_output, poem_alternates, poem_candidates_state]
+        )
+        
+        # 切换到其他候选：直接显示已生成的文本
+        def select_candidate(index, texts):
+            if index is None or not texts:
+                return gr.update()
+            return texts[int(index)]
+        
+        poem_alternates.change(
+            fn=select_candidate,
+            inputs=[poem_alternates, poem_candidates_state],
+            outputs=result_output
+        )
+        
+        # 收藏功能
+        def add_to_favorites(content, request: gr.Request):
+            if not content.strip():
+                return "请先生成内容再收藏"
+            favorite_item = {
+                "title": f"收藏_{time.strftime('%Y%m%d_%H%M%S')}",
+                "content": content,
+                "type": "故事" if "故事" in content[:100] else "诗歌",
+                "timestamp": time.time()
+            }
+            get_favorites_store().add(favorite_item, get_user_id(request))
+            return "收藏成功！"
+        
+        favorite_btn.click(
+            fn=add_to_favorites,
+            inputs=[result_output],
+            outputs=gr.Textbox(visible=False)
+        )
+        
+        # 导出功能
+        def export_content(content):
+            if not content.strip():
+                return None
+            filename = f"ai_creation_{time.strftime('%Y%m%d_%H%M%S')}.txt"
+            with open(filename, 'w', encoding='utf-8') as f:
+                f.write(content)
+            return filename
+        
+        export_btn.click(
+            fn=export_content,
+            inputs=[result_output],
+            outputs=export_file
+        )
+        
+        # 复制功能
+        def copy_to_clipboard(content):
+            import pyperclip
+            pyperclip.copy(content)
+            return "已复制到剪贴板！"
+        
+        copy_btn.click(
+            fn=copy_to_clipboard,
+            inputs=[result_output],
+            outputs=gr.Textbox(visible=False)
+        )
+        
+        # 清空结果
+        clear_result_btn.click(
+            fn=lambda: "",
+            inputs=[],
+            outputs=result_output
+        )
+        
+        # 历史记录功能（分页）
+        history_outputs = [history_list, history_ids, history_page, history_page_info]
+        
+        def show_history_page(page, request):
+            samples, ids, page, info = load_history_page(get_user_id(request), page)
+            return gr.update(samples=samples), ids, page, info
+        
+        def refresh_history(page, request: gr.Request):
+            return show_history_page(page, request)
+        
+        def prev_history_page(page, request: gr.Request):
+            return show_history_page(page - 1, request)
+        
+        def next_history_page(page, request: gr.Request):
+            return show_history_page(page + 1, request)
+        
+        refresh_history_btn.click(
+            fn=refresh_history,
+            inputs=[history_page],
+            outputs=history_outputs
+        )
+        prev_history_btn.click(
+            fn=prev_history_page,
+            inputs=[history_page],
+            outputs=history_outputs
+        )
+        next_history_btn.click(
+            fn=next_history_page,
+            inputs=[history_page],
+            outputs=history_outputs
+        )
+        demo.load(
+            fn=refresh_history,
+            inputs=[history_page],
+            outputs=history_outputs
+        )
+        
+        def clear_history(request: gr.Request):
+            get_history_store().clear(get_user_id(request))
+            return show_history_page(1, request)
+        
+        clear_history_btn.click(
+            fn=clear_history,
+            inputs=[],
+            outputs=history_outputs
+        )
+        
+        # 收藏功能（分页）
+        favorites_outputs = [favorites_list, favorites_ids, favorites_page, favorites_page_info]
+        
+        def show_favorites_page(page, request):
+            samples, ids, page, info = load_favorites_page(get_user_id(request), page)
+            return gr.update(samples=samples), ids, page, info
+        
+        def refresh_favorites(page, request: gr.Request):
+            return show_favorites_page(page, request)
+        
+        def prev_favorites_page(page, request: gr.Request):
+            return show_favorites_page(page - 1, request)
+        
+        def next_favorites_page(page, request: gr.Request):
+            return show_favorites_page(page + 1, request)
+        
+        refresh_favorites_btn.click(
+            fn=refresh_favorites,
+            inputs=[favorites_page],
+            outputs=favorites_outputs
+        )
+        prev_favorites_btn.click(
+            fn=prev_favorites_page,
+            inputs=[favorites_page],
+            outputs=favorites_outputs
+        )
+        next_favorites_btn.click(
+            fn=next_favorites_page,
+            inputs=[favorites_page],
+            outputs=favorites_outputs
+        )
+        demo.load(
+            fn=refresh_favorites,
+            inputs=[favorites_page],
+            outputs=favorites_outputs
+        )
+        
+        # 移除收藏：移除最近点击的一条（按id删除，不受其他用户或其他页面的影响）
+        def remove_favorite(favorite_id, page, request: gr.Request):
+            if favorite_id is not None:
+                get_favorites_store().remove(favorite_id, get_user_id(request))
+            return show_favorites_page(page, request) + (None,)
+        
+        remove_favorite_btn.click(
+            fn=remove_favorite,
+            inputs=[selected_favorite, favorites_page],
+            outputs=favorites_outputs + [selected_favorite]
+        )
+        
+        # 从历史记录加载内容
+        def load_from_history(index, ids, request: gr.Request):
+            if 0 <= index < len(ids):
+                item = get_history_store().get(ids[index], get_user_id(request))
+                if item:
+                    return item.get("content", "")  # 返回内容
+            return ""
+        
+        history_list.click(
+            fn=load_from_history,
+            inputs=[history_list, history_ids],
+            outputs=result_output
+        )
+        
+        # 从收藏加载内容
+        def load_from_favorites(index, ids, request: gr.Request):
+            if 0 <= index < len(ids):
+                item = get_favorites_store().get(ids[index], get_user_id(request))
+                if item:
+                    return item.get("content", ""), ids[index]
+            return "", None
+        
+        favorites_list.click(
+            fn=load_from_favorites,
+            inputs=[favorites_list, favorites_ids],
+            outputs=[result_output, selected_favorite]
+        )
+        
+        # 搜索作品（分页）
+        search_outputs = [search_results, search_refs, search_page, search_page_info]
+        
+        def show_search_page(query, page, request):
+            if not query.strip():
+                return gr.update(samples=[]), [], 1, ""
+            samples, refs, page, info = search_works_page(get_user_id(request), query, page)
+            return gr.update(samples=samples), refs, page, info
+        
+        def run_search(query, request: gr.Request):
+            return show_search_page(query, 1, request)
+        
+        def prev_search_page(query, page, request: gr.Request):
+            return show_search_page(query, page - 1, request)
+        
+        def next_search_page(query, page, request: gr.Request):
+            return show_search_page(query, page + 1, request)
+        
+        search_btn.click(
+            fn=run_search,
+            inputs=[search_query],
+            outputs=search_outputs
+        )
+        search_query.submit(
+            fn=run_search,
+            inputs=[search_query],
+            outputs=search_outputs
+        )
+        prev_search_btn.click(
+            fn=prev_search_page,
+            inputs=[search_query, search_page],
+            outputs=search_outputs
+        )
+        next_search_btn.click(
+            fn=next_search_page,
+            inputs=[search_query, search_page],
+            outputs=search_outputs
+        )
+        
+        # 从搜索结果加载内容
+        def load_from_search(index, refs, request: gr.Request):
+            if not 0 <= index < len(refs):
+                return ""
+            source, doc_id = refs[index]
+            if source == "history":
+                item = get_history_store().get(doc_id, get_user_id(request))
+            else:
+                item = get_favorites_store().get(doc_id, get_user_id(request))
+            return item.get("content", "") if item else ""
+        
+        search_results.click(
+            fn=load_from_search,
+            inputs=[search_results, search_refs],
+            outputs=result_output
+        )
+    
+    return demo
+
+
+def launch():
+    """启动界面：后台加载模型、启动指标服务并运行 Gradio"""
+    # 后台加载模型，界面无需等待模型加载完成即可启动
+    if MODEL_LOAD_MODE == "background":
+        model_manager.start()
+    # Prometheus 指标服务与界面一起启动
+    start_metrics_server()
+    demo = create_interface()
+    # 并发和排队由准入控制负责，Gradio 只需放行足够多的请求
+    demo.queue(default_concurrency_limit=ADMISSION_MAX_IN_FLIGHT + ADMISSION_MAX_QUEUE,
+               max_size=ADMISSION_MAX_QUEUE)
+    demo.launch(
+        share=True,
+        theme=gr.themes.Default(),
+        css="""
+        .gradio-container {
+            max-width: 1200px !important;
+            margin: 0 auto;
+        }
+        .history-item {
+            border: 1px solid #e0e0e0;
+            border-radius: 8px;
+            padding: 10px;
+            margin-bottom: 10px;
+            cursor: pointer;
+            transition: all 0.2s ease;
+        }
+        .history-item:hover {
+            background-color: #f5f5f5;
+            box-shadow: 0 2px 8px rgba(0,0,0,0.1);
+        }
+        .favorite-btn {
+            margin-top: 10px;
+        }
+        .export-btn {
+            margin-top: 10px;
+            margin-left: 10px;
+        }
+        .control-panel {
+            background-color: #fafafa;
+            padding: 20px;
+            border-radius: 10px;
+            border: 1px solid #e0e0e0;
+        }
+        .result-panel {
+            background-color: #ffffff;
+            padding: 20px;
+            border-radius: 10px;
+            border: 1px solid #e0e0e0;
+            min-height: 300px;
+        }
+        .tabs-container {
+            margin-top: 20px;
+        }
+        .history-panel {
+            max-height: 400px;
+            overflow-y: auto;
+            margin-top: 20px;
+        }
+        .keyword-buttons {
+            margin-bottom: 20px;
+        }
+        .slider-label {
+            margin-bottom: 5px;
+            font-weight: 600;
+        }
+        .section-title {
+            font-size: 18px;
+            font-weight: bold;
+            margin-bottom: 15px;
+            color: #2c3e50;
+        }
+        """
+    )
@@ -0,0 +1,331 @@
+# 多进程工作池：每个工作进程绑定一组CPU核心并加载自己的模型，前端按负载最小原则分发生成任务
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+# 工作进程数量（0 表示不使用多进程，在当前进程中生成）
+WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", "0"))
+# 每个工作进程的计算线程数，默认等于分配给它的核心数
+WORKER_THREADS = int(os.environ.get("WORKER_THREADS", "0"))
+# 工作进程崩溃后两次重启之间的最短间隔（秒）
+WORKER_RESTART_DELAY = float(os.environ.get("WORKER_RESTART_DELAY", "5"))
+# 启动时等待所有工作进程加载完模型的最长时间（秒），超时后关闭工作池，改为在当前进程中生成
+WORKER_READY_TIMEOUT = float(os.environ.get("WORKER_READY_TIMEOUT", "600"))
+
+
+def split_cores(num_workers):
+    """把当前进程可用的CPU核心平均分成 num_workers 组"""
+    if hasattr(os, "sched_getaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+    size = max(1, len(cores) // num_workers)
+    groups = [cores[i * size:(i + 1) * size] for i in range(num_workers)]
+    # 核心数少于进程数时多个进程共用核心
+    return [group or cores for group in groups]
+
+
+def _run_job(scheduler, results, worker_id, job_id, prompt, params, cancels, streamer=None):
+    try:
+        if streamer is None:
+            streamer = scheduler.stream(prompt, cancel=cancels[job_id], **params)
+        for delta in streamer:
+            results.put(("delta", worker_id, job_id, delta))
+        results.put(("done", worker_id, job_id,
+                     {"ttft": streamer.ttft, "timings": streamer.timings, "tokens": streamer.num_tokens,
+                      "prompt_tokens": streamer.prompt_tokens, "logprob": streamer.logprob,
+                      "quality": streamer.quality}))
+    except Exception as e:
+        results.put(("error", worker_id, job_id, str(e)))
+    finally:
+        cancels.pop(job_id, None)
+
+
+def _worker_main(worker_id, cores, threads, jobs, results):
+    """工作进程入口：绑定核心、设置线程数、加载模型，然后处理任务队列"""
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    import torch
+    torch.set_num_threads(threads)
+
+    from batching import BatchScheduler
+    from model_manager import load_generator
+    from streaming import CancelToken
+
+    scheduler = BatchScheduler(load_generator())
+    print(f"工作进程 {worker_id} 就绪（核心 {cores[0]}-{cores[-1]}，线程数 {threads}）")
+    results.put(("ready", worker_id, None, None))
+    # 正在生成的任务的取消标记，前端发来 cancel 时停止对应任务的解码
+    cancels = {}
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        kind, job_id, payload, params = job
+        if kind == "warm":
+            if scheduler.prefix_cache is not None:
+                scheduler.prefix_cache.warm(payload)
+            continue
+        if kind == "cancel":
+            cancel = cancels.pop(job_id, None)
+            if cancel is not None:
+                cancel.cancel()
+            continue
+        if kind == "generate_many":
+            # 同一prompt的一组任务（job_id 为列表）共用一个取消标记，作为一组提交，在同一批次中生成
+            cancel = CancelToken()
+            for one_id in job_id:
+                cancels[one_id] = cancel
+            streamers = scheduler.stream_many(payload, len(job_id), cancel=cancel, **params)
+            for one_id, streamer in zip(job_id, streamers):
+                threading.Thread(
+                    target=_run_job,
+                    args=(scheduler, results, worker_id, one_id, payload, params, cancels, streamer),
+                    daemon=True
+                ).start()
+            continue
+        cancels[job_id] = CancelToken()
+        # 每个任务一个线程，同一进程内的并发任务由批处理调度器合并计算
+        threading.Thread(
+            target=_run_job,
+            args=(scheduler, results, worker_id, job_id, payload, params, cancels),
+            daemon=True
+        ).start()
+
+
+class RemoteStream:
+    """工作进程返回的流式结果，接口与 TokenStreamer 相同：迭代得到增量文本，ttft 为首个token耗时"""
+
+    def __init__(self, prompt, params):
+        self.prompt = prompt
+        self.params = params
+        self.created_at = time.perf_counter()
+        self.first_token_at = None
+        self.job_id = None
+        self.text = ""
+        # 工作进程在生成结束时返回的各阶段耗时和token数
+        self.timings = {}
+        self.num_tokens = 0
+        self.prompt_tokens = 0
+        self.logprob = 0.0
+        self.quality = None
+        self._queue = queue.Queue()
+
+    def _push(self, kind, payload):
+        if kind == "delta" and self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        if kind == "done":
+            self.timings = payload.get("timings", {})
+            self.num_tokens = payload.get("tokens", 0)
+            self.prompt_tokens = payload.get("prompt_tokens", 0)
+            self.logprob = payload.get("logprob", 0.0)
+            self.quality = payload.get("quality")
+        self._queue.put((kind, payload))
+
+    @property
+    def started(self):
+        return self.first_token_at is not None
+
+    @property
+    def ttft(self):
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.created_at
+
+    def __iter__(self):
+        while True:
+            kind, payload = self._queue.get()
+            if kind == "done":
+                return
+            if kind == "error":
+                raise RuntimeError(payload)
+            self.text += payload
+            yield payload
+
+
+class _Worker:
+    def __init__(self, worker_id, cores, threads):
+        self.worker_id = worker_id
+        self.cores = cores
+        self.threads = threads
+        self.process = None
+        self.jobs = None
+        self.ready = False
+        self.in_flight = set()
+        self.started_at = 0.0
+
+
+class WorkerPool:
+    """管理多个模型工作进程：负载最小分发、崩溃自动重启"""
+
+    def __init__(self, num_workers, threads_per_worker=WORKER_THREADS):
+        self._context = multiprocessing.get_context("spawn")
+        self._results = self._context.Queue()
+        self._workers = []
+        for worker_id, cores in enumerate(split_cores(num_workers)):
+            threads = threads_per_worker if threads_per_worker > 0 else len(cores)
+            self._workers.append(_Worker(worker_id, cores, threads))
+        self._streams = {}
+        self._job_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._ready_event = threading.Event()
+        self._prefixes = None
+        self._closed = False
+        self.stats = {"dispatched": [0] * num_workers, "restarts": 0, "resubmitted": 0}
+
+    def _spawn(self, worker):
+        worker.jobs = self._context.Queue()
+        worker.ready = False
+        worker.started_at = time.monotonic()
+        worker.process = self._context.Process(
+            target=_worker_main,
+            args=(worker.worker_id, worker.cores, worker.threads, worker.jobs, self._results),
+            name=f"model-worker-{worker.worker_id}",
+            daemon=True
+        )
+        worker.process.start()
+        if self._prefixes:
+            worker.jobs.put(("warm", None, self._prefixes, None))
+
+    def start(self):
+        for worker in self._workers:
+            self._spawn(worker)
+        threading.Thread(target=self._dispatch_results, name="worker-results", daemon=True).start()
+        threading.Thread(target=self._monitor, name="worker-monitor", daemon=True).start()
+        return self
+
+    def wait_ready(self, timeout=None):
+        """等待所有工作进程加载完模型"""
+        return self._ready_event.wait(timeout)
+
+    def _dispatch_results(self):
+        # 把工作进程返回的消息转发给对应的流
+        while not self._closed:
+            try:
+                kind, worker_id, job_id, payload = self._results.get(timeout=1)
+            except queue.Empty:
+                continue
+            with self._lock:
+                worker = self._workers[worker_id]
+                if kind == "ready":
+                    worker.ready = True
+                    if all(w.ready for w in self._workers):
+                        self._ready_event.set()
+                    continue
+                stream = self._streams.get(job_id)
+                if stream is None:
+                    continue
+                if kind in ("done", "error"):
+                    self._streams.pop(job_id, None)
+                    worker.in_flight.discard(job_id)
+            stream._push(kind, payload)
+
+    def _monitor(self):
+        # 检测崩溃的工作进程并重启，尚未输出内容的任务重新分发给其他进程
+        while not self._closed:
+            time.sleep(1)
+            for worker in self._workers:
+                if self._closed or worker.process.is_alive():
+                    continue
+                if time.monotonic() - worker.started_at < WORKER_RESTART_DELAY:
+                    continue
+                print(f"工作进程 {worker.worker_id} 异常退出（退出码 {worker.process.exitcode}），正在重启")
+                with self._lock:
+                    orphaned = [(job_id, self._streams.pop(job_id)) for job_id in worker.in_flight
+                                if job_id in self._streams]
+                    worker.in_flight.clear()
+                    self.stats["restarts"] += 1
+                    self._spawn(worker)
+                for job_id, stream in orphaned:
+                    if stream.started:
+                        stream._push("error", "工作进程异常退出，请重试")
+                    else:
+                        self.stats["resubmitted"] += 1
+                        self._submit(stream)
+
+    def _pick_worker(self):
+        # 负载最小：优先选择已就绪的存活进程中正在处理任务最少的一个
+        alive = [w for w in self._workers if w.process.is_alive()] or self._workers
+        candidates = [w for w in alive if w.ready] or alive
+        return min(candidates, key=lambda w: len(w.in_flight))
+
+    def _submit(self, stream, worker=None):
+        job_id = next(self._job_ids)
+        with self._lock:
+            if worker is None or not worker.process.is_alive():
+                worker = self._pick_worker()
+            stream.job_id = job_id
+            worker.in_flight.add(job_id)
+            self._streams[job_id] = stream
+            self.stats["dispatched"][worker.worker_id] += 1
+            worker.jobs.put(("generate", job_id, stream.prompt, stream.params))
+
+    def stream(self, prompt, cancel=None, **params):
+        """提交一个流式生成任务，返回 RemoteStream；cancel 被取消时通知工作进程停止解码"""
+        stream = RemoteStream(prompt, params)
+        self._submit(stream)
+        if cancel is not None:
+            cancel.on_cancel(lambda: self._cancel(stream))
+        return stream
+
+    def stream_many(self, prompt, n, cancel=None, **params):
+        """同一prompt的 n 个流式任务作为一组发给同一个工作进程，在同一批次中共用一次预填充"""
+        streams = [RemoteStream(prompt, params) for _ in range(n)]
+        with self._lock:
+            worker = self._pick_worker()
+            job_ids = [next(self._job_ids) for _ in streams]
+            for job_id, stream in zip(job_ids, streams):
+                stream.job_id = job_id
+                worker.in_flight.add(job_id)
+                self._streams[job_id] = stream
+            self.stats["dispatched"][worker.worker_id] += n
+            worker.jobs.put(("generate_many", job_ids, prompt, params))
+        if cancel is not None:
+            # 一组任务在工作进程中共用取消标记，已结束的任务会被忽略
+            for stream in streams:
+                cancel.on_cancel(lambda stream=stream: self._cancel(stream))
+        return streams
+
+    def _cancel(self, stream):
+        with self._lock:
+            for worker in self._workers:
+                if stream.job_id in worker.in_flight:
+                    worker.jobs.put(("cancel", stream.job_id, None, None))
+                    break
+
+    def warm_prefixes(self, prefixes):
+        """让所有工作进程预热前缀KV缓存（重启的进程也会自动预热）"""
+        self._prefixes = list(prefixes)
+        for worker in self._workers:
+            worker.jobs.put(("warm", None, self._prefixes, None))
+
+    def in_flight(self):
+        return [len(w.in_flight) for w in self._workers]
+
+    def shutdown(self, timeout=10):
+        self._closed = True
+        for worker in self._workers:
+            worker.jobs.put(None)
+        for worker in self._workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+
+def start_worker_pool(num_workers=WORKER_PROCESSES, timeout=WORKER_READY_TIMEOUT):
+    """启动工作池并等待所有进程就绪（作为模型管理器的加载函数使用）
+
+    工作进程在 timeout 秒内没有全部就绪（如加载模型时内存不足、模型路径错误而反复退出）时
+    关闭工作池并返回 None。
+    """
+    pool = WorkerPool(num_workers).start()
+    if not pool.wait_ready(timeout):
+        print(f"多进程工作池在 {timeout:.0f} 秒内未就绪（重启 {pool.stats['restarts']} 次），正在关闭")
+        pool.shutdown()
+        return None
+    print(f"多进程工作池就绪，共 {num_workers} 个工作进程")
+    return pool